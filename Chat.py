@@ -1,8 +1,20 @@
 """Chat.py"""
-
-from experta import *
+import os
+from collections import deque, namedtuple
 
 from Chat_bot.Reasoner import ChatEngine
+from Chat_bot.jobs import get_job_queue
+from Chat_bot.knowledge import Knowledge
+
+# Number of messages kept in a chat's log, older messages are dropped
+CHAT_LOG_SIZE = int(os.environ.get("CHAT_BOT_CHAT_LOG_SIZE", 100))
+
+# A message of the chat log. time is a POSIX timestamp
+ChatLogEntry = namedtuple("ChatLogEntry", ["author", "message_text", "time"])
+
+# Seconds a POPMSG request waits for a background fare lookup before
+# answering {WAIT}, which tells the frontend to poll again
+TICKET_POLL_SECONDS = 2
 
 
 def convert_tags_to_nlp_text(message):
@@ -22,20 +34,43 @@ def convert_tags_to_nlp_text(message):
 
 class Chat:
     def __init__(self):
-        self.chat_log = []
+        self.chat_log = deque(maxlen=CHAT_LOG_SIZE)
+        self.chat_engine = ChatEngine()
+
+    def __getstate__(self):
+        """
+        Only the conversation state is pickled. The engine is rebuilt from its
+        knowledge when the Chat is loaded as its first turn starts from a
+        reset.
+        """
+        return {
+            "chat_log": self.chat_log,
+            "knowledge": self.chat_engine.knowledge,
+            "progress": self.chat_engine.progress,
+            "message": self.chat_engine.message,
+            "tags": self.chat_engine.tags,
+            "ticket_job": self.chat_engine.ticket_job,
+            "chat_id": self.chat_engine.chat_id
+        }
+
+    def __setstate__(self, state):
+        self.chat_log = deque(state["chat_log"], maxlen=CHAT_LOG_SIZE)
         self.chat_engine = ChatEngine()
+        self.chat_engine.knowledge = Knowledge(state["knowledge"])
+        self.chat_engine.progress = state["progress"]
+        self.chat_engine.message = state["message"]
+        self.chat_engine.tags = state["tags"]
+        self.chat_engine.ticket_job = state["ticket_job"]
+        self.chat_engine.chat_id = state.get("chat_id",
+                                             self.chat_engine.chat_id)
 
     def add_message(self, author, message_text, timestamp):
-        self.chat_log.append({
-            "author": author,
-            "message_text": message_text,
-            "time": timestamp
-        })
+        self.chat_log.append(ChatLogEntry(author, message_text,
+                                          timestamp.timestamp()))
 
         if author != "bot":
             message_text = convert_tags_to_nlp_text(message_text.strip())
-            self.chat_engine.reset()
-            self.chat_engine.declare(Fact(message_text=message_text))
+            self.chat_engine.start_turn(message_text)
             self.chat_engine.run()
             message_dict = self.chat_engine.message.pop(0)
             tags = self.chat_engine.tags
@@ -44,8 +79,30 @@ class Chat:
                     message_dict['suggestions'],
                     message_dict['response_req']]
 
-    def pop_message(self):
-        if len(self.chat_engine.message) > 0:
+    def pending_ticket(self):
+        """
+        Returns the Future of the fare lookup the next popped message waits
+        for, or None if it doesn't wait for one
+        """
+        if (len(self.chat_engine.message) == 0 and
+                self.chat_engine.ticket_job is not None):
+            return get_job_queue().get(self.chat_engine.ticket_job)
+        return None
+
+    def pop_message(self, timeout=TICKET_POLL_SECONDS):
+        """
+        Returns the next queued bot message. If it's the result of a fare
+        lookup, waits up to timeout seconds for it before answering {WAIT}.
+        """
+        if (len(self.chat_engine.message) == 0 and
+                self.chat_engine.ticket_job is not None and
+                not self.chat_engine.collect_ticket(timeout)):
+            message_dict = {
+                'message': "{WAIT}",
+                'suggestions': [],
+                'response_req': False
+            }
+        elif len(self.chat_engine.message) > 0:
             message_dict = self.chat_engine.message.pop(0)
         else:
             message_dict = {
@@ -2,21 +2,116 @@
 AKOBot.py
 """
 
-import spacy
+import resource
+import threading
+import time
 
-from Database.DatabaseConnector import DBConnection
+from Chat_bot.metrics import NLP_SECONDS
+from Chat_bot.stations import get_station_names
+
+SPACY_MODEL = "en_core_web_sm"
+
+_pipelines = {}
+_pipeline_stats = {}
+_pipelines_lock = threading.Lock()
+
+
+def _rss_bytes():
+    """Returns the resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # No procfs - fall back to the peak RSS (reported in KiB)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_pipeline(model_name=SPACY_MODEL):
+    """
+    Returns the spaCy pipeline for model_name, loading it the first time it's
+    requested. Every NLPEngine in the process shares the same pipeline.
+
+    Parameters
+    ----------
+    model_name: str
+        The name of the spaCy model to load
+
+    Returns
+    -------
+    spacy.language.Language
+        The loaded pipeline
+    """
+    with _pipelines_lock:
+        if model_name not in _pipelines:
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            # spaCy is imported with the first pipeline, so the stats of
+            # the first model include the import
+            import spacy
+
+            _pipelines[model_name] = spacy.load(model_name)
+            _pipeline_stats[model_name] = {
+                "load_seconds": time.perf_counter() - start,
+                "rss_bytes": max(_rss_bytes() - rss_before, 0),
+                "engines": 0
+            }
+        return _pipelines[model_name]
+
+
+def warm_up(model_name=SPACY_MODEL):
+    """Loads the spaCy pipeline ahead of the first chat"""
+    get_pipeline(model_name)
+
+
+def pipeline_memory_report():
+    """
+    Reports the memory used by each loaded pipeline and the memory saved by
+    sharing it between the NLPEngines created so far
+
+    Returns
+    -------
+    dict
+        Per model: load time, RSS added by loading the model, number of
+        engines sharing it and the RSS that would have been used by loading
+        the model once per engine
+    """
+    with _pipelines_lock:
+        report = {}
+        for model_name, stats in _pipeline_stats.items():
+            report[model_name] = dict(stats)
+            report[model_name]["rss_saved_bytes"] = (
+                stats["rss_bytes"] * max(stats["engines"] - 1, 0)
+            )
+        report["process_rss_bytes"] = _rss_bytes()
+        return report
 
 
 class NLPEngine:
-    def __init__(self):
+    def __init__(self, model_name=SPACY_MODEL):
         """
         A basic NLP Engine that takes can process input text
         """
-        self.nlp = spacy.load("en_core_web_sm")
+        self.nlp = get_pipeline(model_name)
+        with _pipelines_lock:
+            _pipeline_stats[model_name]["engines"] += 1
+        # Docs parsed during the current turn, keyed by text
+        self._docs = {}
+        # Number of times SpaCy has been run during the current turn
+        self.calls = 0
+
+    def begin_turn(self):
+        """Forgets the Docs parsed during the previous turn"""
+        self._docs = {}
+        self.calls = 0
+
+    def end_turn(self):
+        """Forgets the Docs parsed during this turn but keeps the call count"""
+        self._docs = {}
 
     def process(self, input_text):
         """
-        Takes in user input and uses SpaCy to process it
+        Takes in user input and uses SpaCy to process it. Text that has
+        already been processed during this turn returns the same Doc.
 
         Parameters
         ----------
@@ -29,18 +124,22 @@ class NLPEngine:
         list
             A list of tokens
         """
-        return self.nlp(input_text)
+        doc = self._docs.get(input_text)
+        if doc is None:
+            with NLP_SECONDS.time():
+                doc = self.nlp(input_text)
+            self.calls += 1
+            self._docs[input_text] = doc
+        return doc
 
 
 def get_all_stations():
-    query = "SELECT * FROM main.Stations"
-    db_connection = DBConnection('Chat_bot.db')
-    result = db_connection.send_query(query).fetchall()
-    if result:
-        stations = []
-        for res in result:
-            stations.append(res[0].lower())
-            stations.append(res[1].lower())
+    """
+    Returns the lower case code and name of every station. The stations are
+    only loaded from the database once - see stations.reload_stations
+    """
+    stations = get_station_names()
+    if stations:
         return stations
     else:
         return "error_error_error"
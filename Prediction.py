@@ -7,7 +7,11 @@ from sklearn import neighbors
 from sklearn.model_selection import train_test_split
 from sklearn.neural_network import MLPRegressor
 from datetime import datetime
-from Database.DatabaseConnector import DBConnection
+from Chat_bot.db_migrations import get_od_pair
+from Chat_bot.db_pool import get_db_pool
+from Chat_bot.journey_store import get_journey_store
+from Chat_bot.delay_features import (build_features, one_hot_day_segment,
+                                     rows_to_columns)
 from difflib import SequenceMatcher
 
 
@@ -17,7 +21,6 @@ class Predictions:
         self.arrival_station = ""
         self.time_departure = ""
         self.day_of_week = datetime.today().weekday()  # 0 = Mon and 6 = Sun
-        self.db_connection = DBConnection('Chat_bot.db')
         self.journeys = {}
         self.stations = {
             "norwich": "NRCH",
@@ -78,8 +81,14 @@ class Predictions:
     def harvest_data(self):
         """
         Pulls all journeys from DB that have FROM and TO station and don't have
-        null values as arrival/departure times
+        null values as arrival/departure times. If the CSV data has been
+        ingested into a journey store the journeys are read from there instead
         """
+        journey_store = get_journey_store()
+        if journey_store is not None:
+            return journey_store.get_pair_rows(self.departure_station,
+                                               self.arrival_station)
+
         # main.March2019Data - contains 2019 March Data
         # main.TrainingData - contains all CSV data
         # main.TransformedTraining - Contains data with no NULLS
@@ -87,14 +96,28 @@ class Predictions:
         query = """
             SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
                 (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at 
-                 FROM main.Data WHERE tpl = '{0}') AS x JOIN
+                 FROM main.Data WHERE tpl = ?) AS x JOIN
                 (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data 
-                 WHERE tpl = '{1}') AS y on x.rid_FROM = y.rid_TO 
-                ORDER BY rid_FROM """.format(self.departure_station,
-                                             self.arrival_station)
+                 WHERE tpl = ?) AS y on x.rid_FROM = y.rid_TO 
+                ORDER BY rid_FROM """
 
-        result = self.db_connection.send_query(query).fetchall()
-        return result
+        return get_db_pool().query(query, (self.departure_station,
+                                           self.arrival_station))
+
+    def harvest_columns(self):
+        """
+        Returns the journeys between the FROM and TO stations as columns of
+        seconds since midnight (-1 when missing), read from the journey store
+        if one has been ingested, or else from OD_Journeys if it's been built
+        """
+        journey_store = get_journey_store()
+        if journey_store is not None:
+            return journey_store.get_pair(self.departure_station,
+                                          self.arrival_station)
+        columns = get_od_pair(self.departure_station, self.arrival_station)
+        if columns is not None:
+            return columns
+        return rows_to_columns(self.harvest_data())
 
     @staticmethod
     def convert_time(time):
@@ -297,65 +320,20 @@ class Predictions:
         """
             Predicting when the train will arrive at the TO station
         """
-
-        x = []
-        y = []
-        result = self.harvest_data()
-        for journey in range(len(result)):
-            j = []
-            k = []
-
-            # public_departure | actual_departure |
-            # public_arrival | actual_arrival
-            if result[journey][2] != '' and result[journey][3] != '' and \
-                    result[journey][5] != '' and result[journey][6] != '':
-                # Get date based on RID
-                date = str(result[journey][0])
-                # Convert date to day of the week
-                day_of_week = datetime(int(date[:4]), int(date[4:6]),
-                                       int(date[6:8])).weekday()
-                hour_of_day = int(result[journey][3].split(":")[0])
-                minute_of_day = int(result[journey][3].split(":")[1])
-
-                # Get day of week based on RID - Monday = 0, Sunday = 6
-                weekday = self.is_weekday(day_of_week)
-
-                # Checking morning/midday/evening/night
-                day_segment = self.check_day_segment(hour_of_day)
-
-                # Checking rush hour or not
-                rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
-
-                # Add day of week, weekday/end, actual departurein seconds,
-                # morning/evening, rush/norush hour to X
-                try:
-                    j.append(day_of_week)
-                    j.extend(weekday)
-                    j.append(
-                        (datetime.strptime(result[journey][3], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds()
-                    )
-                    j.extend(day_segment)
-                    j.extend(rush_hour)
-
-                    x.append(j)
-                except:
-                    print("Unable to convert DEPARTURE to seconds")
-                # Add day of week, weekday/end, actual arrival in seconds,
-                # morning/evening, rush/no rush hour to Y
-                try:
-                    k.append(day_of_week)
-                    k.extend(weekday)
-                    k.append(
-                        (datetime.strptime(result[journey][6], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds()
-                    )
-                    k.extend(day_segment)
-                    k.extend(rush_hour)
-
-                    y.append(k)
-                except:
-                    print("Unable to convert ARRIVAL to seconds")
+        features = build_features(self.harvest_columns())
+        weekday = 1 - features["weekend"]
+        day_segment = one_hot_day_segment(features["day_segment"])
+
+        # Day of week, weekday/end, actual departure in seconds,
+        # morning/evening, rush/no rush hour
+        x = np.column_stack([features["day_of_week"], weekday,
+                             features["time_dep"], day_segment,
+                             features["rush_hour"]])
+        # Day of week, weekday/end, actual arrival in seconds,
+        # morning/evening, rush/no rush hour
+        y = np.column_stack([features["day_of_week"], weekday,
+                             features["arrival_at"], day_segment,
+                             features["rush_hour"]])
 
         arrival = self.mlp(x, y)
         arrival_time = self.convert_time([arrival])
@@ -366,63 +344,18 @@ class Predictions:
         """
             Predicting how long the train will be delayed
         """
-        x = []
-        y = []
-        result = self.harvest_data()
-
-        for journey in range(len(result)):
-            j = []
-            k = []
-            #       public_departure | actual_departure |
-            if (result[journey][2] != '' and result[journey][3] != '' and
-                    #   public_arrival | actual_arrival
-                    result[journey][5] != '' and result[journey][6] != ''):
-                # Get date based on RID
-                date = str(result[journey][0])
-                # Convert date to day of the week
-                day_of_week = datetime(int(date[:4]), int(date[4:6]),
-                                       int(date[6:8])).weekday()
-                hour_of_day = int(result[journey][3].split(":")[0])
-                minute_of_day = int(result[journey][3].split(":")[1])
-
-                # Get day of week based on RID - Monday = 0, Sunday = 6
-                weekday = self.is_weekday(day_of_week)
-
-                # Checking morning/midday/evening/night
-                day_segment = self.check_day_segment(hour_of_day)
-
-                # Checking rush hour or not
-                rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
-
-                try:
-                    j.append(day_of_week)
-                    j.extend(weekday)
-                    j.append(
-                        (datetime.strptime(result[journey][3], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds() -
-                        (datetime.strptime(result[journey][2], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds())
-                    j.extend(day_segment)
-                    j.extend(rush_hour)
-
-                    x.append(j)
-                except:
-                    print("Unable to convert DEPARTURE to seconds")
-                # Add (actual arrival - expected arrival) in seconds to Y
-                try:
-                    k.append(day_of_week)
-                    k.extend(weekday)
-                    k.append(
-                        (datetime.strptime(result[journey][6], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds() -
-                        (datetime.strptime(result[journey][5], '%H:%M') -
-                         datetime(1900, 1, 1)).total_seconds())
-                    k.extend(day_segment)
-                    k.extend(rush_hour)
-
-                    y.append(k)
-                except:
-                    print("Unable to convert ARRIVAL to seconds")
+        features = build_features(self.harvest_columns())
+        weekday = 1 - features["weekend"]
+        day_segment = one_hot_day_segment(features["day_segment"])
+
+        # (actual departure - public departure) in seconds to X
+        x = np.column_stack([features["day_of_week"], weekday,
+                             features["delay"], day_segment,
+                             features["rush_hour"]])
+        # (actual arrival - public arrival) in seconds to Y
+        y = np.column_stack([features["day_of_week"], weekday,
+                             features["arrival_time"], day_segment,
+                             features["rush_hour"]])
 
         prediction_s = self.knn(x, y)
         delayed_time = self.convert_time(prediction_s)
@@ -3,22 +3,40 @@ Reasoner.py
 
 Contains classes related to reasoning engine
 """
-from datetime import datetime
-from difflib import SequenceMatcher
+import bisect
+import os
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-from dateparser.date import DateDataParser
-from dateutil.parser import parse, ParserError
 from experta import *
-from spacy.matcher import Matcher
+from experta.activation import Activation
+from experta.agenda import Agenda
 
-from Database.DatabaseConnector import DBConnection
-from DelayPrediction.newPrediction import Predictions
 from Chat_bot import (StationNoMatchError,
                     StationNotFoundError,
                     UnknownPriorityException,
-                    UnknownStationTypeException,
-                    scraper_1)
+                    UnknownStationTypeException)
 from Chat_bot.Chat_bot import NLPEngine, get_all_stations
+from Chat_bot.dates import get_date_from_text
+from Chat_bot.fare_fetcher import (DEFAULT_OPERATOR, OPERATOR_NAMES,
+                                   get_fare_backend)
+from Chat_bot.jobs import get_job_queue
+from Chat_bot.knowledge import Knowledge
+from Chat_bot.metrics import ERRORS, PREDICTION_SECONDS, SCRAPE_SECONDS
+from Chat_bot.rule_profiler import create_rule_profiler, profiled_run
+from Chat_bot.stations import get_station_index, on_stations_reload
+
+# Keep the working memory between turns instead of resetting the engine
+INCREMENTAL_TURNS = os.environ.get("CHAT_BOT_INCREMENTAL_TURNS",
+                                   "true") == "true"
+
+# Facts that only last for one turn and are never kept in the knowledge
+TURN_FACTS = ["message_text", "extra_info_req", "extra_info_requested"]
+
+# Shared by the station patterns below so they can be updated in place. The
+# stations are filled in by get_matcher, so importing this module doesn't
+# query the database
+StationToken = {"LOWER": {"IN": []}}
 
 TokenDictionary = {
     "book": [{"LEMMA": {"IN": ["book", "booking", "purchase", "buy"]}}],
@@ -37,13 +55,13 @@ MultiTokenDictionary = {
         [{"POS": "ADP", "LEMMA": {"IN": ["depart", "from", "departing"]}},
          {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}],
         [{"LEMMA": {"IN": ["depart", "from", "departing"]}},
-         {"LOWER": {"IN": get_all_stations()}}]
+         StationToken]
     ],
     "arrive": [
         [{"POS": "ADP", "LEMMA": {"IN": ["arrive", "to", "arriving"]}},
          {"POS": "PROPN", "OP": "*"}, {"POS": "PROPN", "DEP": "pobj"}],
         [{"LEMMA": {"IN": ["arrive", "to", "arriving"]}},
-         {"LOWER": {"IN": get_all_stations()}}]
+         StationToken]
     ],
     "dep_date": [
         [{"LEMMA": {"IN": ["depart", "departing", "leave", "leaving"]}},
@@ -116,53 +134,185 @@ MultiTokenDictionary = {
     ]
 }
 
+_matchers = {}
 
-def get_similarity(comparator_a, comparator_b):
+
+def get_matcher(vocab):
+    """
+    Returns a Matcher holding every pattern in TokenDictionary and
+    MultiTokenDictionary, compiled once per vocab.
+
+    TokenDictionary patterns are added under their intent. Each
+    MultiTokenDictionary pattern is added under "<intent>#<priority>" so
+    match_intents can still prefer the first pattern of an intent that
+    matches, as SpaCy doesn't report which pattern of a key matched.
+    """
+    matcher = _matchers.get(id(vocab))
+    if matcher is None:
+        from spacy.matcher import Matcher
+
+        if not _matchers:
+            StationToken["LOWER"]["IN"] = get_all_stations()
+        matcher = Matcher(vocab)
+        for intent, pattern in TokenDictionary.items():
+            matcher.add(intent, None, pattern)
+        for intent, patterns in MultiTokenDictionary.items():
+            for priority, pattern in enumerate(patterns):
+                matcher.add("{}#{}".format(intent, priority), None, pattern)
+        _matchers[id(vocab)] = matcher
+    return matcher
+
+
+def refresh_station_patterns():
+    """
+    Drops the compiled Matchers, so they're compiled again with the reloaded
+    stations the next time they're used.
+    """
+    _matchers.clear()
+
+
+on_stations_reload(refresh_station_patterns)
+
+
+def match_intents(doc):
     """
+    Matches doc against every intent in a single pass
 
     Parameters
     ----------
-    comparator_a: tuple
-        The tuple from the database when searching for identifier, name
-        from main.Stations table
-    comparator_b: str
-        The departure point input by the user
+    doc: spacy.Doc
+        The Doc to match
+
     Returns
     -------
-    float
-        The SequenceMatcher produced ration between the station name from
-        the database and the departure point passed in by the user
+    dict
+        The first Span matched for each intent. For MultiTokenDictionary
+        intents this is the first match of the highest priority pattern that
+        matched
     """
-    comparator_a = comparator_a[1].replace("(" + comparator_b + ")", "")
-    ratio = SequenceMatcher(None, comparator_a.lower(),
-                            comparator_b.lower()).ratio() * 100
-    if comparator_b.lower() in comparator_a.lower():
-        ratio += 25
-    if comparator_b.lower().startswith(comparator_a.lower()):
-        ratio += 25
-    return ratio
+    found = {}
+    for match_id, start, end in get_matcher(doc.vocab)(doc):
+        intent, _, priority = doc.vocab.strings[match_id].partition("#")
+        priority = int(priority or 0)
+        if intent not in found or priority < found[intent][0]:
+            found[intent] = (priority, doc[start:end])
+    return {intent: span for intent, (_, span) in found.items()}
 
 
 class ChatEngine(KnowledgeEngine):
-    def __init__(self):
+    # User Interface output when no rule has anything to say. Shared by every
+    # engine so it must not be modified
+    def_message = {"message": "I'm sorry. I couldn't help "
+                              "with that. Please try again",
+                   "suggestions": [],
+                   "response_req": True}
+
+    def __init__(self, incremental=INCREMENTAL_TURNS, profiler=None):
         super().__init__()
+        self.incremental = incremental
+        # RuleProfiler recording the rules fired each turn, if profiling
+        self.profiler = profiler or create_rule_profiler()
+        # Identifies the chat's turns in the profile, kept across reloads
+        self.chat_id = uuid.uuid4().hex
 
         # Internal connections to Chat_bot classes
-        self.db_connection = DBConnection('Chat_bot.db')
         self.nlp_engine = NLPEngine()
+        # Matches found in the Docs parsed during this turn, keyed by text
+        self._doc_matches = {}
 
-        # Knowledge dict
-        self.knowledge = {}
+        self.knowledge = Knowledge()
         self.progress = ""
 
         # User Interface output
-        self.def_message = {"message": "I'm sorry. I couldn't help "
-                                       "with that. Please try again",
-                            "suggestions": [],
-                            "response_req": True}
         self.message = []
         self.tags = ""
 
+        # ID of the background fare lookup, if one is running
+        self.ticket_job = None
+
+    def run(self, steps=float('inf')):
+        """
+        Overrides super class' method run so every turn starts with an empty
+        Doc cache, which is emptied again once the turn is over
+        """
+        self.nlp_engine.begin_turn()
+        self._doc_matches = {}
+        if self.profiler is None:
+            super().run(steps)
+        else:
+            profiled_run(self, self.profiler, steps, self.chat_id)
+        # Don't keep the Docs alive while the session is idle
+        self.nlp_engine.end_turn()
+        self._doc_matches = {}
+
+    def start_turn(self, message_text):
+        """
+        Prepares the engine to answer message_text. The first turn resets the
+        engine. Later turns of an incremental engine keep the working memory
+        and only change the facts that differ from what a reset would
+        declare, which leaves the engine in the same state.
+        """
+        if not self.incremental or not self.facts:
+            self.reset()
+            self.declare(Fact(message_text=message_text))
+            return
+
+        if len(self.message) == 0:
+            self.message = [self.def_message]
+        self._sync_facts()
+        self.declare(Fact(message_text=message_text))
+        self._rebuild_agenda()
+
+    def _sync_facts(self):
+        """
+        Retracts the facts that _initial_action wouldn't declare (turn facts
+        and values since replaced in the knowledge) and declares the missing
+        ones
+        """
+        wanted = dict(self.knowledge)
+        wanted.setdefault("action", "chat")
+        wanted.setdefault("complete", False)
+        wanted["extra_info_req"] = False
+
+        kept = set()
+        for idx, fact in list(self.facts.items()):
+            if isinstance(fact, InitialFact):
+                continue
+            items = [(k, v) for k, v in fact.items() if not fact.is_special(k)]
+            if len(items) == 1:
+                key, value = items[0]
+                if key in wanted and key not in kept and wanted[key] == value:
+                    kept.add(key)
+                    continue
+            self.retract(idx)
+
+        # Declared without going through self.declare so the knowledge is
+        # left as _initial_action would leave it
+        for key, value in wanted.items():
+            if key not in kept:
+                super().declare(Fact(**{key: value}))
+
+    def _rebuild_agenda(self):
+        """
+        Activates every rule matching the working memory again, including
+        those that already fired during an earlier turn, as a reset would
+        """
+        self.agenda = Agenda()
+        for node in self.matcher._get_conflict_set_nodes():
+            for info in node.memory:
+                activation = Activation(
+                    node.rule, info.data,
+                    {k: v for k, v in info.context if isinstance(k, str)})
+                activation.key = self.strategy.get_key(activation)
+                bisect.insort(self.agenda.activations, activation)
+
+    def get_doc(self, text):
+        """
+        Returns the SpaCy Doc for text, reusing the Doc if the text has
+        already been parsed during this turn
+        """
+        return self.nlp_engine.process(text)
+
     def declare(self, *facts):
         """
         Overrides super class' method declare to add the facts to the knowledge
@@ -171,28 +321,40 @@ class ChatEngine(KnowledgeEngine):
         new_fact = super().declare(*facts)
         if new_fact:
             for g, val in new_fact.items():
-                if g not in ["__factid__", "message_text", "extra_info_req",
-                             "extra_info_requested"]:
+                if g != "__factid__" and g not in TURN_FACTS:
                     self.knowledge[g] = val
         return new_fact
 
-    def get_matches(self, doc, pattern):
-        matcher = Matcher(self.nlp_engine.nlp.vocab)
-        matcher.add("pattern", None, pattern)
-        matches = matcher(doc)
-        if len(matches) > 0:
-            for match_id, start, end in matches:
-                return doc[start:end]
-        return None
-
-    def get_matches_from_multiple(self, doc, pattern_arr):
-        matches = None
-        for pattern in pattern_arr:
-            matches = self.get_matches(doc, pattern)
-            if matches:
-                break
+    def get_all_matches(self, doc):
+        """
+        Runs the shared Matcher over doc once and returns the match for every
+        intent in TokenDictionary and MultiTokenDictionary. The result is
+        reused for the rest of the turn.
+
+        Parameters
+        ----------
+        doc: spacy.Doc
+            The Doc to match
+
+        Returns
+        -------
+        dict
+            The matched Span for each intent that matched
+        """
+        matches = self._doc_matches.get(doc.text)
+        if matches is None:
+            matches = match_intents(doc)
+            self._doc_matches[doc.text] = matches
         return matches
 
+    def get_matches(self, doc, intent):
+        """
+        Returns the Span matched for intent in doc, or None if there's no
+        match. For MultiTokenDictionary intents this is the match of the first
+        pattern that matched.
+        """
+        return self.get_all_matches(doc).get(intent)
+
     def add_to_message_chain(self, message, priority=1, req_response=True,
                              suggestions=None):
         """
@@ -231,63 +393,10 @@ class ChatEngine(KnowledgeEngine):
             raise UnknownPriorityException(priority)
 
     def find_station(self, search_station):
-        query = ("SELECT identifier, name FROM main.Stations WHERE identifier=?"
-                 " COLLATE NOCASE")
-        result = self.db_connection.send_query(query,
-                                               (search_station,)).fetchall()
-
-        if result:
-            return result[0]
-        else:
-            # Station code not input - try searching by station name
-            query = ("SELECT identifier, name FROM main.Stations WHERE name=? "
-                     "COLLATE NOCASE")
-            result = self.db_connection.send_query(query,
-                                                   (search_station,)
-                                                   ).fetchall()
-            if result and len(result) == 1:
-                return result[0]
-            else:
-                # Try finding stations with names close to input name
-                query = "SELECT * FROM main.Stations"
-                result = self.db_connection.send_query(query).fetchall()
-                if result:
-                    result.sort(key=lambda station: get_similarity(
-                        station, search_station), reverse=True)
-                    if len(result) <= 3:
-                        raise StationNoMatchError(result)
-                    else:
-                        raise StationNoMatchError(result[0:3])
-                else:
-                    msg = "Unable to find station {}"
-                    raise StationNotFoundError(msg.format(search_station))
+        return get_station_index().find(search_station)
 
     def get_date_from_text(self, date_text, st_type="DEP"):
-        date_text = date_text.replace(" am", "am")
-        date_text = date_text.replace(" AM", "am")
-        date_text = date_text.replace(" pm", "pm")
-        date_text = date_text.replace(" PM", "pm")
-        date_text = date_text.replace(" o'clock", ":00")
-        date_text = date_text.replace(" oclock", ":00")
-        date_text = date_text.replace("o'clock", ":00")
-        date_text = date_text.replace("oclock", ":00")
-        try:
-            parse(date_text, fuzzy=True)
-        except ParserError:
-            return None
-        else:
-            ddp = DateDataParser(languages=['en'],
-                                 settings={'DATE_ORDER': 'DMY'})
-            date_time = ddp.get_date_data(date_text).date_obj
-            date_time_now = datetime.now()
-            if date_time and date_time <= date_time_now and st_type != "DLY":
-                return 2
-            if (("departure_date" in self.knowledge and
-                    date_time <= self.knowledge['departure_date']) or
-                    ("return_date" in self.knowledge and
-                     date_time >= self.knowledge['return_date'])):
-                return 1
-            return date_time
+        return get_date_from_text(date_text, self.knowledge, st_type)
 
     def get_dep_arr_station(self, doc, message_text, tags, st_type,
                             extra_info_appropriate=True, station_name = 0):
@@ -344,8 +453,7 @@ class ChatEngine(KnowledgeEngine):
             raise UnknownStationTypeException(st_type)
 
         search_station = None
-        matches = self.get_matches_from_multiple(doc,
-                                                 MultiTokenDictionary[token])
+        matches = self.get_matches(doc, token)
 
         if matches is not None:
             search_station = str(matches[1:])
@@ -388,15 +496,15 @@ class ChatEngine(KnowledgeEngine):
 
     def get_if_return(self, doc, message_text, tags, extra_info_appropriate):
         if "{TAG:RET}" in message_text:
-            ret = self.get_matches(doc, TokenDictionary['yes'])
+            ret = self.get_matches(doc, 'yes')
             if ret is None:
-                ret = self.get_matches(doc, TokenDictionary['return'])
-            sgl = self.get_matches(doc, TokenDictionary['no'])
+                ret = self.get_matches(doc, 'return')
+            sgl = self.get_matches(doc, 'no')
             if sgl is None:
-                sgl = self.get_matches(doc, TokenDictionary['single'])
+                sgl = self.get_matches(doc, 'single')
         else:
-            ret = self.get_matches(doc, TokenDictionary['return'])
-            sgl = self.get_matches(doc, TokenDictionary['single'])
+            ret = self.get_matches(doc, 'return')
+            sgl = self.get_matches(doc, 'single')
         if ret is not None and sgl is None:
             tags += "{RET:RETURN}"
             self.declare(Fact(returning=True))
@@ -433,11 +541,9 @@ class ChatEngine(KnowledgeEngine):
                 not message_text[message_text.find("PM") - 1].isspace()):
             message_text = message_text.replace("PM", " pm")
 
-        doc = self.nlp_engine.process(message_text)
+        doc = self.get_doc(message_text)
 
-        dte = self.get_matches_from_multiple(
-            doc, MultiTokenDictionary[st_type.lower() + '_date']
-        )
+        dte = self.get_matches(doc, st_type.lower() + '_date')
 
         if dte:
             date_time = self.get_date_from_text(str(dte[2:]), st_type)
@@ -513,12 +619,9 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        doc = self.get_doc(message_text)
 
-        matcher = Matcher(self.nlp_engine.nlp.vocab)
-        matcher.add("BOOKING_PATTERN", None, TokenDictionary['book'])
-        matches = matcher(doc)
-        if len(matches) > 0:
+        if self.get_matches(doc, 'book') is not None:
             # likely to be a booking
             self.add_to_message_chain("Awesome, let's start your booking "
                                       " I'll display all the details on the"
@@ -526,19 +629,16 @@ class ChatEngine(KnowledgeEngine):
                                       req_response=False)
             self.progress = "dl_dt_al_rt_rs_na_nc_"
             self.modify(f1, action="book")
-        else:
-            matcher.add("DELAY_PATTERN", None, TokenDictionary['delay'])
-            matches = matcher(doc)
-            if len(matches) > 0:
-                # likely to be a delay prediction
-                self.add_to_message_chain("As per latest train data I can "
-                                          "predict how long you'll be delayed."
-                                          "<br><i>Only available from Norwich "
-                                          "to London Liverpool Street and "
-                                          "intermediate stations.</i>",
-                                          req_response=False)
-                self.progress = "dl_al_dt_dd_"
-                self.modify(f1, action="delay")
+        elif self.get_matches(doc, 'delay') is not None:
+            # likely to be a delay prediction
+            self.add_to_message_chain("As per latest train data I can "
+                                      "predict how long you'll be delayed."
+                                      "<br><i>Only available from Norwich "
+                                      "to London Liverpool Street and "
+                                      "intermediate stations.</i>",
+                                      req_response=False)
+            self.progress = "dl_al_dt_dd_"
+            self.modify(f1, action="delay")
 
     # BOOKING ACTIONS
     @Rule(Fact(action="book"),
@@ -563,7 +663,7 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        doc = self.get_doc(message_text)
         tags = ""
         extra_info_appropriate = True
 
@@ -583,14 +683,13 @@ class ChatEngine(KnowledgeEngine):
 
         if "{TAG:ADT}" in message_text:
             adults_msg = message_text.replace("{TAG:ADT}", "")
-            adults_doc = self.nlp_engine.process(adults_msg)
-            adults = str(self.get_matches(adults_doc,
-                                          TokenDictionary['dep_delay']))
+            adults_doc = self.get_doc(adults_msg)
+            adults = str(self.get_matches(adults_doc, 'dep_delay'))
             self.declare(Fact(no_adults=int(adults)))
             self.progress = self.progress.replace("na_", "")
             tags += "{ADT:" + adults + "}"
         else:
-            adults = self.get_matches(doc, TokenDictionary['num_adults'])
+            adults = self.get_matches(doc, 'num_adults')
             if adults:
                 adults = str(adults[0])
                 self.declare(Fact(no_adults=int(adults)))
@@ -599,14 +698,13 @@ class ChatEngine(KnowledgeEngine):
 
         if "{TAG:CHD}" in message_text:
             children_msg = message_text.replace("{TAG:CHD}", "")
-            children_doc = self.nlp_engine.process(children_msg)
-            children = str(self.get_matches(children_doc,
-                                            TokenDictionary['dep_delay']))
+            children_doc = self.get_doc(children_msg)
+            children = str(self.get_matches(children_doc, 'dep_delay'))
             self.declare(Fact(no_children=int(children)))
             self.progress = self.progress.replace("nc_", "")
             tags += "{CHD:" + children + "}"
         else:
-            children = self.get_matches(doc, TokenDictionary['num_children'])
+            children = self.get_matches(doc, 'num_children')
             if children:
                 children = str(children[0])
                 self.declare(Fact(no_children=int(children)))
@@ -738,8 +836,7 @@ class ChatEngine(KnowledgeEngine):
         self.declare(Fact(final_message_sent=True))
         for f in self.facts:
             for g, val in self.facts[f].items():
-                if g not in ["__factid__", "message_text", "extra_info_req",
-                             "extra_info_requested"]:
+                if g != "__factid__" and g not in TURN_FACTS:
                     self.knowledge[g] = val
         self.halt()
 
@@ -747,19 +844,63 @@ class ChatEngine(KnowledgeEngine):
           Fact(final_message_sent=True),
           salience=90)
     def generate_ticket(self):
+        """
+        Queues the fare lookup in the background. The result is added to the
+        message chain by collect_ticket when the frontend polls for it.
+        """
+        if self.ticket_job is not None:
+            self.add_to_message_chain("I'm still searching for the best fare."
+                                      " It won't be long!", 1,
+                                      req_response=False)
+            return
 
         journey_data = {}
         for f in self.facts:
             for f_id, val in self.facts[f].items():
                 journey_data[f_id] = val
+        # The backend is chosen by CHAT_BOT_FARE_OPERATOR, not per journey
+        scrape = SCRAPE_SECONDS.timed(get_fare_backend(DEFAULT_OPERATOR),
+                                      operator=DEFAULT_OPERATOR)
+        self.ticket_job = get_job_queue().submit(scrape, journey_data)
+        self.add_to_message_chain("Searching for the best fare now. This may "
+                                  "take a few seconds...", 1,
+                                  req_response=False)
+
+    def collect_ticket(self, timeout=0):
+        """
+        Adds the result of the fare lookup queued by generate_ticket to the
+        message chain once it has finished
+
+        Parameters
+        ----------
+        timeout: float
+            The number of seconds to wait for the lookup to finish
+
+        Returns
+        -------
+        bool
+            False if the lookup is still running, True otherwise
+        """
+        job = get_job_queue().get(self.ticket_job)
         try:
-            if journey_data['returning']:
+            if job is None:
+                # Already collected, or its result has expired
+                raise LookupError(self.ticket_job)
+            url, ticket_data = job.result(timeout)
+        except FutureTimeoutError:
+            return False
+        except Exception:
+            ERRORS.inc(stage="scrape")
+            msg = ("Sorry, there are no available tickets between these "
+                   "stations at this time. I'd be happy to try again for you "
+                   "with a different combination of stations or times.")
+            self.add_to_message_chain(msg, 1, suggestions=["Start a new chat"])
+        else:
+            if self.knowledge.get('returning'):
                 ticket_type = "return"
             else:
                 ticket_type = "single"
 
-            url, ticket_data = scraper_1.scrape(journey_data)
-
             msg = ("The best fare for a {} ticket "
                    "between {} and {} is {}").format(
                 ticket_type,
@@ -769,9 +910,10 @@ class ChatEngine(KnowledgeEngine):
             )
             msg2 = ticket_data[3]
             msg_booking = ("I have set up your booking with our preferred "
-                           "booking partner Chiltern Railways by Arriva! "
+                           "booking partner {}! "
                            "Click below to go through to their site to confirm "
-                           "your information and complete your booking.")
+                           "your information and complete your booking."
+                           ).format(OPERATOR_NAMES[DEFAULT_OPERATOR])
             msg_final = ("Thanks for using Chat_bot today! If I can be of "
                          "anymore assistance, click the button below to start "
                          "a new chat")
@@ -784,11 +926,9 @@ class ChatEngine(KnowledgeEngine):
                                       ])
             self.add_to_message_chain(msg_final,
                                       suggestions=["Start a new chat"])
-        except Exception:
-            msg = ("Sorry, there are no available tickets between these "
-                   "stations at this time. I'd be happy to try again for you "
-                   "with a different combination of stations or times.")
-            self.add_to_message_chain(msg, 1, suggestions=["Start a new chat"])
+        get_job_queue().discard(self.ticket_job)
+        self.ticket_job = None
+        return True
 
     # DELAY ACTIONS
     @Rule(Fact(action="delay"),
@@ -813,7 +953,7 @@ class ChatEngine(KnowledgeEngine):
         message_text: str
             The message text passed by the user to the Chat class
         """
-        doc = self.nlp_engine.process(message_text)
+        doc = self.get_doc(message_text)
         tags = ""
         extra_info_appropriate = True
 
@@ -833,9 +973,8 @@ class ChatEngine(KnowledgeEngine):
 
         if "{TAG:DDL}" in message_text:
             dep_delay = message_text.replace("{TAG:DDL}", "")
-            dep_delay_doc = self.nlp_engine.process(dep_delay)
-            dep_delay_doc = str(self.get_matches(dep_delay_doc,
-                                                 TokenDictionary['dep_delay']))
+            dep_delay_doc = self.get_doc(dep_delay)
+            dep_delay_doc = str(self.get_matches(dep_delay_doc, 'dep_delay'))
             self.declare(Fact(departure_delay = int(dep_delay_doc)))
             self.progress = self.progress.replace("dd_", "")
             tags += "{DDL:" + str(dep_delay_doc) + "}"
@@ -903,12 +1042,19 @@ class ChatEngine(KnowledgeEngine):
         for f in self.facts:
             for f_id, val in self.facts[f].items():
                 journey_data[f_id] = val
+        # Loads pandas and scikit-learn on the first prediction rather than
+        # when the chat starts
+        from DelayPrediction.newPrediction import Predictions
+
         pr = Predictions()
         try:
-            delay_prediction = pr.display_results(
-                journey_data['depart'], journey_data['arrive'],
-                journey_data['departure_date'], journey_data['departure_delay'])
+            with PREDICTION_SECONDS.time():
+                delay_prediction = pr.display_results(
+                    journey_data['depart'], journey_data['arrive'],
+                    journey_data['departure_date'],
+                    journey_data['departure_delay'])
         except Exception as e:
+            ERRORS.inc(stage="prediction")
             delay_prediction = e
         msg_final = ("Thanks for using Chat_bot today! If you need"
                      "anymore help,please click the below button to start "
@@ -0,0 +1,218 @@
+"""
+asgi.py
+
+Serves the chat as an ASGI app, e.g. with: uvicorn Chat_bot.asgi:app
+
+POST /chat and GET /chat/stream are answered by the same Chat API as
+main.py, but the spaCy and experta work of a turn runs on a bounded pool of
+engine workers and the waits (session storage, background fare lookups and
+their shared results) are awaited, so slow users don't hold a worker while
+nothing is being computed. Every other request is
+passed to the Flask app.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from Chat_bot.Chat import TICKET_POLL_SECONDS
+from Chat_bot.main import (EXPIRED_MESSAGE, SESSION_COOKIE, app as flask_app,
+                           chat_turn, format_event, new_chat, request_kind,
+                           sessions)
+from Chat_bot.metrics import REQUEST_SECONDS
+
+engine_pool = ThreadPoolExecutor(
+    int(os.environ.get("CHAT_BOT_ENGINE_WORKERS", os.cpu_count() or 1)),
+    thread_name_prefix="chat-engine"
+)
+io_pool = ThreadPoolExecutor(
+    int(os.environ.get("CHAT_BOT_IO_WORKERS", 16)),
+    thread_name_prefix="chat-io"
+)
+flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def run_in(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def wait_for_ticket(this_chat, timeout=TICKET_POLL_SECONDS):
+    """
+    Waits up to timeout seconds for the fare lookup the chat's next message
+    depends on, without holding a worker thread
+    """
+    # Looking the job up may read the shared job results
+    future = await run_in(io_pool, this_chat.pending_ticket)
+    if future is None:
+        return
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                               timeout)
+    except Exception:
+        # Timeouts answer {WAIT}, failures are reported by pop_message
+        pass
+
+
+async def process_user_input(form, session_id):
+    """
+    The async version of main.process_user_input
+
+    Returns
+    -------
+    tuple
+        The JSON reply and the session ID
+    """
+    start = time.perf_counter()
+    user_input = form.get('user_input', "")
+    is_system = form.get('is_system', "false")
+    this_chat = await run_in(io_pool, sessions.get, session_id)
+
+    kind = request_kind(user_input, is_system, this_chat)
+    if kind == "new_chat":
+        if session_id:
+            await run_in(io_pool, sessions.delete, session_id)
+        session_id, this_chat, message = await run_in(engine_pool, new_chat)
+    elif kind == "expired":
+        message = EXPIRED_MESSAGE
+    elif kind == "popmsg":
+        await wait_for_ticket(this_chat)
+        message = await run_in(io_pool, this_chat.pop_message, 0)
+    else:
+        message = await run_in(engine_pool, chat_turn, this_chat, user_input)
+    if this_chat is not None:
+        await run_in(io_pool, sessions.save, session_id, this_chat)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind)
+    return {"message": message[0],
+            "suggestions": message[1],
+            "response_req": message[2]}, session_id
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_messages(session_id, send, receive):
+    """
+    The async version of main.stream_messages. Stops as soon as the client
+    disconnects.
+
+    Returns
+    -------
+    bool
+        False if the client disconnected
+    """
+    this_chat = await run_in(io_pool, sessions.get, session_id)
+    if this_chat is None:
+        await send_event(send, format_event(EXPIRED_MESSAGE))
+        return True
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while True:
+            waiting = asyncio.ensure_future(wait_for_ticket(this_chat))
+            await asyncio.wait({waiting, disconnected},
+                               return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiting.cancel()
+                return False
+            message = await run_in(io_pool, this_chat.pop_message, 0)
+            await run_in(io_pool, sessions.save, session_id, this_chat)
+            if message[0] == "{WAIT}":
+                await send_event(send, ": waiting\n\n")
+                continue
+            await send_event(send, format_event(message))
+            if message[2] is not False:
+                return True
+    finally:
+        disconnected.cancel()
+
+
+async def send_event(send, event):
+    await send({"type": "http.response.body", "body": event.encode("utf-8"),
+                "more_body": True})
+
+
+async def read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        event = await receive()
+        body += event.get("body", b"")
+        more_body = event.get("more_body", False)
+    return body
+
+
+def get_cookie(scope, name):
+    cookies = SimpleCookie()
+    for key, value in scope["headers"]:
+        if key == b"cookie":
+            cookies.load(value.decode("latin-1"))
+    return cookies[name].value if name in cookies else None
+
+
+async def lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif event["type"] == "lifespan.shutdown":
+            engine_pool.shutdown(wait=False)
+            io_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if (scope["type"] == "http" and scope["path"] == "/chat/stream" and
+            scope["method"] == "GET"):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache")]
+        })
+        if await stream_messages(get_cookie(scope, SESSION_COOKIE), send,
+                                 receive):
+            await send({"type": "http.response.body", "body": b""})
+        return
+    if not (scope["type"] == "http" and scope["path"] == "/chat" and
+            scope["method"] == "POST"):
+        await flask_asgi(scope, receive, send)
+        return
+
+    form = {key: values[0] for key, values in
+            parse_qs((await read_body(receive)).decode("utf-8"),
+                     keep_blank_values=True).items()}
+    reply, session_id = await process_user_input(
+        form, get_cookie(scope, SESSION_COOKIE))
+    body = json.dumps(reply).encode("utf-8")
+    cookie = "{}={}; HttpOnly; Path=/; SameSite=Lax".format(SESSION_COOKIE,
+                                                            session_id or "")
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"set-cookie", cookie.encode("latin-1"))]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    # As with main.py, any arg means we're deploying over the web
+    if len(sys.argv) > 1:
+        uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT',
+                                                                  5000)))
+    else:
+        uvicorn.run(app, port=5000)
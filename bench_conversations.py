@@ -0,0 +1,262 @@
+"""
+bench_conversations.py
+
+Replays scripted booking and delay conversations through Chat and reports
+the per-turn latency, spaCy calls, rule firings and allocations.
+
+Usage: python bench_conversations.py [--repeat N] [--save-baseline FILE]
+                                     [--baseline FILE] [--tolerance 0.25]
+
+Runs offline: the stations of fixtures/stations.csv are loaded into a
+Chat_bot.db in a temporary directory, fare lookups return a fixed fare and
+delay predictions a fixed answer. Each human message is a turn, timed until
+the bot asks for the next message (the POPMSG polls included).
+
+With --baseline the run fails (exit status 1) if a conversation's p95 turn
+latency or peak allocation grew by more than --tolerance, or it makes more
+spaCy calls or fires more rules than the baseline.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta
+from unittest import mock
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "fixtures")
+
+_departure = datetime.now() + timedelta(days=7)
+DEPARTURE_DATE = _departure.strftime("%d/%m/%Y")
+RETURN_DATE = (_departure + timedelta(days=2)).strftime("%d/%m/%Y")
+
+# As sent by scripts.js: suggestions are the tag and its value, typed
+# answers to a request follow the tag and a space
+CONVERSATIONS = {
+    # progress dl_dt_al_rt_rs_na_nc_
+    "book_single": ["I'd like to book a ticket",
+                    "depart from Norwich",
+                    "arriving to London Liverpool Street",
+                    "{TAG:DAT} " + DEPARTURE_DATE + " 10:30",
+                    "{TAG:RET}👎",
+                    "{TAG:ADT}1",
+                    "{TAG:CHD}0"],
+    "book_return": ["I want to buy a ticket from Norwich",
+                    "arriving to London",
+                    "{TAG:ARR}London Liverpool Street",
+                    "{TAG:DAT} " + DEPARTURE_DATE + " 9am",
+                    "{TAG:RET}👍",
+                    "{TAG:RAT} " + RETURN_DATE + " 18:00",
+                    "2 adults and 1 child"],
+    "book_zero_adults": ["I'd like to book a ticket",
+                         "depart from Norwich",
+                         "arriving to London Liverpool Street",
+                         "{TAG:DAT} " + DEPARTURE_DATE + " 10:30",
+                         "{TAG:RET}👎",
+                         "{TAG:ADT}0",
+                         "{TAG:CHD}0",
+                         "{TAG:ADT}1",
+                         "hello"],
+    # progress dl_al_dt_dd_
+    "delay": ["Can you predict my delay?",
+              "depart from Norwich",
+              "arriving to London Liverpool Street",
+              "{TAG:DAT} 10:30",
+              "{TAG:DDL} 5"],
+}
+
+
+def stub_fare(journey_data):
+    return ["https://example.invalid/book",
+            ["£12.30", journey_data.get("depart"), journey_data.get("arrive"),
+             "Off-Peak Single, valid on the day"]]
+
+
+class StubPredictions:
+    def display_results(self, departure, arrival, departure_time, delay):
+        return ("You'll arrive in {} about {} minutes late"
+                .format(arrival, delay))
+
+
+def stub_prediction_modules():
+    package = types.ModuleType("DelayPrediction")
+    package.__path__ = []
+    module = types.ModuleType("DelayPrediction.newPrediction")
+    module.Predictions = StubPredictions
+    package.newPrediction = module
+    return {"DelayPrediction": package,
+            "DelayPrediction.newPrediction": module}
+
+
+def create_fixture_db(path):
+    """Creates a Chat_bot.db holding the stations of fixtures/stations.csv"""
+    with open(os.path.join(FIXTURES, "stations.csv"), newline="") as stations:
+        rows = [(row["code"], row["name"]) for row in csv.DictReader(stations)]
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("CREATE TABLE Stations (code TEXT, name TEXT)")
+        conn.executemany("INSERT INTO Stations VALUES (?, ?)", rows)
+    conn.close()
+
+
+class FireCounter(logging.Handler):
+    """Counts the rules fired, as logged by experta's RULES watcher"""
+    def __init__(self):
+        super().__init__()
+        self.fires = 0
+
+    def emit(self, record):
+        if record.msg.startswith("FIRE"):
+            self.fires += 1
+
+
+def replay(messages, fire_counter, trace=False):
+    """
+    Replays messages through a new Chat
+
+    Returns
+    -------
+    list of dict
+        seconds, spacy_calls, rule_fires and (when trace) alloc_peak bytes of
+        every turn
+    dict
+        The final knowledge and progress of the chat
+    """
+    from Chat_bot.Chat import Chat
+
+    chat = Chat()
+    turns = []
+    for message_text in messages:
+        fire_counter.fires = 0
+        if trace:
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        message = chat.add_message("human", message_text, datetime.now())
+        # The frontend polls until the bot waits for the user again
+        while message[2] is False:
+            message = chat.pop_message()
+        turn = {"seconds": time.perf_counter() - start,
+                "spacy_calls": chat.chat_engine.nlp_engine.calls,
+                "rule_fires": fire_counter.fires}
+        if trace:
+            turn["alloc_peak"] = tracemalloc.get_traced_memory()[1] - allocated
+        turns.append(turn)
+    return turns, {"progress": chat.chat_engine.progress,
+                   "knowledge": sorted(chat.chat_engine.knowledge)}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def run(repeat):
+    from experta import watchers
+
+    fire_counter = FireCounter()
+    watchers.RULES.addHandler(fire_counter)
+    watchers.RULES.setLevel(logging.INFO)
+    watchers.RULES.propagate = False
+
+    results = {}
+    for name, messages in CONVERSATIONS.items():
+        # The first replay warms the pipeline, matchers and date parser up
+        replay(messages, fire_counter)
+        timings = []
+        for _ in range(repeat):
+            turns, state = replay(messages, fire_counter)
+            timings += [turn["seconds"] * 1000 for turn in turns]
+        tracemalloc.start()
+        try:
+            traced, _ = replay(messages, fire_counter, trace=True)
+        finally:
+            tracemalloc.stop()
+        results[name] = {
+            "turns": len(messages),
+            "p50_ms": statistics.median(timings),
+            "p95_ms": percentile(timings, 0.95),
+            "max_ms": max(timings),
+            "spacy_calls": sum(turn["spacy_calls"] for turn in turns),
+            "rule_fires": sum(turn["rule_fires"] for turn in turns),
+            "alloc_peak_kib": max(turn["alloc_peak"] for turn in traced)
+                              / 1024,
+            "progress": state["progress"],
+            "knowledge": state["knowledge"],
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions of results against baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        for key in ("p95_ms", "alloc_peak_kib"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append("{}: {} {:.1f} > {:.1f}".format(
+                    name, key, result[key], base[key]))
+        for key in ("spacy_calls", "rule_fires"):
+            if result[key] > base[key]:
+                regressions.append("{}: {} {} > {}".format(
+                    name, key, result[key], base[key]))
+        if result["progress"] != base["progress"]:
+            regressions.append("{}: progress {!r} != {!r}".format(
+                name, result["progress"], base["progress"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "Chat_bot.db")
+        create_fixture_db(path)
+        # Read by db_pool when the chat modules are first imported below
+        os.environ["CHAT_BOT_DB"] = path
+        with mock.patch.dict(sys.modules, stub_prediction_modules()), \
+                mock.patch("Chat_bot.Reasoner.get_fare_backend",
+                           return_value=stub_fare):
+            results = run(args.repeat)
+
+    print("{:<18} {:>5} {:>9} {:>9} {:>9} {:>7} {:>7} {:>10}  {}".format(
+        "conversation", "turns", "p50 ms", "p95 ms", "max ms", "spaCy",
+        "fires", "peak KiB", "progress left"))
+    for name, result in results.items():
+        print("{:<18} {:>5} {:>9.2f} {:>9.2f} {:>9.2f} {:>7} {:>7} "
+              "{:>10.1f}  {}".format(
+                  name, result["turns"], result["p50_ms"], result["p95_ms"],
+                  result["max_ms"], result["spacy_calls"],
+                  result["rule_fires"], result["alloc_peak_kib"],
+                  result["progress"] or "-"))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+bench_delay_queries.py
+
+Compares the query plans and timings of the delay predictions' journey
+queries before and after the schema migrations and OD_Journeys.
+
+Usage: python bench_delay_queries.py [--csv FILE] [--copies N] [--repeat N]
+
+The CSV is loaded into main.Data of a temporary database, --copies times with
+the months shifted so it looks like N months of ingested data.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import tempfile
+import time
+
+from Chat_bot.db_migrations import (OD_PAIR_QUERY, migrate,
+                                    refresh_od_journeys)
+
+HARVEST_QUERY = """
+    SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
+        (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at
+         FROM main.Data WHERE tpl = ?) AS x JOIN
+        (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data
+         WHERE tpl = ?) AS y on x.rid_FROM = y.rid_TO
+        ORDER BY rid_FROM """
+
+PAIR = ("NRCH", "LIVST")
+
+
+def load_csv(conn, path, copies):
+    with open(path, newline="") as csv_file:
+        rows = [(row["rid"], row["tpl"], row["pta"], row["ptd"],
+                 row["arr_at"], row["dep_at"])
+                for row in csv.DictReader(csv_file)]
+    conn.execute("CREATE TABLE Data (rid TEXT, tpl TEXT, pta TEXT, ptd TEXT, "
+                 "arr_at TEXT, dep_at TEXT)")
+    with conn:
+        for copy in range(copies):
+            # Shift the year so every copy is a month of data of its own
+            conn.executemany(
+                "INSERT INTO Data VALUES (?, ?, ?, ?, ?, ?)",
+                [(str(int(row[0][:4]) + copy) + row[0][4:],) + row[1:]
+                 for row in rows])
+    return len(rows) * copies
+
+
+def time_query(conn, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(query, PAIR).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(rows)
+
+
+def report(conn, name, query, repeat):
+    print(name)
+    for row in conn.execute("EXPLAIN QUERY PLAN " + query, PAIR):
+        print("    " + row[-1])
+    seconds, rows = time_query(conn, query, repeat)
+    print("    {} rows in {:.2f} ms".format(rows, seconds * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--csv", default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "NRCH_LIVST_OD_a51_2019_2_2.csv"))
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, "Chat_bot.db"))
+        print("{} rows in main.Data".format(load_csv(conn, args.csv,
+                                                     args.copies)))
+        report(conn, "harvest_data, no indexes", HARVEST_QUERY, args.repeat)
+
+        start = time.perf_counter()
+        migrate(conn)
+        print("migrate: {:.0f} ms".format((time.perf_counter() - start)
+                                          * 1000))
+        report(conn, "harvest_data, migrated", HARVEST_QUERY, args.repeat)
+
+        start = time.perf_counter()
+        months = refresh_od_journeys(conn)
+        print("refresh_od_journeys: {} months in {:.0f} ms".format(
+            len(months), (time.perf_counter() - start) * 1000))
+        report(conn, "OD_Journeys", OD_PAIR_QUERY, args.repeat)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
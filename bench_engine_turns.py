@@ -0,0 +1,60 @@
+"""
+bench_engine_turns.py
+
+Measures the engine time of a chat turn as the knowledge grows, with turns
+that reset the engine and with incremental turns.
+
+Usage: python bench_engine_turns.py [--sizes 0,10,50,200,1000] [--turns N]
+
+Each size adds that many extra facts to the knowledge of a chat that's
+booking a ticket, then times --turns turns (start_turn + run) in each mode.
+"""
+import argparse
+import statistics
+import time
+
+from Chat_bot.Reasoner import ChatEngine
+
+MESSAGES = ["depart from Norwich", "hello", "arriving to London Liverpool "
+            "Street", "thanks"]
+
+
+def time_turns(incremental, size, turns):
+    engine = ChatEngine(incremental=incremental)
+    engine.knowledge["action"] = "book"
+    engine.progress = "dl_dt_al_rt_rs_na_nc_"
+    for i in range(size):
+        engine.knowledge["extra_{}".format(i)] = i
+
+    timings = []
+    for turn in range(turns + 1):
+        engine.message = []
+        start = time.perf_counter()
+        engine.start_turn(MESSAGES[turn % len(MESSAGES)])
+        engine.run()
+        elapsed = time.perf_counter() - start
+        # The first turn always resets, so it isn't counted
+        if turn:
+            timings.append(elapsed)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", default="0,10,50,200,1000")
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:>6} {:>12} {:>12} {:>12} {:>12}".format(
+        "facts", "reset ms", "p95", "incr. ms", "p95"))
+    for size in [int(size) for size in args.sizes.split(",")]:
+        row = [size]
+        for incremental in (False, True):
+            timings = sorted(time_turns(incremental, size, args.turns))
+            row += [statistics.median(timings) * 1000,
+                    timings[int(len(timings) * 0.95) - 1] * 1000]
+        print("{:>6} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f}".format(*row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_fare_extraction.py
+
+Compares the streaming cheapest fare scanner with the BeautifulSoup path
+scraper.scrape used to take, over saved times and fares pages: bytes parsed,
+peak memory and wall time.
+
+Usage: python bench_fare_extraction.py [--rows N] [--repeat N] [page.html ...]
+
+--rows appends N extra timetable rows after the cheapest fare to stand in
+for a full day of services. Defaults to the National Rail fixture.
+"""
+import argparse
+import json
+import os
+import re
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup as soup
+
+from Chat_bot.fare_fetcher import CHUNK_SIZE, scan_cheapest_fare
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                       "fixtures", "national_rail_fares.html")
+
+
+def soup_extract(page):
+    """The extraction scraper.scrape used before the streaming scanner"""
+    page_scrape = soup(page, "html.parser")
+    cheap_elements = page_scrape.find("td", {"class": "fare has-cheapest"})
+    cheap_script = cheap_elements.find('script').contents
+    stripped_cheap_text = str(cheap_script).strip("'<>() ").replace(
+        '\'', '\"').replace('\00', '').replace('["\\n\\t\\t\\t', "").replace(
+        '\\n\\t\\t"]', "")
+    return json.loads(stripped_cheap_text), len(page)
+
+
+def stream_extract(page):
+    chunks = (page[i:i + CHUNK_SIZE] for i in range(0, len(page), CHUNK_SIZE))
+    return scan_cheapest_fare(chunks)
+
+
+def pad_page(page, rows):
+    """Appends rows copies of the first timetable row after the last one"""
+    text = page.decode("utf-8")
+    row = re.search(r"<tr[^>]*>.*?</tr>", text, re.S).group(0)
+    end = text.rindex("</tbody>")
+    return (text[:end] + row * rows + text[end:]).encode("utf-8")
+
+
+def measure(extract, page, repeat):
+    fare, parsed = extract(page)
+    tracemalloc.start()
+    extract(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = min(timeit.repeat(lambda: extract(page), number=1,
+                                repeat=repeat))
+    return fare, parsed, peak, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("pages", nargs="*", default=[FIXTURE])
+    parser.add_argument("--rows", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:<32} {:<8} {:>10} {:>12} {:>10}".format(
+        "page", "path", "bytes", "peak KiB", "ms"))
+    for path in args.pages:
+        with open(path, "rb") as page_file:
+            page = page_file.read()
+        if args.rows:
+            page = pad_page(page, args.rows)
+        results = {}
+        for name, extract in (("soup", soup_extract),
+                              ("stream", stream_extract)):
+            fare, parsed, peak, seconds = measure(extract, page, args.repeat)
+            results[name] = fare
+            print("{:<32} {:<8} {:>10} {:>12.1f} {:>10.3f}".format(
+                os.path.basename(path)[:32], name, parsed, peak / 1024,
+                seconds * 1000))
+        if results["soup"] != results["stream"]:
+            print("  mismatch: the two paths extracted different fares")
+
+
+if __name__ == '__main__':
+    main()
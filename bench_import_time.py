@@ -0,0 +1,86 @@
+"""
+bench_import_time.py
+
+Profiles the cold import of a module with python -X importtime and reports
+the slowest imports and whether the heavy stacks were loaded.
+
+Usage: python bench_import_time.py [--module Chat_bot.main] [--top N]
+                                   [--repeat N] [--check]
+
+The import runs in a fresh interpreter with the warm-up and browser prewarm
+threads turned off. With --check the exit status is 1 if any module in
+HEAVY_MODULES was imported, so it can be tracked in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Only loaded on first use: the ML stack by the first delay prediction, the
+# scraping stack by the first fare lookup and spaCy by the first chat
+HEAVY_MODULES = ["pandas", "sklearn", "dateparser", "selenium",
+                 "webdriver_manager", "bs4", "requests", "spacy",
+                 "DelayPrediction"]
+
+
+def profile_import(module):
+    """
+    Imports module in a new interpreter with -X importtime. The imports of
+    the interpreter's startup (site) are left out
+
+    Returns
+    -------
+    list of tuple
+        (module, self microseconds, cumulative microseconds) of every import,
+        in the order they finished
+    """
+    env = dict(os.environ, CHAT_BOT_WARM_UP="false",
+               CHAT_BOT_BROWSER_PREWARM="false")
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import sys; print('-', file=sys.stderr); import " + module],
+        env=env, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode:
+        sys.exit(process.stderr)
+
+    imports = []
+    startup, _, profile = process.stderr.partition("\n-\n")
+    for line in profile.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--module", default="Chat_bot.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.repeat)]
+    totals = [sum(self_us for _, self_us, _ in imports) for imports in runs]
+    imports = runs[totals.index(min(totals))]
+
+    print("{:>12} {:>12}  {}".format("self ms", "cumul. ms", "module"))
+    for name, self_us, cumulative_us in sorted(
+            imports, key=lambda row: row[2], reverse=True)[:args.top]:
+        print("{:>12.1f} {:>12.1f}  {}".format(self_us / 1000,
+                                               cumulative_us / 1000, name))
+    print("{} modules, {:.0f} ms (median of {} runs {:.0f} ms)".format(
+        len(imports), min(totals) / 1000, args.repeat,
+        statistics.median(totals) / 1000))
+
+    imported = {name.split(".")[0] for name, _, _ in imports}
+    heavy = [module for module in HEAVY_MODULES if module in imported]
+    print("Heavy modules imported: {}".format(", ".join(heavy) or "none"))
+    if args.check and heavy:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
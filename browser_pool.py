@@ -0,0 +1,205 @@
+"""
+browser_pool.py
+
+Contains a bounded pool of headless browsers reused between fare lookups
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+_driver_path = None
+
+
+def create_firefox():
+    """
+    Starts a headless Firefox. The geckodriver is taken from GECKODRIVER_PATH
+    if set, otherwise it's installed by webdriver_manager once per process.
+    """
+    global _driver_path
+    from selenium import webdriver
+    from webdriver_manager.firefox import GeckoDriverManager
+
+    if _driver_path is None:
+        _driver_path = (os.environ.get("GECKODRIVER_PATH") or
+                        GeckoDriverManager().install())
+    opts = webdriver.FirefoxOptions()
+    opts.add_argument("--window-size=1920,1080")
+    opts.add_argument("--headless")
+    return webdriver.Firefox(executable_path=_driver_path, options=opts)
+
+
+class BrowserPool:
+    def __init__(self, size=2, max_uses=50, factory=create_firefox):
+        """
+        A pool of at most size browsers. A browser is reset between leases and
+        replaced after max_uses leases or when a lease fails.
+
+        Parameters
+        ----------
+        size: int
+            The maximum number of browsers running at once
+        max_uses: int
+            The number of leases after which a browser is quit and replaced
+        factory: callable
+            Returns a new browser (selenium WebDriver)
+        """
+        self.size = size
+        self.max_uses = max_uses
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._uses = {}
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats = {"leases": 0, "wait_seconds": 0.0,
+                       "max_wait_seconds": 0.0, "lease_seconds": 0.0,
+                       "max_lease_seconds": 0.0, "started": 0, "recycled": 0,
+                       "crashed": 0}
+
+    def start(self):
+        """Starts browsers until the pool is full"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._start_browser())
+
+    def _start_browser(self):
+        try:
+            browser = self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self._uses[id(browser)] = 0
+            self._stats["started"] += 1
+        return browser
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_start = self._created < self.size
+            if can_start:
+                self._created += 1
+        if can_start:
+            return self._start_browser()
+        return self._idle.get(timeout=timeout)
+
+    def _retire(self, browser):
+        with self._lock:
+            self._uses.pop(id(browser), None)
+            self._created -= 1
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def reset(browser):
+        """Clears the state left by the previous lease"""
+        browser.delete_all_cookies()
+        browser.get("about:blank")
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        Leases a browser for the duration of the with block
+
+        Parameters
+        ----------
+        timeout: float
+            The number of seconds to wait for a browser to become free. Waits
+            forever if None
+
+        Raises
+        ------
+        queue.Empty
+            If no browser became free within timeout
+        """
+        wait_start = time.perf_counter()
+        browser = self._acquire(timeout)
+        lease_start = time.perf_counter()
+        failed = False
+        try:
+            yield browser
+        except Exception:
+            failed = True
+            raise
+        finally:
+            lease_end = time.perf_counter()
+            with self._lock:
+                self._uses[id(browser)] = self._uses.get(id(browser), 0) + 1
+                uses = self._uses[id(browser)]
+                stats = self._stats
+                stats["leases"] += 1
+                stats["wait_seconds"] += lease_start - wait_start
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"],
+                                                lease_start - wait_start)
+                stats["lease_seconds"] += lease_end - lease_start
+                stats["max_lease_seconds"] = max(stats["max_lease_seconds"],
+                                                 lease_end - lease_start)
+            if not failed and uses < self.max_uses:
+                try:
+                    self.reset(browser)
+                except Exception:
+                    failed = True
+            if failed:
+                with self._lock:
+                    self._stats["crashed"] += 1
+                self._retire(browser)
+            elif uses >= self.max_uses:
+                with self._lock:
+                    self._stats["recycled"] += 1
+                self._retire(browser)
+            else:
+                self._idle.put(browser)
+
+    def get_stats(self):
+        """
+        Returns the number of leases, total, average and maximum wait and
+        lease times in seconds, and the number of browsers started, recycled
+        after max_uses and replaced after a failure
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = self._created
+            stats["idle"] = self._idle.qsize()
+        leases = max(stats["leases"], 1)
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / leases
+        stats["avg_lease_seconds"] = stats["lease_seconds"] / leases
+        return stats
+
+    def close(self):
+        """Quits every idle browser"""
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._retire(browser)
+
+
+_browser_pool = None
+_browser_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """
+    Returns the process wide browser pool, sized by the
+    CHAT_BOT_BROWSER_POOL_SIZE and CHAT_BOT_BROWSER_MAX_USES environment
+    variables
+    """
+    global _browser_pool
+    with _browser_pool_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(
+                int(os.environ.get("CHAT_BOT_BROWSER_POOL_SIZE", 2)),
+                int(os.environ.get("CHAT_BOT_BROWSER_MAX_USES", 50))
+            )
+        return _browser_pool
@@ -0,0 +1,190 @@
+"""
+dates.py
+
+Contains the parsing of the dates and times users give for their journeys.
+
+The shapes the date matchers target (10:30, 9:05, 9am, 9:30pm, tomorrow at
+10:30, 2021) are parsed by a compiled regex. Anything else is validated with
+dateutil and parsed by a single shared dateparser parser, and the result is
+kept for the rest of the day.
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+
+from dateutil.parser import parse, ParserError
+
+# Number of fallback results kept per day
+MEMO_SIZE = 1024
+
+TIME_PATTERN = re.compile(
+    r"(?:(?P<day>today|tomorrow)(?: at)? )?"
+    r"(?:(?P<hour>\d{1,2})(?::(?P<minute>\d\d))?(?P<meridiem>am|pm)?"
+    r"|(?P<year>\d{4}))"
+    r"(?: (?P<day_after>today|tomorrow))?",
+    re.IGNORECASE
+)
+
+_date_data_parser = None
+_parser_lock = threading.Lock()
+_memo = {}
+_memo_day = None
+_memo_lock = threading.Lock()
+
+
+def normalise_date_text(date_text):
+    """Joins am/pm to the time and replaces o'clock with :00"""
+    date_text = date_text.replace(" am", "am")
+    date_text = date_text.replace(" AM", "am")
+    date_text = date_text.replace(" pm", "pm")
+    date_text = date_text.replace(" PM", "pm")
+    date_text = date_text.replace(" o'clock", ":00")
+    date_text = date_text.replace(" oclock", ":00")
+    date_text = date_text.replace("o'clock", ":00")
+    date_text = date_text.replace("oclock", ":00")
+    return date_text
+
+
+def parse_fast(date_text, now):
+    """
+    Parses the shapes in TIME_PATTERN the way dateparser does, a time is on
+    today (or tomorrow) and a four digit number is a year on today's date
+
+    Returns
+    -------
+    datetime.datetime or None
+        The date, or None if date_text isn't one of the shapes
+    """
+    match = TIME_PATTERN.fullmatch(date_text)
+    if match is None or (match.group("day") and match.group("day_after")):
+        return None
+    if match.group("year"):
+        if match.group("day") or match.group("day_after"):
+            return None
+        try:
+            return datetime(int(match.group("year")), now.month, now.day)
+        except ValueError:
+            return None
+
+    hour = int(match.group("hour"))
+    minute = int(match.group("minute") or 0)
+    meridiem = (match.group("meridiem") or "").lower()
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    elif match.group("minute") is None:
+        # A bare number is a day of the month
+        return None
+    if hour > 23 or minute > 59:
+        return None
+
+    date_time = datetime(now.year, now.month, now.day, hour, minute)
+    day = (match.group("day") or match.group("day_after") or "").lower()
+    if day == "tomorrow":
+        date_time += timedelta(days=1)
+    return date_time
+
+
+def get_date_data_parser():
+    """Returns the dateparser parser shared by every chat"""
+    global _date_data_parser
+    with _parser_lock:
+        if _date_data_parser is None:
+            from dateparser.date import DateDataParser
+
+            _date_data_parser = DateDataParser(languages=['en'],
+                                               settings={'DATE_ORDER': 'DMY'})
+        return _date_data_parser
+
+
+def parse_slow(date_text):
+    """
+    Parses date_text with dateparser if dateutil finds a date in it
+
+    Returns
+    -------
+    datetime.datetime or None
+        The date, or None if either parser can't read date_text
+    """
+    try:
+        parse(date_text, fuzzy=True)
+    except ParserError:
+        return None
+    parser = get_date_data_parser()
+    with _parser_lock:
+        return parser.get_date_data(date_text).date_obj
+
+
+def parse_date_text(date_text, now=None):
+    """
+    Returns the date and time described by date_text
+
+    Parameters
+    ----------
+    date_text: str
+        The date as matched in the user's message
+    now: datetime.datetime
+        The current time (default datetime.now())
+
+    Returns
+    -------
+    datetime.datetime or None
+        The date, or None if it couldn't be parsed
+    """
+    global _memo_day
+    now = now or datetime.now()
+    date_text = normalise_date_text(date_text)
+    date_time = parse_fast(date_text, now)
+    if date_time is not None:
+        return date_time
+
+    with _memo_lock:
+        if _memo_day != now.date():
+            _memo.clear()
+            _memo_day = now.date()
+        if date_text in _memo:
+            return _memo[date_text]
+    date_time = parse_slow(date_text)
+    # Relative dates (in 2 hours) keep the current time down to the
+    # microsecond, those can't be reused
+    if date_time is None or date_time.microsecond == 0:
+        with _memo_lock:
+            if len(_memo) >= MEMO_SIZE:
+                _memo.clear()
+            _memo[date_text] = date_time
+    return date_time
+
+
+def get_date_from_text(date_text, knowledge, st_type="DEP"):
+    """
+    Parses the date of a departure, return or delay
+
+    Parameters
+    ----------
+    date_text: str
+        The date as matched in the user's message
+    knowledge: Knowledge
+        The knowledge of the chat, departure_date and return_date are checked
+    st_type: str
+        DEP, RET or DLY
+
+    Returns
+    -------
+    datetime.datetime or int or None
+        The date, 2 if it's in the past (except for delays), 1 if it's not
+        between the departure and return dates, or None if it couldn't be
+        parsed
+    """
+    now = datetime.now()
+    date_time = parse_date_text(date_text, now)
+    if date_time is None:
+        return None
+    if date_time <= now and st_type != "DLY":
+        return 2
+    if (("departure_date" in knowledge and
+            date_time <= knowledge['departure_date']) or
+            ("return_date" in knowledge and
+             date_time >= knowledge['return_date'])):
+        return 1
+    return date_time
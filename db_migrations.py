@@ -0,0 +1,139 @@
+"""
+db_migrations.py
+
+Schema migrations of Chat_bot.db and the materialized OD_Journeys table read
+by the delay predictions.
+
+OD_Journeys holds one row per journey (rid) and pair of its public calling
+points (from_tpl with a public departure, to_tpl with a public arrival),
+with the times as seconds since midnight (-1 when missing). It's built one
+month of main.Data at a time, so months ingested since the last refresh are
+the only ones added.
+
+Usage: python db_migrations.py [database]
+"""
+import sqlite3
+import sys
+
+import numpy as np
+
+from Chat_bot.db_pool import DB_PATH, get_db_pool
+from Chat_bot.journey_store import time_to_seconds
+
+MIGRATIONS = [
+    # 1: lookups of the journeys calling at a tpl (harvest_data) and of the
+    # calling points of a journey (refresh_od_journeys)
+    ["CREATE INDEX IF NOT EXISTS idx_data_tpl_rid ON Data(tpl, rid)",
+     "CREATE INDEX IF NOT EXISTS idx_data_rid_tpl ON Data(rid, tpl)"],
+    # 2: the origin-destination pairs of every journey
+    ["CREATE TABLE IF NOT EXISTS OD_Journeys ("
+     "rid INTEGER NOT NULL, "
+     "from_tpl TEXT NOT NULL, "
+     "to_tpl TEXT NOT NULL, "
+     "ptd INTEGER NOT NULL, "
+     "dep_at INTEGER NOT NULL, "
+     "pta INTEGER NOT NULL, "
+     "arr_at INTEGER NOT NULL)",
+     "CREATE INDEX IF NOT EXISTS idx_od_journeys_pair "
+     "ON OD_Journeys(from_tpl, to_tpl, rid)",
+     "CREATE TABLE IF NOT EXISTS OD_Months ("
+     "month TEXT PRIMARY KEY, "
+     "journeys INTEGER NOT NULL)"]
+]
+
+OD_PAIR_QUERY = """
+    SELECT rid, ptd, dep_at, pta, arr_at FROM main.OD_Journeys
+    WHERE from_tpl = ? AND to_tpl = ? ORDER BY rid"""
+
+
+def migrate(conn):
+    """
+    Applies the migrations the database hasn't had yet, tracked by its
+    user_version
+
+    Returns
+    -------
+    int
+        The schema version of the database
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in enumerate(MIGRATIONS[version:],
+                                         start=version + 1):
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("PRAGMA user_version={:d}".format(version))
+    return version
+
+
+def refresh_od_journeys(conn):
+    """
+    Adds the journeys of the months of main.Data that aren't in OD_Journeys
+    yet
+
+    Returns
+    -------
+    list of str
+        The months (YYYYMM) added
+    """
+    conn.create_function("time_to_seconds", 1, time_to_seconds,
+                         deterministic=True)
+    months = [row[0] for row in conn.execute(
+        "SELECT DISTINCT substr(rid, 1, 6) FROM main.Data "
+        "EXCEPT SELECT month FROM main.OD_Months ORDER BY 1")]
+    for month in months:
+        with conn:
+            cursor = conn.execute("""
+                INSERT INTO OD_Journeys
+                    (rid, from_tpl, to_tpl, ptd, dep_at, pta, arr_at)
+                SELECT CAST(x.rid AS INTEGER), x.tpl, y.tpl,
+                       time_to_seconds(x.ptd), time_to_seconds(x.dep_at),
+                       time_to_seconds(y.pta), time_to_seconds(y.arr_at)
+                FROM main.Data AS x JOIN main.Data AS y ON x.rid = y.rid
+                WHERE substr(x.rid, 1, 6) = ? AND x.tpl != y.tpl
+                    AND COALESCE(x.ptd, '') != ''
+                    AND COALESCE(y.pta, '') != ''""", (month,))
+            conn.execute("INSERT INTO OD_Months (month, journeys) "
+                         "VALUES (?, ?)", (month, cursor.rowcount))
+    return months
+
+
+def read_od_pair(pool, departure_station, arrival_station):
+    """
+    Returns the journeys calling at both stations from OD_Journeys, in the
+    format of JourneyStore.get_pair
+    """
+    rows = pool.query(OD_PAIR_QUERY, (departure_station, arrival_station))
+    columns = np.array(rows, dtype=np.int64).reshape(-1, 5)
+    return {column: columns[:, i] for i, column in
+            enumerate(("rid", "ptd", "dep_at", "pta", "arr_at"))}
+
+
+_od_built = None
+
+
+def get_od_pair(departure_station, arrival_station):
+    """
+    Returns read_od_pair from the process wide connection pool, or None if
+    OD_Journeys hasn't been built in the database
+    """
+    global _od_built
+    pool = get_db_pool()
+    if _od_built is None:
+        try:
+            _od_built = bool(pool.query("SELECT 1 FROM main.OD_Months "
+                                        "LIMIT 1"))
+        except sqlite3.OperationalError:
+            _od_built = False
+    if not _od_built:
+        return None
+    return read_od_pair(pool, departure_station, arrival_station)
+
+
+if __name__ == '__main__':
+    connection = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1
+                                 else DB_PATH)
+    print("Schema version {}".format(migrate(connection)))
+    for added in refresh_od_journeys(connection):
+        print("Added the journeys of {} to OD_Journeys".format(added))
+    connection.close()
@@ -0,0 +1,192 @@
+"""
+db_pool.py
+
+Contains the pool of SQLite connections to Chat_bot.db shared by everything
+reading from it (stations, delay predictions)
+"""
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from urllib.parse import quote
+
+from Chat_bot.metrics import db_query_hook
+
+DB_PATH = os.environ.get("CHAT_BOT_DB", "Chat_bot.db")
+
+
+class _ConnectionHolder:
+    """
+    Holds a thread's connection in the pool's thread local storage, which is
+    dropped when the thread exits
+    """
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, read_only=True, cached_statements=128):
+        """
+        Hands every thread its own connection to the database, opened on
+        first use and closed when the thread exits. Statements are
+        prepared once per connection and reused, so queries should pass their
+        values as parameters rather than formatting them into the SQL.
+
+        Parameters
+        ----------
+        path: str
+            The path to the SQLite database
+        read_only: bool
+            Open the connections read only. The database is switched to WAL
+            mode first so readers don't block a process writing to it. The
+            database must exist, FileNotFoundError is raised otherwise.
+        cached_statements: int
+            The number of prepared statements kept per connection
+        """
+        self.path = path
+        self.read_only = read_only
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._hooks = []
+        self._lock = threading.Lock()
+        self._wal_checked = False
+
+    def _uri(self, mode):
+        return "file:{}?mode={}".format(quote(os.path.abspath(self.path)),
+                                        mode)
+
+    def _enable_wal(self):
+        if self.read_only and not os.path.exists(self.path):
+            raise FileNotFoundError(
+                "No database at {}, set CHAT_BOT_DB to the path of "
+                "Chat_bot.db".format(os.path.abspath(self.path)))
+        try:
+            # Never creates the database, a missing one fails above rather
+            # than as "no such table" later
+            conn = sqlite3.connect(self._uri("rw"), uri=True)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # e.g. the database is on a read only file system, readers still
+            # work in the default journal mode
+            pass
+        self._wal_checked = True
+
+    def connection(self):
+        """Returns the connection of the calling thread"""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            if not self._wal_checked:
+                with self._lock:
+                    if not self._wal_checked:
+                        self._enable_wal()
+            if self.read_only:
+                conn = sqlite3.connect(
+                    self._uri("ro"), uri=True,
+                    cached_statements=self.cached_statements,
+                    check_same_thread=False
+                )
+                conn.execute("PRAGMA query_only=ON")
+            else:
+                conn = sqlite3.connect(
+                    self.path, timeout=10,
+                    cached_statements=self.cached_statements,
+                    check_same_thread=False
+                )
+            holder = self._local.holder = _ConnectionHolder(conn)
+            with self._lock:
+                self._connections.append(conn)
+            # Threads come and go (e.g. one per request with Flask's threaded
+            # server), their connections mustn't outlive them
+            weakref.finalize(holder, self._release, conn)
+        return holder.conn
+
+    def _release(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+
+    def __len__(self):
+        """Returns the number of open connections"""
+        with self._lock:
+            return len(self._connections)
+
+    def add_hook(self, hook):
+        """
+        Registers hook(query, params, seconds, rows) to be called after every
+        query run with query()
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def query(self, query, params=()):
+        """
+        Runs a query on the calling thread's connection
+
+        Parameters
+        ----------
+        query: str
+            The SQL, with ? placeholders for the values
+        params: tuple
+            The values of the placeholders
+
+        Returns
+        -------
+        list of tuple
+            The rows returned
+        """
+        start = time.perf_counter()
+        rows = self.connection().execute(query, params).fetchall()
+        seconds = time.perf_counter() - start
+        for hook in self._hooks:
+            hook(query, params, seconds, len(rows))
+        return rows
+
+    def close(self):
+        """Closes every connection opened by the pool"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def slow_query_logger(threshold):
+    """Returns a hook printing the queries taking longer than threshold"""
+    def hook(query, params, seconds, rows):
+        if seconds >= threshold:
+            print("Slow query ({:.1f} ms, {} rows): {} {}".format(
+                seconds * 1000, rows, " ".join(query.split()), params))
+    return hook
+
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """
+    Returns the process wide connection pool to the database at the
+    CHAT_BOT_DB environment variable (default Chat_bot.db). Query times are
+    added to the metrics, and queries slower than CHAT_BOT_SLOW_QUERY_MS
+    milliseconds are logged if it's set.
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool()
+            _db_pool.add_hook(db_query_hook)
+            slow_query_ms = os.environ.get("CHAT_BOT_SLOW_QUERY_MS")
+            if slow_query_ms:
+                _db_pool.add_hook(slow_query_logger(float(slow_query_ms)
+                                                    / 1000))
+        return _db_pool
@@ -0,0 +1,141 @@
+"""
+delay_features.py
+
+Vectorized versions of the feature builders used by the delay predictions.
+
+Every function works on whole columns of harvested journeys (NumPy arrays of
+seconds since midnight, -1 when a time is missing) instead of one journey at
+a time.
+"""
+import numpy as np
+
+from Chat_bot.journey_store import time_to_seconds
+
+FEATURE_COLUMNS = ["rid", "time_dep", "delay", "day_of_week", "weekend",
+                   "day_segment", "rush_hour", "arrival_time"]
+
+
+def rows_to_columns(result):
+    """
+    Converts the rows returned by Predictions.harvest_data into columns
+
+    Parameters
+    ----------
+    result: list of tuple
+        (rid, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at) rows
+
+    Returns
+    -------
+    dict
+        rid, ptd, dep_at, pta and arr_at arrays
+    """
+    columns = {"rid": np.array([int(row[0]) for row in result],
+                               dtype=np.int64)}
+    for column, i in (("ptd", 2), ("dep_at", 3), ("pta", 5), ("arr_at", 6)):
+        columns[column] = np.array([time_to_seconds(row[i]) for row in result],
+                                   dtype=np.int64)
+    return columns
+
+
+def day_of_week(rid):
+    """
+    Returns the day of the week (Monday = 0, Sunday = 6) of each rid, whose
+    first eight digits are the YYYYMMDD date of the journey
+    """
+    rid = np.asarray(rid, dtype=np.int64)
+    digits = np.floor(np.log10(np.maximum(rid, 1))).astype(np.int64) + 1
+    date = rid // 10 ** np.maximum(digits - 8, 0)
+    dates = ((date // 10000 - 1970).astype("datetime64[Y]")
+             + (date // 100 % 100 - 1).astype("timedelta64[M]")
+             + (date % 100 - 1).astype("timedelta64[D]"))
+    # 1970-01-01 was a Thursday
+    return (dates.astype("datetime64[D]").astype(np.int64) + 3) % 7
+
+
+def is_weekend(day):
+    """Vectorized Predictions.is_weekend: 1 for Saturday and Sunday"""
+    return (np.asarray(day) > 4).astype(np.int64)
+
+
+def check_day_segment(hour_of_day):
+    """
+    Vectorized Predictions.check_day_segment: 1 = morning (5 - 10),
+    2 = midday (10 - 15), 3 = evening (15 - 20), 4 = night (20 - 5)
+    """
+    hour_of_day = np.asarray(hour_of_day)
+    return np.select([(5 <= hour_of_day) & (hour_of_day < 10),
+                      (10 <= hour_of_day) & (hour_of_day < 15),
+                      (15 <= hour_of_day) & (hour_of_day < 20)],
+                     [1, 2, 3], 4)
+
+
+def is_rush_hour(hour, minute):
+    """
+    Vectorized Predictions.is_rush_hour: 1 from 05:45 to 09:00 and from 16:00
+    to 18:59, otherwise 0.
+
+    The scalar version returns an empty list for times between 00:00 and
+    00:59, which can't be used as a feature. They are not rush hour so this
+    returns 0.
+    """
+    hour = np.asarray(hour)
+    minute = np.asarray(minute)
+    in_rush_hours = (((5 <= hour) & (hour <= 9)) |
+                     ((16 <= hour) & (hour <= 18)))
+    rush = ((hour == 5) & (45 <= minute)) | ((5 < hour) & (hour < 9))
+    not_rush = ((hour == 5) & (minute < 45)) | ((hour == 9) & (0 < minute))
+    return (in_rush_hours & (rush | ~not_rush)).astype(np.int64)
+
+
+def build_features(columns):
+    """
+    Builds the delay features of every journey with a public and actual
+    departure and arrival time
+
+    Parameters
+    ----------
+    columns: dict
+        rid, ptd, dep_at, pta and arr_at arrays as returned by
+        JourneyStore.get_pair or rows_to_columns
+
+    Returns
+    -------
+    dict
+        rid, time_dep, delay, day_of_week, weekend, day_segment, rush_hour
+        and arrival_time (actual - public arrival) arrays, plus arrival_at,
+        the actual arrival time
+    """
+    complete = ((columns["ptd"] >= 0) & (columns["dep_at"] >= 0) &
+                (columns["pta"] >= 0) & (columns["arr_at"] >= 0))
+    rid = np.asarray(columns["rid"])[complete]
+    ptd = np.asarray(columns["ptd"])[complete]
+    dep_at = np.asarray(columns["dep_at"])[complete]
+    pta = np.asarray(columns["pta"])[complete]
+    arr_at = np.asarray(columns["arr_at"])[complete]
+
+    hour_of_day = dep_at // 3600
+    minute_of_day = dep_at % 3600 // 60
+    days = day_of_week(rid)
+    return {
+        "rid": rid,
+        "time_dep": dep_at,
+        "delay": dep_at - ptd,
+        "day_of_week": days,
+        "weekend": is_weekend(days),
+        "day_segment": check_day_segment(hour_of_day),
+        "rush_hour": is_rush_hour(hour_of_day, minute_of_day),
+        "arrival_time": arr_at - pta,
+        "arrival_at": arr_at
+    }
+
+
+def feature_matrix(features, columns=FEATURE_COLUMNS):
+    """Stacks the given feature columns into a float matrix"""
+    return np.column_stack([features[column] for column in columns]
+                           ).astype(np.float64)
+
+
+def one_hot_day_segment(day_segment):
+    """Returns the 4 column one hot encoding used by Prediction.py"""
+    return (np.asarray(day_segment)[:, None] ==
+            np.arange(1, 5)[None, :]).astype(np.int64)
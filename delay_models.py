@@ -0,0 +1,137 @@
+"""
+delay_models.py
+
+Offline training and on-disk storage of the delay prediction models.
+
+One regressor is fitted per (departure tpl, arrival tpl) pair from main.Data
+and pickled into a versioned directory so the chat engine only has to load a
+model and call predict on it.
+
+Usage: python delay_models.py [model_directory]
+"""
+import os
+import pickle
+import sys
+import threading
+from itertools import permutations
+
+MODEL_STORE_VERSION = 1
+MODEL_STORE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               "models")
+
+
+class ModelStore:
+    def __init__(self, directory=MODEL_STORE_DIR,
+                 version=MODEL_STORE_VERSION):
+        """
+        A directory of pickled delay models, one file per station pair
+
+        Parameters
+        ----------
+        directory: str
+            The root directory of the model store
+        version: int
+            The store version. Models from other versions are never loaded
+        """
+        self.version = version
+        self.directory = os.path.join(directory, "v{}".format(version))
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, departure_station, arrival_station):
+        filename = "{}_{}.pkl".format(departure_station, arrival_station)
+        return os.path.join(self.directory, filename)
+
+    def save(self, departure_station, arrival_station, model):
+        """
+        Serializes a fitted model for the given tpl pair. The file is written
+        to a temporary path first so readers never see a partial model.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(departure_station, arrival_station)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as model_file:
+                pickle.dump(model, model_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._models[(departure_station, arrival_station)] = model
+
+    def load(self, departure_station, arrival_station):
+        """
+        Returns the model for the given tpl pair, or None if it has not been
+        trained. Loaded models are kept in memory for the life of the process.
+        """
+        key = (departure_station, arrival_station)
+        with self._lock:
+            if key in self._models:
+                return self._models[key]
+            path = self.path_for(departure_station, arrival_station)
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as model_file:
+                model = pickle.load(model_file)
+            self._models[key] = model
+            return model
+
+    def clear(self):
+        """Forgets any models loaded into memory"""
+        with self._lock:
+            self._models = {}
+
+
+_model_store = None
+
+
+def get_model_store():
+    """Returns the process wide model store"""
+    global _model_store
+    if _model_store is None:
+        _model_store = ModelStore()
+    return _model_store
+
+
+def train_models(store=None):
+    """
+    Fits one model per pair of known stations and saves them into the store
+
+    Parameters
+    ----------
+    store: ModelStore
+        The store to save the models in. Defaults to the process wide store
+
+    Returns
+    -------
+    list of tuple
+        The (departure tpl, arrival tpl) pairs a model was trained for
+    """
+    from DelayPrediction.newPrediction import Predictions
+
+    if store is None:
+        store = get_model_store()
+    pr = Predictions()
+    trained = []
+    for departure_station, arrival_station in permutations(
+            sorted(set(pr.stations.values())), 2):
+        pr.departure_station = departure_station
+        pr.arrival_station = arrival_station
+        data = pr.prepare_datasets()
+        if not len(data):
+            continue
+        store.save(departure_station, arrival_station, pr.fit(data))
+        trained.append((departure_station, arrival_station))
+        print("Trained model for {} -> {} on {} journeys".format(
+            departure_station, arrival_station, len(data)))
+    return trained
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        train_models(ModelStore(sys.argv[1]))
+    else:
+        train_models()
@@ -0,0 +1,149 @@
+"""
+fare_cache.py
+
+Contains the cache of fare lookups shared by every chat in the process
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def round_down(date_time, bucket_minutes):
+    """Rounds date_time down to the start of its bucket_minutes bucket"""
+    minutes = date_time.hour * 60 + date_time.minute
+    minutes -= minutes % bucket_minutes
+    return date_time.replace(hour=minutes // 60, minute=minutes % 60,
+                             second=0, microsecond=0)
+
+
+class FareCache:
+    def __init__(self, ttl=600, max_size=256, bucket_minutes=15):
+        """
+        Caches fare lookups by journey with expiry and least recently used
+        eviction. Identical lookups running at the same time are coalesced so
+        only one of them fetches the fare.
+
+        Parameters
+        ----------
+        ttl: float
+            The number of seconds a fare is cached for
+        max_size: int
+            The maximum number of fares cached
+        bucket_minutes: int
+            Departure times in the same bucket of this many minutes share the
+            cached fare
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.bucket_minutes = bucket_minutes
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0,
+                       "evictions": 0, "errors": 0}
+
+    def make_key(self, journey_data):
+        """
+        Returns the cache key of a journey: departure and arrival station,
+        departure date rounded down to its bucket, return date (None for
+        singles) and the number of adults and children
+        """
+        if journey_data.get('returning'):
+            return_date = journey_data['return_date']
+        else:
+            return_date = None
+        return (journey_data['depart'], journey_data['arrive'],
+                round_down(journey_data['departure_date'],
+                           self.bucket_minutes),
+                return_date,
+                journey_data.get('no_adults'),
+                journey_data.get('no_children'))
+
+    def get_or_fetch(self, journey_data, fetch):
+        """
+        Returns the cached fare for the journey, calling fetch(journey_data)
+        if there isn't one. Failed fetches are not cached.
+        """
+        key = self.make_key(journey_data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, fare = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return fare
+                del self._entries[key]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            fare = fetch(journey_data)
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, fare)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            del self._in_flight[key]
+        future.set_result(fare)
+        return fare
+
+    def get_stats(self):
+        """Returns the hit, miss, coalesced, eviction and error counts"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = ((stats["hits"] + stats["coalesced"]) / lookups
+                              if lookups else 0.0)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def create_fare_cache():
+    """
+    Builds a FareCache configured by the CHAT_BOT_FARE_CACHE_TTL,
+    CHAT_BOT_FARE_CACHE_SIZE and CHAT_BOT_FARE_CACHE_BUCKET environment
+    variables
+    """
+    return FareCache(float(os.environ.get("CHAT_BOT_FARE_CACHE_TTL", 600)),
+                     int(os.environ.get("CHAT_BOT_FARE_CACHE_SIZE", 256)),
+                     int(os.environ.get("CHAT_BOT_FARE_CACHE_BUCKET", 15)))
+
+
+def cached_fares(cache):
+    """
+    Decorates a scrape(journey_data) function so its results are cached in
+    cache. Calls passing any other argument bypass the cache.
+    """
+    def decorator(scrape):
+        @functools.wraps(scrape)
+        def wrapper(journey_data, *args, **kwargs):
+            if args or kwargs:
+                return scrape(journey_data, *args, **kwargs)
+            return cache.get_or_fetch(journey_data, scrape)
+        wrapper.fare_cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,371 @@
+"""
+fare_fetcher.py
+
+Contains the pooled HTTP session and the targeted extractors used to look
+fares up without a browser, and the choice of fare lookup backend, set for
+every journey by the CHAT_BOT_FARE_OPERATOR environment variable
+"""
+import codecs
+import json
+import os
+import threading
+from html.parser import HTMLParser
+
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (3.05, 15)
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:85.0) Gecko/20100101 " \
+             "Firefox/85.0"
+
+DEFAULT_OPERATOR = os.environ.get("CHAT_BOT_FARE_OPERATOR", "chiltern")
+OPERATOR_NAMES = {
+    "chiltern": "Chiltern Railways by Arriva",
+    "national_rail": "National Rail"
+}
+
+CHUNK_SIZE = 16 * 1024
+# (attribute, value) of the basket spans read by extract_basket. A class
+# matches any one of the classes of the span.
+BASKET_SPANS = (("class", "basket-summary__total--value"),
+                ("data-elid", "from-station"),
+                ("data-elid", "to-station"),
+                ("data-elid", "basket-journey-date"),
+                ("data-elid", "basket-duration-time"),
+                ("data-elid", "basket-journey-changes"))
+
+
+def create_session(pool_size=10, retries=3):
+    """
+    Builds a keep-alive session that reuses up to pool_size connections per
+    host and retries failed GET requests with a backoff
+
+    Parameters
+    ----------
+    pool_size: int
+        The number of connections kept open per host
+    retries: int
+        The number of times a connection error or 5xx response is retried
+    """
+    # requests is only imported by the first fare lookup
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=0.3,
+                  status_forcelist=(500, 502, 503, 504),
+                  allowed_methods=frozenset(["GET"]))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_sessions = threading.local()
+
+
+def get_session():
+    """
+    Returns the HTTP session of the calling thread, sized by the
+    CHAT_BOT_HTTP_POOL_SIZE and CHAT_BOT_HTTP_RETRIES environment variables.
+    Each job worker keeps its own session so their connections stay open
+    between lookups.
+    """
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = create_session(
+            int(os.environ.get("CHAT_BOT_HTTP_POOL_SIZE", 10)),
+            int(os.environ.get("CHAT_BOT_HTTP_RETRIES", 3))
+        )
+        _sessions.session = session
+    return session
+
+
+def fetch(url, session=None, timeout=TIMEOUT):
+    """
+    Returns the body of the page at url
+
+    Raises
+    ------
+    requests.RequestException
+        If the page couldn't be fetched or returned an error status
+    """
+    if session is None:
+        session = get_session()
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.text
+
+
+class _FareFound(Exception):
+    pass
+
+
+class CheapestFareScanner(HTMLParser):
+    """
+    Scans a National Rail times and fares page as it's fed and keeps the
+    contents of the script tag of the cheapest fare ("fare has-cheapest"
+    cell). Feeding stops as soon as that script tag is closed.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.in_cheapest = False
+        self.in_script = False
+        self.script = []
+        self.found = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "td":
+            classes = (dict(attrs).get("class") or "").split()
+            self.in_cheapest = "fare" in classes and "has-cheapest" in classes
+        elif tag == "script" and self.in_cheapest:
+            self.in_script = True
+
+    def handle_data(self, data):
+        if self.in_script:
+            self.script.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self.in_script:
+            self.found = True
+            raise _FareFound()
+        if tag == "td":
+            self.in_cheapest = False
+
+    def feed(self, data):
+        """
+        Feeds the next chunk of the page
+
+        Returns
+        -------
+        bool
+            True once the cheapest fare has been found
+        """
+        if not self.found:
+            try:
+                super().feed(data)
+            except _FareFound:
+                pass
+        return self.found
+
+    def get_fare(self):
+        """
+        Returns the decoded JSON fare breakdown
+
+        Raises
+        ------
+        ValueError
+            If the cheapest fare wasn't found in the page fed so far
+        """
+        if not self.found:
+            raise ValueError("No cheapest fare found")
+        text = "".join(self.script).replace('\00', '').strip()
+        return json.JSONDecoder(strict=False).raw_decode(text)[0]
+
+
+def scan_cheapest_fare(chunks, encoding="utf-8"):
+    """
+    Returns the JSON fare breakdown of the cheapest fare, reading chunks of
+    the page (bytes) only until it has been found
+
+    Returns
+    -------
+    tuple
+        The fare breakdown and the number of bytes read
+
+    Raises
+    ------
+    ValueError
+        If the page has no cheapest fare
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    scanner = CheapestFareScanner()
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        if scanner.feed(decoder.decode(chunk)):
+            break
+    else:
+        scanner.feed(decoder.decode(b"", final=True))
+    return scanner.get_fare(), read
+
+
+def extract_cheapest_fare(page):
+    """
+    Returns the JSON fare breakdown in the script tag of the cheapest fare
+    ("fare has-cheapest" cell) of a National Rail times and fares page
+
+    Raises
+    ------
+    ValueError
+        If the page has no cheapest fare
+    """
+    scanner = CheapestFareScanner()
+    scanner.feed(page)
+    return scanner.get_fare()
+
+
+def fetch_cheapest_fare(url, session=None, timeout=TIMEOUT):
+    """
+    Streams the times and fares page at url and returns its cheapest fare.
+    The connection is released as soon as the fare has been read, without
+    downloading the rest of the page.
+
+    Raises
+    ------
+    requests.RequestException
+        If the page couldn't be fetched or returned an error status
+    ValueError
+        If the page has no cheapest fare
+    """
+    if session is None:
+        session = get_session()
+    with session.get(url, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        # requests assumes ISO-8859-1 when text/html has no charset
+        if "charset" in response.headers.get("Content-Type", ""):
+            encoding = response.encoding
+        else:
+            encoding = "utf-8"
+        fare, _ = scan_cheapest_fare(response.iter_content(CHUNK_SIZE),
+                                     encoding)
+    return fare
+
+
+class BasketScanner(HTMLParser):
+    """
+    Reads the text of the BASKET_SPANS of a Chiltern Railways basket, nested
+    markup included, by the data-elid of the journey leg (ace-journey-leg)
+    they're in. Only the first span of each leg is kept.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.texts = {}
+        self.leg = None
+        self._leg_depth = 0
+        # [key, depth, text parts] of the spans being read
+        self._open = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "ace-journey-leg":
+            if self._leg_depth == 0:
+                self.leg = attrs.get("data-elid")
+            self._leg_depth += 1
+        if tag != "span":
+            return
+        for span in self._open:
+            span[1] += 1
+        for attribute, value in BASKET_SPANS:
+            if attribute == "class":
+                found = value in (attrs.get("class") or "").split()
+            else:
+                found = attrs.get(attribute) == value
+            if found and (self.leg, value) not in self.texts:
+                # Keeps the spans in the order they open
+                self.texts[(self.leg, value)] = None
+                self._open.append([(self.leg, value), 1, []])
+
+    def handle_data(self, data):
+        for span in self._open:
+            span[2].append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "ace-journey-leg" and self._leg_depth:
+            self._leg_depth -= 1
+            if self._leg_depth == 0:
+                self.leg = None
+        if tag != "span":
+            return
+        for span in list(self._open):
+            span[1] -= 1
+            if span[1] == 0:
+                self._open.remove(span)
+                self.texts[span[0]] = "".join(span[2]).strip()
+
+    def span_text(self, value, leg=None):
+        """
+        Returns the text of the span of the leg, or of the first span
+        anywhere in the page when leg is None
+
+        Raises
+        ------
+        ValueError
+            If there's no such span
+        """
+        if leg is not None:
+            text = self.texts.get((leg, value))
+        else:
+            text = next((text for (_, span_value), text in self.texts.items()
+                         if span_value == value and text is not None), None)
+        if text is None:
+            raise ValueError("No {} span found{}".format(
+                value, "" if leg is None else " in " + leg))
+        return text
+
+
+def _leg_str(scanner, leg):
+    date_time = scanner.span_text("basket-journey-date", leg).split(",")
+    return (date_time[0].strip(), date_time[1].split("-")[0].strip(),
+            scanner.span_text("basket-duration-time", leg),
+            scanner.span_text("basket-journey-changes", leg))
+
+
+def extract_basket(page, returning=False):
+    """
+    Pulls the cheapest total price, stations and journey legs out of the
+    basket of a Chiltern Railways search page
+
+    Returns
+    -------
+    list
+        The price, departure station, arrival station and a description of
+        the journey
+
+    Raises
+    ------
+    ValueError
+        If the page has no basket
+    """
+    scanner = BasketScanner()
+    scanner.feed(page)
+    scanner.close()
+
+    returning_str = ""
+    if returning:
+        returning_str = " and return {} at {} (duration: {}, {})".format(
+            *_leg_str(scanner, "basket-return-leg"))
+
+    info_str = (
+        "This service will depart {} at {} (duration: {}, {}){}."
+    ).format(*_leg_str(scanner, "basket-outward-leg"), returning_str)
+
+    return [scanner.span_text("basket-summary__total--value"),
+            scanner.span_text("from-station"),
+            scanner.span_text("to-station"),
+            info_str]
+
+
+def get_fare_backend(operator=None):
+    """
+    Returns the scrape(journey_data) function used to look up fares of the
+    given operator, by default the CHAT_BOT_FARE_OPERATOR one. National Rail
+    pages are fetched over HTTP, Chiltern Railways needs a browser to render
+    the basket.
+
+    Raises
+    ------
+    KeyError
+        If the operator is unknown
+    """
+    from Chat_bot import scraper, scraper_1
+
+    backends = {
+        "chiltern": scraper_1.scrape,
+        "national_rail": scraper.scrape
+    }
+    return backends[operator or DEFAULT_OPERATOR]
@@ -0,0 +1,239 @@
+"""
+jobs.py
+
+Contains the background job queue used to keep slow lookups (e.g. fare
+scraping) off the request thread
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Seconds between the checks of a job running in another worker process
+POLL_SECONDS = 0.25
+# Seconds after which a job another worker hasn't finished is given up on,
+# e.g. because that worker was restarted
+JOB_TIMEOUT = 120
+# Seconds the results of uncollected jobs are kept
+RESULT_TTL = 3600
+
+
+class JobResults:
+    def __init__(self, path):
+        """
+        Keeps the results of jobs in a SQLite file so a job submitted by one
+        worker process can be collected by another
+
+        Parameters
+        ----------
+        path: str
+            The path to the SQLite file holding the results
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS JobResults ("
+                         "job_id TEXT PRIMARY KEY, "
+                         "submitted REAL NOT NULL, "
+                         "done INTEGER NOT NULL DEFAULT 0, "
+                         "failed INTEGER NOT NULL DEFAULT 0, "
+                         "result BLOB)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, job_id):
+        """Records a submitted job and forgets the results of old ones"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM JobResults WHERE submitted < ?",
+                         (now - RESULT_TTL,))
+            conn.execute("INSERT INTO JobResults (job_id, submitted) "
+                         "VALUES (?, ?)", (job_id, now))
+
+    def set(self, job_id, future):
+        """Stores the result, or the exception, of a finished job"""
+        error = future.exception()
+        try:
+            result = pickle.dumps(error if error is not None
+                                  else future.result(),
+                                  protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            error = RuntimeError("Unpicklable job result: {!r}".format(e))
+            result = pickle.dumps(error)
+        with self._connection() as conn:
+            conn.execute("UPDATE JobResults SET done=1, failed=?, result=? "
+                         "WHERE job_id=?",
+                         (error is not None, result, job_id))
+
+    def get(self, job_id):
+        """
+        Returns the state of a job
+
+        Returns
+        -------
+        tuple
+            (submitted, done, failed, result or exception), or None if the
+            job is unknown
+        """
+        row = self._connection().execute(
+            "SELECT submitted, done, failed, result FROM JobResults "
+            "WHERE job_id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        submitted, done, failed, result = row
+        return (submitted, bool(done), bool(failed),
+                pickle.loads(result) if done else None)
+
+    def delete(self, job_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM JobResults WHERE job_id=?", (job_id,))
+
+
+class JobQueue:
+    def __init__(self, max_workers=4, results=None):
+        """
+        Runs jobs on a pool of worker threads and keeps their futures by job
+        ID until the result is collected
+
+        Parameters
+        ----------
+        max_workers: int
+            The number of jobs that can run at the same time
+        results: JobResults
+            If set, the results of the jobs are also stored there so other
+            worker processes can collect them
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="chat-job")
+        self.results = results
+        self._jobs = {}
+        self._submitted = {}
+        self._remote = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs) to run in the background
+
+        Returns
+        -------
+        str
+            The job ID used to collect the result
+        """
+        job_id = uuid.uuid4().hex
+        if self.results is not None:
+            self.results.add(job_id)
+        future = self._executor.submit(fn, *args, **kwargs)
+        now = time.time()
+        with self._lock:
+            self._forget_old_jobs(now)
+            self._jobs[job_id] = future
+            self._submitted[job_id] = now
+        if self.results is not None:
+            future.add_done_callback(
+                lambda done: self.results.set(job_id, done))
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns the Future of the job, or None if the job is unknown (or
+        already collected). Jobs submitted by another worker process are
+        followed through the shared results.
+        """
+        with self._lock:
+            future = self._jobs.get(job_id) or self._remote.get(job_id)
+        if future is not None or self.results is None:
+            return future
+        state = self.results.get(job_id)
+        if state is None:
+            return None
+        with self._lock:
+            future = self._remote.get(job_id)
+            if future is None:
+                self._forget_old_jobs(time.time())
+                future = self._remote[job_id] = Future()
+                self._submitted[job_id] = state[0]
+                threading.Thread(target=self._follow, args=(job_id, future),
+                                 name="chat-job-follow", daemon=True).start()
+        return future
+
+    def _forget_old_jobs(self, now):
+        """
+        Forgets the finished jobs, and followed jobs of other workers,
+        submitted more than RESULT_TTL seconds ago. Their sessions moved to
+        another worker so they're never collected here. Called with the lock
+        held.
+        """
+        for old_id, submitted in list(self._submitted.items()):
+            future = self._jobs.get(old_id) or self._remote.get(old_id)
+            if submitted < now - RESULT_TTL and future.done():
+                self._jobs.pop(old_id, None)
+                self._remote.pop(old_id, None)
+                del self._submitted[old_id]
+
+    def _follow(self, job_id, future):
+        """Completes future once the job of another worker has finished"""
+        while True:
+            state = self.results.get(job_id)
+            if state is None:
+                future.set_exception(LookupError(job_id))
+                return
+            submitted, done, failed, result = state
+            if done:
+                if failed:
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                return
+            if time.time() - submitted > JOB_TIMEOUT:
+                future.set_exception(TimeoutError(
+                    "Job {} didn't finish in {} seconds".format(
+                        job_id, JOB_TIMEOUT)))
+                return
+            time.sleep(POLL_SECONDS)
+
+    def discard(self, job_id):
+        """Forgets a job once its result has been collected"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._submitted.pop(job_id, None)
+            self._remote.pop(job_id, None)
+        if self.results is not None:
+            self.results.delete(job_id)
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for future in self._jobs.values()
+                       if not future.done())
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Returns the process wide job queue, sized by the CHAT_BOT_JOB_WORKERS
+    environment variable. With the SQLite session backend the results are
+    kept in CHAT_BOT_SESSION_DB, next to the sessions, so whichever worker
+    a session's next request reaches can collect them.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            results = None
+            if os.environ.get("CHAT_BOT_SESSION_BACKEND") == "sqlite":
+                results = JobResults(os.environ.get("CHAT_BOT_SESSION_DB",
+                                                    "Chat_bot_sessions.db"))
+            _job_queue = JobQueue(int(os.environ.get("CHAT_BOT_JOB_WORKERS",
+                                                     4)), results)
+        return _job_queue
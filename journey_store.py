@@ -0,0 +1,235 @@
+"""
+journey_store.py
+
+Columnar store of the Darwin train movement data used for delay predictions.
+
+The CSV files (e.g. NRCH_LIVST_OD_a51_2019_2_2.csv) are ingested once into one
+NumPy array per column, saved as .npy files that are memory mapped when
+loaded. Times are stored as seconds since midnight (-1 when missing) and
+station tpls are dictionary encoded.
+
+Usage: python journey_store.py store_directory csv_file [csv_file ...]
+"""
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+JOURNEY_STORE_DIR = os.environ.get(
+    "CHAT_BOT_JOURNEY_STORE",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "journeys")
+)
+
+TIME_COLUMNS = ("pta", "ptd", "arr_at", "dep_at")
+ARRAY_COLUMNS = ("rid", "tpl") + TIME_COLUMNS
+
+
+def time_to_seconds(time_text):
+    """
+    Converts a HH:MM or HH:MM:SS time to seconds since midnight
+
+    Parameters
+    ----------
+    time_text: str
+        The time from the CSV
+
+    Returns
+    -------
+    int
+        The number of seconds since midnight, or -1 if there is no time
+    """
+    if not time_text:
+        return -1
+    parts = time_text.split(":")
+    seconds = int(parts[0]) * 3600 + int(parts[1]) * 60
+    if len(parts) > 2:
+        seconds += int(parts[2])
+    return seconds
+
+
+def seconds_to_time(seconds):
+    """Converts seconds since midnight back to HH:MM, or '' if missing"""
+    if seconds < 0:
+        return ""
+    return "{:02d}:{:02d}".format(int(seconds) // 3600,
+                                  int(seconds) % 3600 // 60)
+
+
+class JourneyStore:
+    def __init__(self, columns, tpl_names):
+        """
+        Indexes the columns of the journey data
+
+        Parameters
+        ----------
+        columns: dict
+            rid, tpl, pta, ptd, arr_at and dep_at arrays of equal length,
+            sorted by rid
+        tpl_names: list of str
+            The tpl of each tpl code
+        """
+        self.columns = columns
+        self.tpl_names = list(tpl_names)
+        self.tpl_codes = {tpl: code for code, tpl in enumerate(self.tpl_names)}
+
+        # rid -> rows [rid_offsets[i], rid_offsets[i + 1])
+        self.rids, rid_starts = np.unique(columns["rid"], return_index=True)
+        self.rid_offsets = np.append(rid_starts, len(columns["rid"]))
+
+        # tpl code -> rows tpl_order[tpl_offsets[c]:tpl_offsets[c + 1]],
+        # sorted by rid within each tpl
+        self.tpl_order = np.lexsort((columns["rid"], columns["tpl"]))
+        self.tpl_offsets = np.searchsorted(columns["tpl"][self.tpl_order],
+                                           np.arange(len(self.tpl_names) + 1))
+
+    def __len__(self):
+        return len(self.columns["rid"])
+
+    @classmethod
+    def from_csv(cls, paths):
+        """
+        Builds a store from one or more Darwin CSV files
+
+        Parameters
+        ----------
+        paths: list of str
+            The CSV files to ingest
+
+        Returns
+        -------
+        JourneyStore
+        """
+        tpl_codes = {}
+        values = {column: [] for column in ARRAY_COLUMNS}
+        for path in paths:
+            with open(path, newline="") as csv_file:
+                for row in csv.DictReader(csv_file):
+                    values["rid"].append(int(row["rid"]))
+                    values["tpl"].append(tpl_codes.setdefault(row["tpl"],
+                                                              len(tpl_codes)))
+                    for column in TIME_COLUMNS:
+                        values[column].append(time_to_seconds(row[column]))
+        columns = {"rid": np.array(values["rid"], dtype=np.int64),
+                   "tpl": np.array(values["tpl"], dtype=np.int32)}
+        for column in TIME_COLUMNS:
+            columns[column] = np.array(values[column], dtype=np.int32)
+        order = np.argsort(columns["rid"], kind="stable")
+        columns = {column: array[order] for column, array in columns.items()}
+        return cls(columns, sorted(tpl_codes, key=tpl_codes.get))
+
+    def save(self, directory):
+        """Saves every column as a .npy file in directory"""
+        os.makedirs(directory, exist_ok=True)
+        for column in ARRAY_COLUMNS:
+            np.save(os.path.join(directory, column + ".npy"),
+                    self.columns[column])
+        with open(os.path.join(directory, "tpl.json"), "w") as tpl_file:
+            json.dump(self.tpl_names, tpl_file)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Loads a store saved in directory, memory mapping the columns"""
+        columns = {column: np.load(os.path.join(directory, column + ".npy"),
+                                   mmap_mode=mmap_mode)
+                   for column in ARRAY_COLUMNS}
+        with open(os.path.join(directory, "tpl.json")) as tpl_file:
+            tpl_names = json.load(tpl_file)
+        return cls(columns, tpl_names)
+
+    def get_rid_rows(self, rid):
+        """Returns the slice of rows belonging to the journey rid"""
+        i = np.searchsorted(self.rids, rid)
+        if i == len(self.rids) or self.rids[i] != rid:
+            return slice(0, 0)
+        return slice(self.rid_offsets[i], self.rid_offsets[i + 1])
+
+    def get_tpl_rows(self, tpl):
+        """Returns the row numbers calling at tpl, sorted by rid"""
+        code = self.tpl_codes.get(tpl)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self.tpl_order[
+            self.tpl_offsets[code]:self.tpl_offsets[code + 1]]
+
+    def get_pair(self, departure_station, arrival_station):
+        """
+        Returns the journeys calling at both departure_station and
+        arrival_station, as harvested by Predictions.harvest_data
+
+        Parameters
+        ----------
+        departure_station: str
+            The departure tpl
+        arrival_station: str
+            The arrival tpl
+
+        Returns
+        -------
+        dict
+            rid, ptd, dep_at (at departure_station) and pta, arr_at (at
+            arrival_station) arrays, sorted by rid. Like the join, a journey
+            calling at a station more than once has a row for every
+            combination of its calls.
+        """
+        from_rows = self.get_tpl_rows(departure_station)
+        to_rows = self.get_tpl_rows(arrival_station)
+        from_rids = self.columns["rid"][from_rows]
+        to_rids = self.columns["rid"][to_rows]
+        rids = np.intersect1d(from_rids, to_rids)
+        # The calls of each journey at each station, as [start, end) ranges
+        # of from_rows and to_rows (both sorted by rid)
+        from_start = np.searchsorted(from_rids, rids, "left")
+        from_count = np.searchsorted(from_rids, rids, "right") - from_start
+        to_start = np.searchsorted(to_rids, rids, "left")
+        to_count = np.searchsorted(to_rids, rids, "right") - to_start
+        pairs = from_count * to_count
+        journey = np.repeat(np.arange(len(rids)), pairs)
+        pair = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs,
+                                                  pairs)
+        from_rows = from_rows[from_start[journey] +
+                              pair // to_count[journey]]
+        to_rows = to_rows[to_start[journey] + pair % to_count[journey]]
+        return {"rid": rids[journey],
+                "ptd": self.columns["ptd"][from_rows],
+                "dep_at": self.columns["dep_at"][from_rows],
+                "pta": self.columns["pta"][to_rows],
+                "arr_at": self.columns["arr_at"][to_rows]}
+
+    def get_pair_rows(self, departure_station, arrival_station):
+        """
+        Returns the journeys calling at both stations in the row format of
+        Predictions.harvest_data: (rid, tpl_FROM, ptd, dep_at, tpl_TO, pta,
+        arr_at) with the times as HH:MM
+        """
+        pair = self.get_pair(departure_station, arrival_station)
+        return [(int(pair["rid"][i]), departure_station,
+                 seconds_to_time(pair["ptd"][i]),
+                 seconds_to_time(pair["dep_at"][i]),
+                 arrival_station,
+                 seconds_to_time(pair["pta"][i]),
+                 seconds_to_time(pair["arr_at"][i]))
+                for i in range(len(pair["rid"]))]
+
+
+_journey_store = None
+
+
+def get_journey_store():
+    """
+    Returns the journey store saved in JOURNEY_STORE_DIR, or None if no
+    store has been ingested
+    """
+    global _journey_store
+    if _journey_store is None and os.path.exists(
+            os.path.join(JOURNEY_STORE_DIR, "tpl.json")):
+        _journey_store = JourneyStore.load(JOURNEY_STORE_DIR)
+    return _journey_store
+
+
+if __name__ == '__main__':
+    store = JourneyStore.from_csv(sys.argv[2:])
+    store.save(sys.argv[1])
+    print("Ingested {} rows for {} journeys".format(len(store),
+                                                    len(store.rids)))
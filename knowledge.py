@@ -0,0 +1,77 @@
+"""
+knowledge.py
+
+Contains the compact store of what the chat engine knows about a journey
+"""
+from collections.abc import MutableMapping
+
+_MISSING = object()
+
+
+class Knowledge(MutableMapping):
+    """
+    The knowledge of a ChatEngine. The facts the rules declare are kept in
+    slots rather than a per-session dict. Any other key is kept in a small
+    dict that's only created when one is set.
+
+    It's used like the dict it replaces: a key is missing until it's set.
+    """
+    __slots__ = ("action", "complete", "depart", "arrive", "departure_date",
+                 "return_date", "returning", "no_adults", "no_children",
+                 "departure_delay", "final_message_sent",
+                 "delay_time_received", "can_produce_ending", "_extra")
+
+    FIELDS = __slots__[:-1]
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, knowledge=()):
+        self._extra = None
+        self.update(knowledge)
+
+    def __getitem__(self, key):
+        if key in Knowledge._FIELD_SET:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in Knowledge._FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in Knowledge._FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in Knowledge.FIELDS:
+            if getattr(self, key, _MISSING) is not _MISSING:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return "Knowledge({!r})".format(dict(self))
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
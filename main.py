@@ -1,21 +1,59 @@
 import datetime
+import json
 import os
 import sys
+import threading
+import time
 
-from flask import Flask, jsonify, render_template, request
+from flask import (Flask, Response, jsonify, render_template, request,
+                   stream_with_context)
 
 
 from Chat_bot import StationNotFoundError
 
 
 from Chat_bot.Chat import Chat
+from Chat_bot.Chat_bot import warm_up
+from Chat_bot.browser_pool import get_browser_pool
+from Chat_bot.jobs import get_job_queue
+from Chat_bot.metrics import ERRORS, REQUEST_SECONDS, registry
+from Chat_bot.sessions import SQLiteBackend, create_session_store
+from Chat_bot.stations import get_station_index
 
 app = Flask(__name__, template_folder='templates')
 app.config.update(
     DEBUG=True,
     TEMPLATES_AUTO_RELOAD=True
 )
-this_chat = None
+SESSION_COOKIE = "chat_session"
+GREETING = ("Hi! I'm your Chat_Bot, I can help you booking your train tickets "
+            "in a smart way Lets go !")
+EXPIRED_MESSAGE = ["Sorry! This chat has expired, please reload the page to "
+                   "start a new chat.", ["Reload Page"], True]
+ERROR_MESSAGE = ["Sorry! There has been some issue with this chat, please "
+                 "reload the page to start a new chat.", ["Reload Page"], True]
+sessions = create_session_store()
+registry.gauge("chat_sessions", "Number of live chat sessions",
+               lambda: len(sessions),
+               # Every worker sees all the sessions of a shared SQLite file
+               "max" if isinstance(sessions.backend, SQLiteBackend) else "sum")
+registry.gauge("chat_fare_jobs", "Number of fare lookups queued or running",
+               lambda: len(get_job_queue()))
+
+
+def warm_up_worker():
+    """Loads the spaCy pipeline and the stations ahead of the first chat"""
+    warm_up()
+    get_station_index()
+
+
+if os.environ.get("CHAT_BOT_WARM_UP", "true") == "true":
+    # Warm up in the background so the worker accepts requests straight
+    # away, a chat started before it's done waits for what it needs to load
+    threading.Thread(target=warm_up_worker, daemon=True).start()
+if os.environ.get("CHAT_BOT_BROWSER_PREWARM", "true") == "true":
+    # Start the fare lookup browsers without holding up the first request
+    threading.Thread(target=get_browser_pool().start, daemon=True).start()
 
 
 @app.route('/')
@@ -28,42 +66,124 @@ def chat():
     return render_template('chatbot_ui.html')
 
 
-@app.route('/chat', methods=["POST"])
-def process_user_input():
-    global this_chat
+def new_chat():
+    """
+    Starts a chat with the greeting
+
+    Returns
+    -------
+    tuple
+        The new session ID, the Chat and the greeting message
+    """
+    this_chat = Chat()
+    this_chat.add_message("bot", GREETING, datetime.datetime.now())
+    return (sessions.new_session_id(), this_chat,
+            [GREETING, ['Book a ticket', 'Delay prediction'], True])
 
-    user_input = request.form['user_input']
-    is_system = request.form['is_system']
 
+def chat_turn(this_chat, user_input):
+    """Runs the engine on the user's message and returns the reply"""
+    try:
+        return this_chat.add_message("human", user_input,
+                                     datetime.datetime.now())
+    except Exception as e:
+        print(e)
+        ERRORS.inc(stage="turn")
+        return ERROR_MESSAGE
+
+
+def request_kind(user_input, is_system, this_chat):
+    """Returns the kind of a /chat request, as reported in the metrics"""
     if user_input == "":
-        response = ("Hi! I'm your Chat_Bot, I can help you booking your train tickets in a smart way "
-                    "Lets go !")
-        this_chat = Chat()
-        this_chat.add_message("bot", response, datetime.datetime.now())
-        suggestions = ['Book a ticket', 'Delay prediction']
-        response_req = True
+        return "new_chat"
+    elif this_chat is None:
+        return "expired"
     elif user_input == "POPMSG" and is_system == "true":
+        return "popmsg"
+    return "message"
+
+
+@app.route('/chat', methods=["POST"])
+def process_user_input():
+    start = time.perf_counter()
+    user_input = request.form['user_input']
+    is_system = request.form['is_system']
+    session_id = request.cookies.get(SESSION_COOKIE)
+    this_chat = sessions.get(session_id)
+
+    kind = request_kind(user_input, is_system, this_chat)
+    if kind == "new_chat":
+        if session_id:
+            # The page was reloaded, the old chat can't be resumed
+            sessions.delete(session_id)
+        session_id, this_chat, message = new_chat()
+    elif kind == "expired":
+        message = EXPIRED_MESSAGE
+    elif kind == "popmsg":
         message = this_chat.pop_message()
-        response = message[0]
-        suggestions = message[1]
-        response_req = message[2]
     else:
-        try:
-            message = this_chat.add_message("human",
-                                            user_input,
-                                            datetime.datetime.now())
-        except Exception as e:
-            print(e)
-            message = ["Sorry! There has been some issue with this chat, please "
-                       "reload the page to start a new chat.", ["Reload Page"],
-                       True]
-        response = message[0]
-        suggestions = message[1]
-        response_req = message[2]
+        message = chat_turn(this_chat, user_input)
+    response = message[0]
+    suggestions = message[1]
+    response_req = message[2]
+    if this_chat is not None:
+        sessions.save(session_id, this_chat)
     print(response, suggestions, response_req)
-    return jsonify({"message": response,
-                    "suggestions": suggestions,
-                    "response_req": response_req})
+    response = jsonify({"message": response,
+                        "suggestions": suggestions,
+                        "response_req": response_req})
+    response.set_cookie(SESSION_COOKIE, session_id or "", httponly=True,
+                        samesite="Lax")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind)
+    return response
+
+
+def format_event(message):
+    """Formats a message as a server-sent event"""
+    return "data: {}\n\n".format(json.dumps({"message": message[0],
+                                              "suggestions": message[1],
+                                              "response_req": message[2]}))
+
+
+def stream_messages(session_id, this_chat):
+    """
+    Yields the queued bot messages as server-sent events until one needs a
+    response from the user. Fare lookups in progress are waited for with
+    keep-alive comments in between.
+    """
+    while True:
+        message = this_chat.pop_message()
+        sessions.save(session_id, this_chat)
+        if message[0] == "{WAIT}":
+            yield ": waiting\n\n"
+            continue
+        yield format_event(message)
+        if message[2] is not False:
+            return
+
+
+@app.route('/chat/stream')
+def stream_user_messages():
+    """
+    Streams the messages the frontend would otherwise fetch one at a time
+    with POPMSG
+    """
+    session_id = request.cookies.get(SESSION_COOKIE)
+    this_chat = sessions.get(session_id)
+    if this_chat is None:
+        events = [format_event(EXPIRED_MESSAGE)]
+    else:
+        events = stream_with_context(stream_messages(session_id, this_chat))
+    return Response(events, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@app.route('/metrics')
+def metrics():
+    """The metrics of every worker in the Prometheus text format"""
+    return Response(registry.render(),
+                    content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 if __name__ == '__main__':
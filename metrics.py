@@ -0,0 +1,402 @@
+"""
+metrics.py
+
+Contains the counters, histograms and gauges of the chat and their export in
+the Prometheus text format, served at /metrics.
+
+With several worker processes, set CHAT_BOT_METRICS_DIR to a directory they
+share (emptied before the workers start). Every process writes its metrics
+to <pid>-<start time>.json in it within FLUSH_SECONDS of a change, and
+/metrics adds up the files of every process, so it reports the same totals
+whichever worker answers it. The files of exited processes are kept so the
+counters never go backwards.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get("CHAT_BOT_METRICS_DIR")
+# Seconds between the writes of a process' metrics file
+FLUSH_SECONDS = 1.0
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    labels = list(label_key) + list(extra)
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(
+        name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, registry, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._registry = registry
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.changed()
+
+    def snapshot(self):
+        return [[list(key), value] for key, value in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, registry, name, documentation,
+                 buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._registry = registry
+        # label key -> [bucket counts, sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._registry.lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+        self._registry.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the seconds taken by the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, fn, **labels):
+        """Returns fn, observing the seconds each call takes"""
+        def timed_fn(*args, **kwargs):
+            with self.time(**labels):
+                return fn(*args, **kwargs)
+        return timed_fn
+
+    def snapshot(self):
+        return [[list(key), list(counts), total, count]
+                for key, (counts, total, count) in self._values.items()]
+
+
+class Gauge:
+    def __init__(self, name, documentation, function, multiprocess="sum"):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.multiprocess = multiprocess
+
+
+def _process_start(pid):
+    """
+    Returns the start time of the process in clock ticks since boot, or None
+    if it isn't running or /proc isn't available
+    """
+    try:
+        with open("/proc/{}/stat".format(pid)) as stat:
+            # The command name in parentheses may contain spaces
+            return stat.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _is_running(pid, start):
+    """
+    Whether the process that wrote the metrics file of pid and start is
+    still running, rather than exited or replaced by a process reusing its
+    PID
+    """
+    running_start = _process_start(pid)
+    if running_start is not None:
+        return running_start == start
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Without /proc a reused PID can't be told apart
+    return True
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR, flush_seconds=FLUSH_SECONDS):
+        """
+        Holds the metrics of a process
+
+        Parameters
+        ----------
+        directory: str
+            The directory the metrics of every worker process are written to,
+            or None to only report this process' metrics
+        flush_seconds: float
+            The number of seconds between the checks of the thread writing
+            this process' metrics file when they've changed
+        """
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self._metrics = {}
+        self._gauges = {}
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        # PID the file name and the flushing thread belong to, they're
+        # replaced in forked processes
+        self._pid = None
+        self._file_name = None
+
+    def counter(self, name, documentation):
+        return self._metrics.setdefault(
+            name, Counter(self, name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._metrics.setdefault(
+            name, Histogram(self, name, documentation, buckets))
+
+    def gauge(self, name, documentation, function, multiprocess="sum"):
+        """
+        Registers a gauge whose value is function(), called when the metrics
+        are collected
+
+        Parameters
+        ----------
+        multiprocess: str
+            How the values of the live worker processes are combined: "sum"
+            for values each process holds its own share of (e.g. in memory
+            sessions), "max" for values every process sees whole (e.g.
+            sessions in a shared SQLite file)
+        """
+        gauge = Gauge(name, documentation, function, multiprocess)
+        self._gauges[name] = gauge
+        return gauge
+
+    def changed(self):
+        if not self.directory:
+            return
+        self._dirty = True
+        # Requests never write the file, the flushing thread (or /metrics)
+        # does
+        if self._pid != os.getpid():
+            self._start_process()
+
+    def _start_process(self):
+        """
+        Names the metrics file of this process and starts the thread writing
+        the changes made since the last flush
+        """
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            pid = os.getpid()
+            start = (_process_start(pid) or
+                     "t{}".format(int(time.time() * 1000)))
+            self._file_name = "{}-{}.json".format(pid, start)
+            self._pid = pid
+        threading.Thread(target=self._flush_changes, name="metrics-flush",
+                         daemon=True).start()
+
+    def _flush_changes(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            if self._dirty:
+                self._try_flush()
+
+    def _try_flush(self):
+        try:
+            self.flush()
+        except OSError:
+            # Metrics mustn't stop the flushing thread, they're written
+            # again on its next check
+            self._dirty = True
+
+    def snapshot(self):
+        """Returns the metrics of this process as a JSON serializable dict"""
+        gauges = {}
+        for name, gauge in self._gauges.items():
+            try:
+                gauges[name] = gauge.function()
+            except Exception:
+                # A gauge that can't be read is left out rather than failing
+                # the request that triggered the flush
+                pass
+        with self.lock:
+            return {
+                "metrics": {name: metric.snapshot()
+                            for name, metric in self._metrics.items()},
+                "gauges": gauges
+            }
+
+    def flush(self):
+        """Writes this process' metrics to <directory>/<pid>-<start>.json"""
+        if self._pid != os.getpid():
+            self._start_process()
+        if not self._flush_lock.acquire(blocking=False):
+            # Another thread is writing them already
+            self._dirty = True
+            return
+        try:
+            self._dirty = False
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._file_name)
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as metrics_file:
+                json.dump(self.snapshot(), metrics_file)
+            os.replace(temp_path, path)
+        finally:
+            self._flush_lock.release()
+
+    def _snapshots(self):
+        """
+        Returns the snapshots of every process by file name and the file
+        names of the processes that are still running
+        """
+        if not self.directory:
+            return {None: self.snapshot()}, {None}
+        self.flush()
+        snapshots = {}
+        running = set()
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                pid, start = file_name[:-5].split("-", 1)
+                with open(os.path.join(self.directory, file_name)) as file:
+                    snapshots[file_name] = json.load(file)
+                if _is_running(int(pid), start):
+                    running.add(file_name)
+            except (OSError, ValueError):
+                continue
+        return snapshots, running
+
+    def collect(self):
+        """
+        Returns the metrics added up over every process
+
+        Returns
+        -------
+        dict
+            Counter values and histogram series by metric name and label key,
+            and gauge values by name
+        """
+        snapshots, running = self._snapshots()
+        values = {name: {} for name in self._metrics}
+        gauges = {}
+        for process, snapshot in snapshots.items():
+            for name, series in snapshot["metrics"].items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                for entry in series:
+                    key = tuple(tuple(label) for label in entry[0])
+                    if isinstance(metric, Counter):
+                        values[name][key] = (values[name].get(key, 0) +
+                                             entry[1])
+                        continue
+                    counts, total, count = values[name].get(
+                        key, ([0] * len(metric.buckets), 0.0, 0))
+                    values[name][key] = (
+                        [a + b for a, b in zip(counts, entry[1])],
+                        total + entry[2], count + entry[3])
+            if process not in running:
+                continue
+            for name, value in snapshot["gauges"].items():
+                gauge = self._gauges.get(name)
+                if gauge is None:
+                    continue
+                if name not in gauges:
+                    gauges[name] = value
+                elif gauge.multiprocess == "max":
+                    gauges[name] = max(gauges[name], value)
+                else:
+                    gauges[name] += value
+        return {"metrics": values, "gauges": gauges}
+
+    def render(self):
+        """Returns the metrics of every process in the Prometheus format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append("# HELP {} {}".format(name, metric.documentation))
+            series = collected["metrics"][name]
+            if isinstance(metric, Counter):
+                lines.append("# TYPE {} counter".format(name))
+                for key, value in sorted(series.items()):
+                    lines.append("{}{} {}".format(name, _format_labels(key),
+                                                  _format_value(value)))
+                continue
+            lines.append("# TYPE {} histogram".format(name))
+            for key, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append("{}_bucket{} {}".format(
+                        name, _format_labels(key, [("le", bound)]),
+                        cumulative))
+                lines.append("{}_bucket{} {}".format(
+                    name, _format_labels(key, [("le", "+Inf")]), count))
+                lines.append("{}_sum{} {}".format(
+                    name, _format_labels(key), _format_value(total)))
+                lines.append("{}_count{} {}".format(
+                    name, _format_labels(key), count))
+        for name, gauge in self._gauges.items():
+            if name not in collected["gauges"]:
+                continue
+            lines.append("# HELP {} {}".format(name, gauge.documentation))
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{} {}".format(
+                name, _format_value(collected["gauges"][name])))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+if registry.directory:
+    atexit.register(registry.flush)
+
+REQUEST_SECONDS = registry.histogram(
+    "chat_request_seconds",
+    "Seconds taken to answer a /chat request, by kind (new_chat, message, "
+    "popmsg, expired)")
+ERRORS = registry.counter(
+    "chat_errors_total",
+    "Errors answered with an apology, by stage (turn, scrape, prediction)")
+NLP_SECONDS = registry.histogram(
+    "chat_nlp_seconds", "Seconds spaCy took to parse a message")
+DB_QUERY_SECONDS = registry.histogram(
+    "chat_db_query_seconds", "Seconds taken by a Chat_bot.db query")
+SCRAPE_SECONDS = registry.histogram(
+    "chat_scrape_seconds", "Seconds taken by a fare lookup, by operator")
+PREDICTION_SECONDS = registry.histogram(
+    "chat_prediction_seconds", "Seconds taken by a delay prediction")
+
+
+def db_query_hook(query, params, seconds, rows):
+    """ConnectionPool hook observing the time of every query"""
+    DB_QUERY_SECONDS.observe(seconds)
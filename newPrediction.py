@@ -12,12 +12,16 @@ from sklearn.neural_network import MLPRegressor
 from datetime import datetime
 from difflib import SequenceMatcher
 
-from Database.DatabaseConnector import DBConnection
+from Chat_bot.db_migrations import get_od_pair
+from Chat_bot.db_pool import get_db_pool
+from Chat_bot.journey_store import get_journey_store
+from Chat_bot.delay_features import (FEATURE_COLUMNS, build_features,
+                                     feature_matrix, rows_to_columns)
+from Chat_bot.delay_models import get_model_store
 
 
 class Predictions:
     def __init__(self):
-        self.db_connection = DBConnection('Chat_bot.db')
         self.stations = {
             "norwich": "NRCH",
             "diss": "DISS",
@@ -84,19 +88,24 @@ class Predictions:
     def harvest_data(self):
         """
         Pulls all journeys from DB that have FROM and TO station and don't have
-        null values as arrival/departure times
+        null values as arrival/departure times. If the CSV data has been
+        ingested into a journey store the journeys are read from there instead
         """
+        journey_store = get_journey_store()
+        if journey_store is not None:
+            return journey_store.get_pair_rows(self.departure_station,
+                                               self.arrival_station)
+
         query = """
             SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
                 (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at 
-                 FROM main.Data WHERE tpl = '{0}') AS x JOIN
+                 FROM main.Data WHERE tpl = ?) AS x JOIN
                 (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data 
-                 WHERE tpl = '{1}') AS y on x.rid_FROM = y.rid_TO 
-                ORDER BY rid_FROM """.format(self.departure_station,
-                                             self.arrival_station)
+                 WHERE tpl = ?) AS y on x.rid_FROM = y.rid_TO 
+                ORDER BY rid_FROM """
 
-        result = self.db_connection.send_query(query).fetchall()
-        return result
+        return get_db_pool().query(query, (self.departure_station,
+                                           self.arrival_station))
 
     @staticmethod
     def convert_time(time):
@@ -193,6 +202,21 @@ class Predictions:
 
         return rush_hour
 
+    def harvest_columns(self):
+        """
+        Returns the journeys between the FROM and TO stations as columns of
+        seconds since midnight (-1 when missing), read from the journey store
+        if one has been ingested, or else from OD_Journeys if it's been built
+        """
+        journey_store = get_journey_store()
+        if journey_store is not None:
+            return journey_store.get_pair(self.departure_station,
+                                          self.arrival_station)
+        columns = get_od_pair(self.departure_station, self.arrival_station)
+        if columns is not None:
+            return columns
+        return rows_to_columns(self.harvest_data())
+
     def prepare_datasets(self):
         """
         Queries data with FROM and TO stations and distributes values 
@@ -200,91 +224,63 @@ class Predictions:
 
         Returns
         -------
-        data - List of all data necessary for predictions
+        data - Array of all data necessary for predictions, one row per
+            journey with the columns in FEATURE_COLUMNS
         """
-        result = self.harvest_data()
-        data = []
-
-        for journey in range(len(result)):
-            #   public_departure      |       actual_departure 
-            if (result[journey][2] != '' and result[journey][3] != '' and
-                    # public_arrival      |       actual_arrival
-                    result[journey][5] != '' and result[journey][6] != ''):
-                # Get date based on RID
-                rid = str(result[journey][0])
-                # Convert date to day of the week
-                day_of_week = datetime(int(rid[:4]), int(rid[4:6]),
-                                       int(rid[6:8])).weekday()
-                hour_of_day = int(result[journey][3].split(":")[0])
-                minute_of_day = int(result[journey][3].split(":")[1])
-                # Get day of week based on RID - Monday = 0, Sunday = 6
-                weekend = self.is_weekend(day_of_week)
-                # Checking morning/midday/evening/night
-                day_segment = self.check_day_segment(hour_of_day)
-                # Checking rush hour or not
-                rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
-                try:
-                    # Departing time  in seconds
-                    time_dep = (datetime.strptime(result[journey][3], '%H:%M') -
-                                datetime(1900, 1, 1)).total_seconds()
-                except:
-                    print("Unable to get time_dep")
-                try:
-                    # Delay : actual departure - public timetable departure in seconds
-                    journey_delay = ((datetime.strptime(result[journey][3],
-                                                        '%H:%M') -
-                                      datetime(1900, 1, 1)).total_seconds() -
-                                     (datetime.strptime(result[journey][2],
-                                                        '%H:%M') -
-                                      datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get journey_delay")
-                try:
-                    # Arrival : actual arrival - public timetable arrival in seonds
-                    time_arr = ((datetime.strptime(result[journey][6],
-                                                   '%H:%M') -
-                                 datetime(1900, 1, 1)).total_seconds() -
-                                (datetime.strptime(result[journey][5],
-                                                   '%H:%M') -
-                                 datetime(1900, 1, 1)).total_seconds())
-                except:
-                    print("Unable to get  time_arrival")
-
-                # Add all above into dataset used for prediction
-                data.append([rid, time_dep, journey_delay, day_of_week,
-                             weekend, day_segment, rush_hour, time_arr])
-
-        return data
-
-    def predict(self, data):
+        return feature_matrix(build_features(self.harvest_columns()))
+
+    @staticmethod
+    def fit(data):
         """
-        Predicts how long the user will be delayed using nearest neighbours
-            model.
-        
+        Fits the delay model on the prepared journeys
+
         Parameters
         ----------
-        data - List of all data needed for predicting
+        data - Array of all data returned by prepare_datasets
 
         Returns
         -------
-        prediction - list  of time how long the user will be delayed.
+        clf - RandomForestRegressor fitted on the journeys
         """
-        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
-            1900, 1, 1)).total_seconds()
-        delay_s = int(self.delay) * 60
-        journeys = pd.DataFrame(data, columns=["rid", "time_dep",
-                                               "delay", "day_of_week",
-                                               "weekend",
-                                               "day_segment", "rush_hour",
-                                               "arrival_time"])
+        journeys = pd.DataFrame(data, columns=FEATURE_COLUMNS)
 
         X = journeys.drop(['rid', 'arrival_time'], axis=1)
         y = journeys['arrival_time'].values
-        
-
 
         clf = RandomForestRegressor(n_estimators = 100)
         clf.fit(X, y)
+        return clf
+
+    def predict(self, data=None):
+        """
+        Predicts how long the user will be delayed using the pre-trained
+        model for the station pair. If no model has been trained for the pair
+        one is fitted on the spot and saved to the model store.
+        
+        Parameters
+        ----------
+        data - List of all data needed for predicting, only used when there
+            is no stored model for the station pair
+
+        Returns
+        -------
+        prediction - list  of time how long the user will be delayed.
+        """
+        dep_time_s = (datetime.strptime(self.exp_dep, '%H:%M') - datetime(
+            1900, 1, 1)).total_seconds()
+        delay_s = int(self.delay) * 60
+
+        store = get_model_store()
+        clf = store.load(self.departure_station, self.arrival_station)
+        if clf is None:
+            if data is None:
+                data = self.prepare_datasets()
+            clf = self.fit(data)
+            try:
+                # The next prediction for the pair loads it instead
+                store.save(self.departure_station, self.arrival_station, clf)
+            except OSError as e:
+                print("Couldn't save the delay model: {}".format(e))
 
         prediction = clf.predict([[dep_time_s, delay_s, self.day_of_week, self.weekend, 
                                             self.segment_of_day, self.rush_hour]])
@@ -322,9 +318,7 @@ class Predictions:
         self.segment_of_day = self.check_day_segment(hour_of_day)
         self.rush_hour = self.is_rush_hour(hour_of_day, minute_of_day)
 
-        data = self.prepare_datasets()
-
-        prediction = self.predict(data)
+        prediction = self.predict()
 
         return ("The total delay of your journey will be " + str(
             prediction[1]).zfill(2) +
@@ -0,0 +1,210 @@
+"""
+rule_profiler.py
+
+Contains the opt-in profiler of the rules fired by a ChatEngine
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Path of the JSON lines file every profiled turn is appended to
+RULE_PROFILE_PATH = os.environ.get("CHAT_BOT_RULE_PROFILE")
+
+# Number of turns kept in memory per profiler
+RULE_PROFILE_TURNS = 100
+
+_dump_lock = threading.Lock()
+_rule_profiler = None
+_rule_profiler_lock = threading.Lock()
+
+
+class RuleProfiler:
+    def __init__(self, dump_path=None, max_turns=RULE_PROFILE_TURNS):
+        """
+        Records the rules a ChatEngine fires during each turn: the firing
+        order, the wall and CPU time of each rule, the size of the agenda and
+        the number of activations the turn added. A profiler may be shared by
+        the engines of every session, each thread records its own turn.
+
+        Parameters
+        ----------
+        dump_path: str
+            If set, every turn is appended to this file as a line of JSON
+        max_turns: int
+            The number of turns kept in turns, older turns are dropped
+        """
+        self.dump_path = dump_path
+        self.turns = deque(maxlen=max_turns)
+        self._local = threading.local()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _turn(self):
+        return self._local.turn
+
+    def begin_turn(self, session=None):
+        """
+        Starts recording a turn
+
+        Parameters
+        ----------
+        session: str
+            The ID of the chat the turn belongs to
+        """
+        with self._lock:
+            self._count += 1
+            count = self._count
+        self._local.turn = {"turn": count, "session": session,
+                            "time": time.time(), "wall_ms": 0.0,
+                            "cpu_ms": 0.0, "activations": 0, "fires": []}
+
+    def record_activations(self, added):
+        """Records the activations added to the agenda before a firing"""
+        self._turn["activations"] += added
+
+    def record_fire(self, rule, salience, wall_seconds, cpu_seconds,
+                    agenda_size):
+        """
+        Records a rule firing
+
+        Parameters
+        ----------
+        rule: str
+            The name of the rule
+        salience: int
+            The salience of the rule
+        wall_seconds: float
+            The wall clock time the rule took
+        cpu_seconds: float
+            The process CPU time the rule took
+        agenda_size: int
+            The number of activations on the agenda when the rule was picked,
+            including its own
+        """
+        self._turn["fires"].append({
+            "order": len(self._turn["fires"]) + 1,
+            "rule": rule,
+            "salience": salience,
+            "wall_ms": wall_seconds * 1000,
+            "cpu_ms": cpu_seconds * 1000,
+            "agenda_size": agenda_size
+        })
+        self._turn["wall_ms"] += wall_seconds * 1000
+        self._turn["cpu_ms"] += cpu_seconds * 1000
+
+    def end_turn(self):
+        turn, self._local.turn = self._turn, None
+        with self._lock:
+            self.turns.append(turn)
+        if self.dump_path:
+            line = json.dumps(turn)
+            with _dump_lock, open(self.dump_path, "a") as dump:
+                dump.write(line + "\n")
+        return turn
+
+    def last_turn(self):
+        """Returns the record of the last profiled turn, or None"""
+        return self.turns[-1] if self.turns else None
+
+    def rule_stats(self):
+        """
+        Returns the totals of every rule over the turns kept
+
+        Returns
+        -------
+        dict
+            fires, wall_ms and cpu_ms of each rule, slowest (wall time) first
+        """
+        stats = {}
+        with self._lock:
+            turns = list(self.turns)
+        for turn in turns:
+            for fire in turn["fires"]:
+                rule = stats.setdefault(fire["rule"], {"fires": 0,
+                                                       "wall_ms": 0.0,
+                                                       "cpu_ms": 0.0})
+                rule["fires"] += 1
+                rule["wall_ms"] += fire["wall_ms"]
+                rule["cpu_ms"] += fire["cpu_ms"]
+        return dict(sorted(stats.items(),
+                           key=lambda item: -item[1]["wall_ms"]))
+
+    def to_json(self):
+        """Returns the turns kept and the rule totals as JSON"""
+        with self._lock:
+            turns = list(self.turns)
+        return json.dumps({"turns": turns, "rules": self.rule_stats()})
+
+
+def profiled_run(engine, profiler, steps=float('inf'), session=None):
+    """
+    Runs a KnowledgeEngine like KnowledgeEngine.run, recording the turn and
+    the time of each rule fired in profiler
+
+    Parameters
+    ----------
+    engine: KnowledgeEngine
+        The engine to run
+    profiler: RuleProfiler
+        Where the turn is recorded
+    steps: int
+        The maximum number of rules fired
+    session: str
+        The ID of the chat the turn belongs to
+    """
+    from experta import watchers
+
+    profiler.begin_turn(session)
+    engine.running = True
+    execution = 0
+    try:
+        while steps > 0 and engine.running:
+            added, removed = engine.get_activations()
+            engine.strategy.update_agenda(engine.agenda, added, removed)
+            profiler.record_activations(len(added))
+            agenda_size = len(engine.agenda.activations)
+
+            activation = engine.agenda.get_next()
+            if activation is None:
+                break
+            steps -= 1
+            execution += 1
+            watchers.RULES.info(
+                "FIRE %s %s: %s",
+                execution,
+                activation.rule.__name__,
+                ", ".join(str(f) for f in activation.facts))
+
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            activation.rule(
+                engine,
+                **{k: v
+                   for k, v in activation.context.items()
+                   if not k.startswith('__')})
+            profiler.record_fire(activation.rule.__name__,
+                                 activation.rule.salience,
+                                 time.perf_counter() - wall_start,
+                                 time.process_time() - cpu_start,
+                                 agenda_size)
+    finally:
+        engine.running = False
+        profiler.end_turn()
+
+
+def create_rule_profiler():
+    """
+    Returns the process wide profiler dumping to the CHAT_BOT_RULE_PROFILE
+    environment variable, shared by every ChatEngine so its turns and rule
+    totals cover every session, or None if it isn't set
+    """
+    global _rule_profiler
+    if not RULE_PROFILE_PATH:
+        return None
+    with _rule_profiler_lock:
+        if _rule_profiler is None:
+            _rule_profiler = RuleProfiler(RULE_PROFILE_PATH)
+        return _rule_profiler
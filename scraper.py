@@ -1,15 +1,22 @@
-import json
-from urllib.request import urlopen
+from Chat_bot.fare_cache import cached_fares, create_fare_cache
+from Chat_bot.fare_fetcher import fetch_cheapest_fare
 
-from bs4 import BeautifulSoup as soup
+NATIONAL_RAIL_URL = "https://ojp.nationalrail.co.uk/service/timesandfares"
 
 
-def scrape(journey_data):
+@cached_fares(create_fare_cache())
+def scrape(journey_data, base_url=NATIONAL_RAIL_URL, session=None):
     """
 
     Parameters
     ----------
     journey_data
+    base_url: str
+        The times and fares page to query, overridden by tests to use a local
+        fixture
+    session: requests.Session
+        The session to fetch the page with. Defaults to the pooled session of
+        the calling thread
 
     Returns
     -------
@@ -21,40 +28,31 @@ def scrape(journey_data):
             journey_data['return_date'].strftime("%d%m%Y"),
             journey_data['return_date'].strftime("%H%M")
         )
-        inbound_req = "true"
     else:
         url_return = ""
-        inbound_req = "false"
 
-    url = ("https://ojp.nationalrail.co.uk/service/timesandfares/{}/{}" 
-           "/{}/{}/dep{}")
+    url = base_url + "/{}/{}/{}/{}/dep{}"
     url = url.format(journey_data['depart'], journey_data['arrive'],
                      journey_data['departure_date'].strftime("%d%m%y"),
                      journey_data['departure_date'].strftime("%H%M"),
                      url_return)
 
-    # Open the webpage
-    webpage = urlopen(url)
+    json_cheap = fetch_cheapest_fare(url, session)
+    journey = json_cheap['jsonJourneyBreakdown']
 
-    # Transform page into HTML
-    html = webpage.read()
-
-    # Breakdown HTML into elements
-    page_scrape = soup(html, "html.parser")
-
-    # Get element with "has-cheapest" in the class
-    cheap_elements = page_scrape.find("td", {"class": "fare has-cheapest"})
-
-    # Get content of the script tag
-    cheap_script = cheap_elements.find('script').contents
-
-    # Strip the text from special chars
-    stripped_cheap_text = str(cheap_script).strip("'<>() ").replace(
-        '\'', '\"').replace('\00', '').replace('["\\n\\t\\t\\t', "").replace(
-        '\\n\\t\\t"]', "")
-    print(stripped_cheap_text)
+    if journey_data['returning']:
+        returning_str = " and return {} at {}".format(
+            journey_data['return_date'].strftime("%a %d %b"),
+            journey_data['return_date'].strftime("%H:%M"))
+    else:
+        returning_str = ""
 
-    # Turn json into dictionary
-    json_cheap = json.loads(stripped_cheap_text)
+    info_str = (
+        "This service will depart {} at {} (duration: {}h {}m, {} changes){}."
+    ).format(journey_data['departure_date'].strftime("%a %d %b"),
+             journey['departureTime'], journey['durationHours'],
+             journey['durationMinutes'], journey['changes'], returning_str)
 
-    return url, json_cheap
+    return [url, ["£{:.2f}".format(json_cheap['totalPrice']),
+                  journey['departureStationName'],
+                  journey['arrivalStationName'], info_str]]
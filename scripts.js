@@ -84,12 +84,6 @@ function sendInputData(user_message, isFirst=false, isSystem="false") {
     if (user_message.trim() === '' && !isFirst) {
         return;
     }
-    let messageObject = new writeMessage({
-        text: '',
-        side: 'left',
-        suggestions: []
-    });
-    
     // request to the backend
     $.ajax({
         type: 'POST',
@@ -97,33 +91,16 @@ function sendInputData(user_message, isFirst=false, isSystem="false") {
         datatype:"json",
         data: {"user_input" : user_message, "is_system": isSystem},
         success: function(output){
-            $(".typing").remove();
-            messageObject.text = output.message;
-            messageObject.suggestions = output.suggestions;
-            messageObject.response_req = output.response_req;
-            messageObject.write(output);
-            changeUIFromTags(output.message, new Date().toTimeString().slice(0, 5));
-            completeDelayPrediction(output.message);
-            getControlTags(output.message);
-            synthesizeSpeech(output.message.replace(/\s?\{[^}]+\}/g, ''));
-            if(messageObject.text.includes("Let's book your tickets now !") &&
-               $(window).width() > 1400){
-                $('main').css('width', 'calc(100% - 400px)');
-                $('.side-bar').css("transform", "scaleX(1)");
-                $('.content.active').slideUp(500);
-                $('.content.inactive').slideUp(500);
-                $('#booking .active').delay(500).slideDown(500);
-                $('#predict .inactive').delay(500).slideDown(500);
-                $('#support .inactive').delay(500).slideDown(500);
+            if(output.message === "{WAIT}"){
+                // the bot is still working on the answer, poll again shortly
+                setTimeout(function(){
+                    sendInputData("POPMSG", false, "true");
+                }, 1000);
+                return;
             }
-            if(messageObject.text.includes("Let's book your tickets now  !")){
-                isBookTicket = true;
-            }
-            if(messageObject.text.includes("{REQ:DEP}")){
-                navigator.geolocation.getCurrentPosition(getNearestStations);
-            }
-            if(messageObject.response_req === false){
-                sendInputData("POPMSG", false, "true");
+            writeBotMessage(output);
+            if(output.response_req === false){
+                getNextMessages();
             }
         },
         error: function(e){
@@ -133,6 +110,59 @@ function sendInputData(user_message, isFirst=false, isSystem="false") {
     console.log("User has written: " + user_message);
 }
 
+// write a bot message to the UI and act on its tags
+function writeBotMessage(output) {
+    let messageObject = new writeMessage({
+        text: output.message,
+        side: 'left',
+        suggestions: output.suggestions
+    });
+    $(".typing").remove();
+    messageObject.response_req = output.response_req;
+    messageObject.write(output);
+    changeUIFromTags(output.message, new Date().toTimeString().slice(0, 5));
+    completeDelayPrediction(output.message);
+    getControlTags(output.message);
+    synthesizeSpeech(output.message.replace(/\s?\{[^}]+\}/g, ''));
+    if(messageObject.text.includes("Let's book your tickets now !") &&
+       $(window).width() > 1400){
+        $('main').css('width', 'calc(100% - 400px)');
+        $('.side-bar').css("transform", "scaleX(1)");
+        $('.content.active').slideUp(500);
+        $('.content.inactive').slideUp(500);
+        $('#booking .active').delay(500).slideDown(500);
+        $('#predict .inactive').delay(500).slideDown(500);
+        $('#support .inactive').delay(500).slideDown(500);
+    }
+    if(messageObject.text.includes("Let's book your tickets now  !")){
+        isBookTicket = true;
+    }
+    if(messageObject.text.includes("{REQ:DEP}")){
+        navigator.geolocation.getCurrentPosition(getNearestStations);
+    }
+}
+
+// fetch the queued bot messages, streamed by the server when supported
+function getNextMessages() {
+    if(!window.EventSource){
+        sendInputData("POPMSG", false, "true");
+        return;
+    }
+    let source = new EventSource('/chat/stream');
+    source.onmessage = function(e){
+        let output = JSON.parse(e.data);
+        writeBotMessage(output);
+        if(output.response_req !== false){
+            source.close();
+        }
+    };
+    source.onerror = function(){
+        // fall back to polling for the rest of the messages
+        source.close();
+        sendInputData("POPMSG", false, "true");
+    };
+}
+
 // building message element and appending to the list of all messages
 function writeMessage(message) {
     this.text = message.text;
@@ -0,0 +1,290 @@
+"""
+sessions.py
+
+Contains the session store that keeps one Chat per user session
+"""
+import gc
+import os
+import pickle
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+
+# Referents that belong to the process rather than to a session
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType, types.CodeType)
+
+
+def deep_sizeof(obj, exclude=()):
+    """
+    Returns the number of bytes used by obj and everything it references,
+    counting each object once. Classes, modules, functions and the objects
+    in exclude (and what only they reference) are not counted.
+    """
+    seen = set(id(o) for o in exclude)
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _SHARED_TYPES):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return size
+
+
+def sizeof_report(chat):
+    """
+    Reports the memory used by a session. The spaCy pipeline shared by every
+    session isn't counted.
+
+    Returns
+    -------
+    dict
+        The bytes used by the whole Chat, by its parts (the parts of the
+        engine exclude the rest of the engine) and by its pickled state
+    """
+    engine = chat.chat_engine
+    shared = [engine.nlp_engine.nlp, engine.nlp_engine.nlp.vocab]
+    parts = {
+        "chat_log": chat.chat_log,
+        "knowledge": engine.knowledge,
+        "message": engine.message,
+        "facts": engine.facts,
+        "agenda": engine.agenda,
+        "rete": engine.matcher,
+        "nlp_engine": engine.nlp_engine
+    }
+    report = {name + "_bytes": deep_sizeof(part, shared + [chat, engine])
+              for name, part in parts.items()}
+    report["total_bytes"] = deep_sizeof(chat, shared)
+    report["pickled_bytes"] = len(pickle.dumps(
+        chat, protocol=pickle.HIGHEST_PROTOCOL))
+    return report
+
+
+class MemoryBackend:
+    def __init__(self):
+        """
+        Keeps sessions in a dict inside this process. Sessions are only
+        visible to the worker that created them.
+        """
+        self._sessions = OrderedDict()
+
+    def get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def set(self, session_id, chat, last_access):
+        self._sessions[session_id] = (chat, last_access)
+        self._sessions.move_to_end(session_id)
+
+    def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def evict(self, max_sessions, expires_before):
+        """
+        Removes sessions idle since before expires_before and then the least
+        recently used sessions until at most max_sessions are left
+        """
+        for session_id, (_, last_access) in list(self._sessions.items()):
+            if last_access < expires_before:
+                del self._sessions[session_id]
+        while len(self._sessions) > max_sessions:
+            self._sessions.popitem(last=False)
+
+    def states(self):
+        """Returns the stored state of every session, see load"""
+        return [chat for chat, _ in list(self._sessions.values())]
+
+    @staticmethod
+    def load(state):
+        """Returns the Chat of a state returned by states"""
+        return state
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        """
+        Keeps pickled sessions in a SQLite file so every worker process on
+        the machine shares the same sessions
+
+        Parameters
+        ----------
+        path: str
+            The path to the SQLite file holding the sessions
+        """
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS Sessions ("
+                         "session_id TEXT PRIMARY KEY, "
+                         "state BLOB NOT NULL, "
+                         "last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_access "
+                         "ON Sessions(last_access)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._connection().execute(
+            "SELECT state, last_access FROM Sessions WHERE session_id=?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, session_id, chat, last_access):
+        state = pickle.dumps(chat, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO Sessions "
+                         "(session_id, state, last_access) VALUES (?, ?, ?)",
+                         (session_id, state, last_access))
+
+    def delete(self, session_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM Sessions WHERE session_id=?",
+                         (session_id,))
+
+    def evict(self, max_sessions, expires_before):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM Sessions WHERE last_access < ?",
+                         (expires_before,))
+            conn.execute("DELETE FROM Sessions WHERE session_id NOT IN "
+                         "(SELECT session_id FROM Sessions "
+                         "ORDER BY last_access DESC LIMIT ?)",
+                         (max_sessions,))
+
+    def states(self):
+        """
+        Returns the stored state of every session, see load. The sessions
+        are left pickled as unpickling one rebuilds its whole ChatEngine.
+        """
+        return [row[0] for row in self._connection().execute(
+            "SELECT state FROM Sessions")]
+
+    @staticmethod
+    def load(state):
+        """Returns the Chat of a state returned by states"""
+        return pickle.loads(state)
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM Sessions").fetchone()[0]
+
+
+class SessionStore:
+    def __init__(self, backend=None, max_sessions=1000, ttl=1800):
+        """
+        Stores Chat instances by session ID with least recently used and idle
+        time eviction
+
+        Parameters
+        ----------
+        backend: MemoryBackend or SQLiteBackend
+            Where the sessions are kept
+            default: MemoryBackend
+        max_sessions: int
+            The maximum number of sessions kept before the least recently used
+            ones are evicted
+        ttl: int
+            The number of seconds a session may be idle before it's evicted
+        """
+        if backend is None:
+            backend = MemoryBackend()
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_session_id():
+        return secrets.token_urlsafe(16)
+
+    def get(self, session_id):
+        """
+        Returns the Chat for the given session ID, or None if the session
+        doesn't exist or has expired
+        """
+        if not session_id:
+            return None
+        with self._lock:
+            entry = self.backend.get(session_id)
+            if entry is None:
+                return None
+            chat, last_access = entry
+            if last_access < time.time() - self.ttl:
+                self.backend.delete(session_id)
+                return None
+            return chat
+
+    def save(self, session_id, chat):
+        """Stores the Chat for the given session ID and evicts old sessions"""
+        now = time.time()
+        with self._lock:
+            self.backend.set(session_id, chat, now)
+            self.backend.evict(self.max_sessions, now - self.ttl)
+
+    def delete(self, session_id):
+        with self._lock:
+            self.backend.delete(session_id)
+
+    def sizeof_report(self):
+        """
+        Reports the number of sessions and the average and largest memory
+        used by one (see sizeof_report), to size the server for a number of
+        concurrent users. Sessions of a SQLite backend are measured once
+        loaded, as a worker holds them while answering.
+        """
+        with self._lock:
+            states = self.backend.states()
+        # Sessions are loaded and measured without holding the lock, so the
+        # report doesn't block the requests of the other users
+        sizes = [sizeof_report(self.backend.load(state)) for state in states]
+        report = {"sessions": len(sizes)}
+        for key in (sizes[0] if sizes else ["total_bytes", "pickled_bytes"]):
+            values = [size[key] for size in sizes] or [0]
+            report["avg_" + key] = sum(values) / len(values)
+            report["max_" + key] = max(values)
+        return report
+
+    def __len__(self):
+        with self._lock:
+            return len(self.backend)
+
+
+def create_session_store():
+    """
+    Builds the session store configured by the CHAT_BOT_SESSION_BACKEND
+    ("memory" or "sqlite"), CHAT_BOT_SESSION_DB, CHAT_BOT_MAX_SESSIONS and
+    CHAT_BOT_SESSION_TTL environment variables
+    """
+    backend_name = os.environ.get("CHAT_BOT_SESSION_BACKEND", "memory")
+    if backend_name == "sqlite":
+        backend = SQLiteBackend(os.environ.get("CHAT_BOT_SESSION_DB",
+                                               "Chat_bot_sessions.db"))
+    elif backend_name == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError("Unknown session backend {}".format(backend_name))
+    return SessionStore(backend,
+                        int(os.environ.get("CHAT_BOT_MAX_SESSIONS", 1000)),
+                        int(os.environ.get("CHAT_BOT_SESSION_TTL", 1800)))
@@ -0,0 +1,208 @@
+"""
+stations.py
+
+Contains the in-memory index used to resolve the stations input by the user
+"""
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from Chat_bot import StationNoMatchError, StationNotFoundError
+from Chat_bot.db_pool import get_db_pool
+
+
+def get_similarity(comparator_a, comparator_b):
+    """
+
+    Parameters
+    ----------
+    comparator_a: tuple
+        The tuple from the database when searching for identifier, name
+        from main.Stations table
+    comparator_b: str
+        The departure point input by the user
+    Returns
+    -------
+    float
+        The SequenceMatcher produced ration between the station name from
+        the database and the departure point passed in by the user
+    """
+    comparator_a = comparator_a[1].replace("(" + comparator_b + ")", "")
+    ratio = SequenceMatcher(None, comparator_a.lower(),
+                            comparator_b.lower()).ratio() * 100
+    if comparator_b.lower() in comparator_a.lower():
+        ratio += 25
+    if comparator_b.lower().startswith(comparator_a.lower()):
+        ratio += 25
+    return ratio
+
+
+def get_trigrams(text):
+    """
+    Returns the set of lower case character trigrams of text, padded so that
+    short words still produce trigrams
+    """
+    text = "  " + text.lower() + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class StationIndex:
+    def __init__(self, stations):
+        """
+        Indexes station rows by code, by name and by the trigrams of the name
+
+        Parameters
+        ----------
+        stations: list of tuple
+            The rows of main.Stations, in table order. The identifier must be
+            the first column and the name the second.
+        """
+        self.stations = tuple(stations)
+        self._by_code = {}
+        self._by_name = defaultdict(list)
+        self._by_trigram = defaultdict(list)
+        for position, station in enumerate(self.stations):
+            self._by_code.setdefault(station[0].lower(), station)
+            self._by_name[station[1].lower()].append(station)
+            for trigram in get_trigrams(station[1]):
+                self._by_trigram[trigram].append(position)
+
+    def get_candidates(self, search_station):
+        """
+        Returns the positions of the stations sharing at least one trigram
+        with search_station, in table order
+        """
+        positions = set()
+        for trigram in get_trigrams(search_station):
+            positions.update(self._by_trigram.get(trigram, ()))
+        return sorted(positions)
+
+    def find(self, search_station):
+        """
+        Finds the station matching search_station by code, then by name and
+        finally by similarity to the name
+
+        Parameters
+        ----------
+        search_station: str
+            The station code or name input by the user
+
+        Returns
+        -------
+        tuple
+            The matched station row
+
+        Raises
+        ------
+        StationNoMatchError
+            With the (up to) three most similar stations if there's no exact
+            match
+        StationNotFoundError
+            If there are no stations at all
+        """
+        station = self._by_code.get(search_station.lower())
+        if station:
+            return station
+
+        # Station code not input - try searching by station name
+        stations = self._by_name.get(search_station.lower(), [])
+        if len(stations) == 1:
+            return stations[0]
+
+        # Try finding stations with names close to input name. Stations
+        # scoring a bonus always share a trigram with inputs of 3 or more
+        # characters, so only those are scored in full. The others are
+        # scored only if the upper bound of their ratio could still place
+        # them in the top three. Shorter inputs only have padded edge
+        # trigrams, so every station is scored for them, as it is when
+        # there are too few candidates to pick three alternatives from.
+        if len(search_station.strip()) >= 3:
+            positions = self.get_candidates(search_station)
+        else:
+            positions = []
+        if len(positions) < 3:
+            positions = range(len(self.stations))
+        if not positions:
+            msg = "Unable to find station {}"
+            raise StationNotFoundError(msg.format(search_station))
+        scores = {position: get_similarity(self.stations[position],
+                                           search_station)
+                  for position in positions}
+        if len(scores) < len(self.stations):
+            third = sorted(scores.values(), reverse=True)[2]
+            matcher = SequenceMatcher(None, "", search_station.lower())
+            for position, station in enumerate(self.stations):
+                if position in scores:
+                    continue
+                matcher.set_seq1(station[1].lower())
+                if (matcher.real_quick_ratio() * 100 >= third and
+                        matcher.quick_ratio() * 100 >= third):
+                    scores[position] = get_similarity(station, search_station)
+        ranked = sorted(scores, key=lambda position: (-scores[position],
+                                                      position))
+        raise StationNoMatchError([self.stations[position]
+                                   for position in ranked[0:3]])
+
+    def __len__(self):
+        return len(self.stations)
+
+
+_station_rows = None
+_station_names = None
+_station_index = None
+_reload_callbacks = []
+
+
+def get_station_rows():
+    """
+    Returns the rows of main.Stations as a tuple, querying the database only
+    the first time (or after reload_stations)
+    """
+    global _station_rows
+    if _station_rows is None:
+        _station_rows = tuple(get_db_pool().query(
+            "SELECT * FROM main.Stations"))
+    return _station_rows
+
+
+def get_station_names():
+    """
+    Returns a tuple of the lower case code and name of every station, in
+    table order, as used by the station matcher patterns
+    """
+    global _station_names
+    if _station_names is None:
+        names = []
+        for row in get_station_rows():
+            names.append(row[0].lower())
+            names.append(row[1].lower())
+        _station_names = tuple(names)
+    return _station_names
+
+
+def get_station_index():
+    """Returns the station index built from the station rows"""
+    global _station_index
+    if _station_index is None:
+        _station_index = StationIndex(get_station_rows())
+    return _station_index
+
+
+def on_stations_reload(callback):
+    """
+    Registers callback to be called (with no arguments) after the stations
+    have been reloaded
+    """
+    _reload_callbacks.append(callback)
+
+
+def reload_stations():
+    """
+    Drops the cached stations so they're loaded again from main.Stations.
+    Must be called after the Stations table changes.
+    """
+    global _station_rows, _station_names, _station_index
+    _station_rows = None
+    _station_names = None
+    _station_index = None
+    for callback in _reload_callbacks:
+        callback()
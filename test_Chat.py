@@ -1,10 +1,19 @@
 import unittest
+from datetime import datetime
 
 from experta import Fact
 
 from Chat_bot.Chat import Chat
 
 test_case_departure = "ZLS"
+test_conversation = ["I'd like to book a ticket",
+                     "depart from Norwich",
+                     "arriving to London Liverpool Street",
+                     "{TAG:RET}👎",
+                     "{TAG:ADT}0",
+                     "{TAG:CHD}0",
+                     "{TAG:ADT}1",
+                     "hello"]
 
 
 class TestBooking(unittest.TestCase):
@@ -47,6 +56,30 @@ class TestBooking(unittest.TestCase):
                          "I found a few departure stations that matched London."
                          " Is one of these correct?")
 
+    def test_message_parsed_once_per_turn(self):
+        booking = Chat()
+        booking.chat_engine.reset()
+        booking.chat_engine.declare(Fact(action="book"))
+        booking.chat_engine.declare(Fact(message_text="depart from ZLS"))
+        booking.chat_engine.run()
+        self.assertEqual(booking.chat_engine.nlp_engine.calls, 1)
+
+
+class TestIncrementalTurns(unittest.TestCase):
+    def test_incremental_turns_match_reset_turns(self):
+        incremental = Chat()
+        reset = Chat()
+        reset.chat_engine.incremental = False
+        for message_text in test_conversation:
+            for chat in (incremental, reset):
+                chat.add_message("human", message_text, datetime.now())
+            self.assertEqual(incremental.chat_engine.message,
+                             reset.chat_engine.message)
+            self.assertEqual(incremental.chat_engine.knowledge,
+                             reset.chat_engine.knowledge)
+            self.assertEqual(incremental.chat_engine.progress,
+                             reset.chat_engine.progress)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import sys
+import unittest
+from unittest import mock
+
+from Chat_bot import Chat_bot
+from Chat_bot.Chat_bot import NLPEngine, pipeline_memory_report, warm_up
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        # spaCy is imported by get_pipeline, so it's replaced in sys.modules
+        self.spacy = mock.Mock()
+        self.spacy.load.return_value = mock.Mock(name="nlp")
+        patches = [mock.patch.dict(sys.modules, spacy=self.spacy),
+                   mock.patch.dict(Chat_bot._pipelines, clear=True),
+                   mock.patch.dict(Chat_bot._pipeline_stats, clear=True)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_engines_share_the_pipeline(self):
+        warm_up("test_model")
+        engines = [NLPEngine("test_model"), NLPEngine("test_model")]
+
+        self.spacy.load.assert_called_once_with("test_model")
+        self.assertIs(engines[0].nlp, engines[1].nlp)
+        self.assertIs(engines[0].nlp, self.spacy.load.return_value)
+        report = pipeline_memory_report()
+        self.assertEqual(report["test_model"]["engines"], 2)
+        self.assertEqual(report["test_model"]["rss_saved_bytes"],
+                         report["test_model"]["rss_bytes"])
+
+    def test_report_before_any_engine(self):
+        self.assertEqual(list(pipeline_memory_report()),
+                         ["process_rss_bytes"])
+        warm_up("test_model")
+        self.assertEqual(pipeline_memory_report()["test_model"]["engines"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
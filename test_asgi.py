@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+os.environ.setdefault("CHAT_BOT_BROWSER_PREWARM", "false")
+
+from Chat_bot import asgi
+
+
+async def post_chat(user_input, cookie=None):
+    """Sends a POST /chat through the ASGI app and returns what was sent"""
+    body = "user_input={}&is_system=false".format(user_input).encode()
+    headers = [(b"content-type", b"application/x-www-form-urlencoded")]
+    if cookie:
+        headers.append((b"cookie", cookie.encode()))
+    scope = {"type": "http", "method": "POST", "path": "/chat",
+             "headers": headers}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(event):
+        sent.append(event)
+
+    await asgi.app(scope, receive, send)
+    return sent
+
+
+class WaitingChat:
+    """A chat whose fare lookup never finishes"""
+    def __init__(self):
+        self.ticket = Future()
+
+    def pending_ticket(self):
+        return self.ticket
+
+    def pop_message(self, timeout):
+        return ["{WAIT}", [], False]
+
+
+async def get_stream(cookie, disconnect_after=0):
+    scope = {"type": "http", "method": "GET", "path": "/chat/stream",
+             "headers": [(b"cookie", cookie.encode())]}
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(event):
+        sent.append(event)
+
+    await asgi.app(scope, receive, send)
+    return sent
+
+
+class TestAsgi(unittest.TestCase):
+    def test_new_chat_sets_session_cookie(self):
+        start, body = asyncio.run(post_chat(""))
+        self.assertEqual(start["status"], 200)
+        cookie = dict(start["headers"])[b"set-cookie"].decode()
+        self.assertTrue(cookie.startswith(asgi.SESSION_COOKIE + "="))
+        self.assertIn(b"Book a ticket", body["body"])
+
+    def test_reload_deletes_the_old_session(self):
+        greeting = ("new", None, ["Hi", [], True])
+        with mock.patch.object(asgi, "new_chat", return_value=greeting), \
+                mock.patch.object(asgi.sessions, "delete") as delete, \
+                mock.patch.object(asgi.sessions, "save"):
+            asyncio.run(post_chat("", asgi.SESSION_COOKIE + "=old"))
+        delete.assert_called_once_with("old")
+
+    def test_unknown_session_has_expired(self):
+        start, body = asyncio.run(post_chat("hello",
+                                            asgi.SESSION_COOKIE + "=missing"))
+        self.assertIn(b"expired", body["body"])
+
+    def test_stream_of_unknown_session_has_expired(self):
+        sent = asyncio.run(get_stream(asgi.SESSION_COOKIE + "=missing"))
+        self.assertEqual(dict(sent[0]["headers"])[b"content-type"],
+                         b"text/event-stream")
+        self.assertTrue(sent[1]["body"].startswith(b"data: "))
+        self.assertIn(b"expired", sent[1]["body"])
+        self.assertFalse(sent[-1].get("more_body", False))
+
+    def test_stream_stops_when_the_client_disconnects(self):
+        with mock.patch.object(asgi.sessions, "get",
+                               return_value=WaitingChat()), \
+                mock.patch.object(asgi.sessions, "save") as save:
+            start = time.perf_counter()
+            sent = asyncio.run(get_stream(asgi.SESSION_COOKIE + "=waiting",
+                                          disconnect_after=0.1))
+            seconds = time.perf_counter() - start
+        self.assertLess(seconds, asgi.TICKET_POLL_SECONDS)
+        self.assertEqual(save.call_count, 0)
+        # Only the response start, nothing is sent after the disconnect
+        self.assertEqual(len(sent), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
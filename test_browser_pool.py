@@ -0,0 +1,111 @@
+import datetime
+import functools
+import os
+import queue
+import threading
+import unittest
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from Chat_bot.browser_pool import BrowserPool, create_firefox
+
+FIXTURES = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "fixtures")
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.visited = []
+        self.quit_called = False
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def delete_all_cookies(self):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestBrowserPool(unittest.TestCase):
+    def test_browser_is_reused(self):
+        pool = BrowserPool(size=1, factory=FakeBrowser)
+        with pool.lease() as first:
+            pass
+        with pool.lease() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(first.visited, ["about:blank", "about:blank"])
+
+    def test_browser_is_recycled_after_max_uses(self):
+        pool = BrowserPool(size=1, max_uses=2, factory=FakeBrowser)
+        for _ in range(2):
+            with pool.lease() as browser:
+                pass
+        self.assertTrue(browser.quit_called)
+        with pool.lease() as new_browser:
+            self.assertIsNot(browser, new_browser)
+        self.assertEqual(pool.get_stats()["recycled"], 1)
+
+    def test_browser_is_replaced_after_crash(self):
+        pool = BrowserPool(size=1, factory=FakeBrowser)
+        with self.assertRaises(RuntimeError):
+            with pool.lease() as browser:
+                raise RuntimeError("browser crashed")
+        self.assertTrue(browser.quit_called)
+        self.assertEqual(pool.get_stats()["crashed"], 1)
+        self.assertEqual(pool.get_stats()["running"], 0)
+
+    def test_pool_is_bounded(self):
+        pool = BrowserPool(size=1, factory=FakeBrowser)
+        with pool.lease():
+            with self.assertRaises(queue.Empty):
+                with pool.lease(timeout=0.01):
+                    pass
+
+    def test_start_fills_pool(self):
+        pool = BrowserPool(size=3, factory=FakeBrowser)
+        pool.start()
+        stats = pool.get_stats()
+        self.assertEqual(stats["started"], 3)
+        self.assertEqual(stats["idle"], 3)
+
+
+@unittest.skipUnless(os.environ.get("GECKODRIVER_PATH"),
+                     "needs Firefox and GECKODRIVER_PATH")
+class TestScrapeFixture(unittest.TestCase):
+    def setUp(self):
+        handler = functools.partial(SimpleHTTPRequestHandler,
+                                    directory=FIXTURES)
+        self.server = HTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.pool = BrowserPool(size=1, factory=create_firefox)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+
+    def test_scrape_with_pooled_browser(self):
+        from Chat_bot import scraper_1
+
+        journey_data = {
+            "depart": "NRW",
+            "arrive": "LST",
+            "departure_date": datetime.datetime(2021, 2, 1, 8, 0),
+            "returning": False,
+            "no_adults": 1,
+            "no_children": 0
+        }
+        base_url = "http://127.0.0.1:{}/chiltern_search.html".format(
+            self.server.server_port)
+        for _ in range(2):
+            url, ticket_data = scraper_1.scrape(journey_data, base_url,
+                                                self.pool)
+            self.assertEqual(ticket_data[0], "£12.50")
+            self.assertEqual(ticket_data[1], "Norwich")
+        self.assertEqual(self.pool.get_stats()["started"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
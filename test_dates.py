@@ -0,0 +1,129 @@
+import unittest
+from datetime import datetime, timedelta
+
+from dateparser.date import DateDataParser
+from dateutil.parser import parse, ParserError
+
+from Chat_bot import dates
+from Chat_bot.dates import get_date_from_text, parse_date_text, parse_fast
+
+DATE_TEXTS = [
+    "10:30", "9:05", "09:05", "0:30", "00:00", "23:59", "24:00", "10:75",
+    "9am", "9 am", "9 AM", "9AM", "9pm", "9:30pm", "9:30 PM", "12am", "12pm",
+    "12:15am", "0am", "13pm", "10 o'clock", "10oclock", "1030", "0930",
+    "2030", "tomorrow 10:30", "tomorrow at 10:30", "Tomorrow at 9am",
+    "today at 9am", "10:30 tomorrow", "9pm today", "tomorrow", "today",
+    "in 2 hours", "15/03/2030 10:30", "15/03 at 10:30", "15th March 9am",
+    "next monday 9am", "10", "half past ten", "tomorrow today 10:30",
+]
+
+
+def reference_get_date_from_text(date_text, knowledge, st_type="DEP"):
+    """The date parsing of ChatEngine.get_date_from_text before dates.py"""
+    date_text = date_text.replace(" am", "am")
+    date_text = date_text.replace(" AM", "am")
+    date_text = date_text.replace(" pm", "pm")
+    date_text = date_text.replace(" PM", "pm")
+    date_text = date_text.replace(" o'clock", ":00")
+    date_text = date_text.replace(" oclock", ":00")
+    date_text = date_text.replace("o'clock", ":00")
+    date_text = date_text.replace("oclock", ":00")
+    try:
+        parse(date_text, fuzzy=True)
+    except ParserError:
+        return None
+    else:
+        ddp = DateDataParser(languages=['en'],
+                             settings={'DATE_ORDER': 'DMY'})
+        date_time = ddp.get_date_data(date_text).date_obj
+        date_time_now = datetime.now()
+        if date_time and date_time <= date_time_now and st_type != "DLY":
+            return 2
+        if (("departure_date" in knowledge and
+                date_time <= knowledge['departure_date']) or
+                ("return_date" in knowledge and
+                 date_time >= knowledge['return_date'])):
+            return 1
+        return date_time
+
+
+class TestDateParity(unittest.TestCase):
+    def assertSameDate(self, date_time, expected, date_text):
+        if isinstance(expected, datetime) and expected.microsecond:
+            # Relative to the current time, which moved on between the calls
+            self.assertLess(abs(date_time - expected), timedelta(seconds=1),
+                            date_text)
+        else:
+            self.assertEqual(date_time, expected, date_text)
+
+    def test_parse_date_text(self):
+        for date_text in DATE_TEXTS:
+            # The second parse of a fallback is answered by the memo
+            for _ in range(2):
+                self.assertSameDate(parse_date_text(date_text),
+                                    reference_get_date_from_text(
+                                        date_text, {}, "DLY"),
+                                    date_text)
+
+    def test_sentinels(self):
+        tomorrow = datetime.now() + timedelta(days=1)
+        knowledge = [
+            {},
+            {"departure_date": tomorrow.replace(hour=12, minute=0, second=0,
+                                                microsecond=0)},
+            {"return_date": tomorrow.replace(hour=10, minute=0, second=0,
+                                             microsecond=0)},
+        ]
+        for date_text in DATE_TEXTS:
+            for known in knowledge:
+                for st_type in ("DEP", "RET"):
+                    try:
+                        expected = reference_get_date_from_text(
+                            date_text, known, st_type)
+                    except TypeError:
+                        # dateparser can't read it, which now answers None
+                        expected = None
+                    self.assertSameDate(
+                        get_date_from_text(date_text, known, st_type),
+                        expected, (date_text, known, st_type))
+
+    def test_sentinel_values(self):
+        departure = datetime.now() + timedelta(days=2)
+        self.assertEqual(get_date_from_text("0:00", {}), 2)
+        self.assertIsInstance(get_date_from_text("0:00", {}, "DLY"), datetime)
+        self.assertEqual(get_date_from_text("tomorrow 10:30",
+                                            {"departure_date": departure}),
+                         1)
+        self.assertIsNone(get_date_from_text("tomorrow", {}))
+
+
+class TestFastPath(unittest.TestCase):
+    now = datetime(2021, 3, 15, 18, 0, 12, 345)
+
+    def test_shapes(self):
+        self.assertEqual(parse_fast("9:05", self.now),
+                         datetime(2021, 3, 15, 9, 5))
+        self.assertEqual(parse_fast("12:15am", self.now),
+                         datetime(2021, 3, 15, 0, 15))
+        self.assertEqual(parse_fast("tomorrow at 9pm", self.now),
+                         datetime(2021, 3, 16, 21, 0))
+        # As dateparser reads it, a four digit number is a year
+        self.assertEqual(parse_fast("2030", self.now), datetime(2030, 3, 15))
+
+    def test_other_shapes_fall_back(self):
+        for date_text in ["10", "24:00", "13pm", "15/03 10:30", "tomorrow",
+                          "today tomorrow 10:30"]:
+            self.assertIsNone(parse_fast(date_text, self.now), date_text)
+
+    def test_memo_is_per_day(self):
+        today = datetime.now()
+        parse_date_text("15/03/2030 10:30", today)
+        self.assertIn("15/03/2030 10:30", dates._memo)
+        parse_date_text("15/03/2030 10:30", today + timedelta(days=1))
+        self.assertEqual(list(dates._memo), ["15/03/2030 10:30"])
+        parse_date_text("in 2 hours", today + timedelta(days=1))
+        self.assertNotIn("in 2 hours", dates._memo)
+
+
+if __name__ == '__main__':
+    unittest.main()
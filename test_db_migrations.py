@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from Chat_bot.db_migrations import (MIGRATIONS, migrate, read_od_pair,
+                                    refresh_od_journeys)
+from Chat_bot.db_pool import ConnectionPool
+from Chat_bot.delay_features import rows_to_columns
+
+HARVEST_QUERY = """
+    SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
+        (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at
+         FROM main.Data WHERE tpl = ?) AS x JOIN
+        (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data
+         WHERE tpl = ?) AS y on x.rid_FROM = y.rid_TO
+        ORDER BY rid_FROM """
+
+# rid, tpl, pta, ptd, arr_at, dep_at
+FEBRUARY = [
+    ("201902017160137", "NRCH", "", "05:30", "", "05:31"),
+    ("201902017160137", "DISS", "05:47", "05:48", "05:47", "05:49"),
+    ("201902017160137", "TROWSEJ", "", "", "", ""),
+    ("201902017160137", "LIVST", "07:20", "", "07:24", ""),
+    ("201902027160138", "NRCH", "", "06:00", "", ""),
+    ("201902027160138", "LIVST", "07:50", "", "07:49", ""),
+]
+MARCH = [
+    ("201903017160137", "NRCH", "", "05:30", "", "05:30"),
+    ("201903017160137", "LIVST", "07:20", "", "07:21", ""),
+]
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "Chat_bot.db")
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("CREATE TABLE Data (rid TEXT, tpl TEXT, pta TEXT, "
+                          "ptd TEXT, arr_at TEXT, dep_at TEXT)")
+        self.insert(FEBRUARY)
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def insert(self, rows):
+        with self.conn:
+            self.conn.executemany("INSERT INTO Data VALUES (?, ?, ?, ?, ?, ?)",
+                                  rows)
+
+    def harvest(self, departure_station, arrival_station):
+        return rows_to_columns(self.conn.execute(
+            HARVEST_QUERY, (departure_station, arrival_station)).fetchall())
+
+    def test_migrate_once(self):
+        self.assertEqual(migrate(self.conn), len(MIGRATIONS))
+        self.assertEqual(migrate(self.conn), len(MIGRATIONS))
+        plan = self.conn.execute("EXPLAIN QUERY PLAN " + HARVEST_QUERY,
+                                 ("NRCH", "LIVST")).fetchall()
+        self.assertIn("idx_data_tpl_rid", " ".join(row[-1] for row in plan))
+
+    def test_od_journeys_match_harvest_data(self):
+        migrate(self.conn)
+        self.assertEqual(refresh_od_journeys(self.conn), ["201902"])
+        pool = ConnectionPool(self.path)
+        try:
+            for departure_station, arrival_station in [("NRCH", "LIVST"),
+                                                       ("DISS", "LIVST"),
+                                                       ("NRCH", "DISS")]:
+                expected = self.harvest(departure_station, arrival_station)
+                columns = read_od_pair(pool, departure_station,
+                                       arrival_station)
+                for column, values in expected.items():
+                    self.assertEqual(columns[column].tolist(),
+                                     values.tolist())
+            # TROWSEJ isn't a public calling point
+            self.assertEqual(len(read_od_pair(pool, "TROWSEJ", "LIVST")
+                                 ["rid"]), 0)
+        finally:
+            pool.close()
+
+    def test_incremental_refresh(self):
+        migrate(self.conn)
+        refresh_od_journeys(self.conn)
+        journeys = self.conn.execute(
+            "SELECT COUNT(*) FROM OD_Journeys").fetchone()[0]
+        self.assertEqual(refresh_od_journeys(self.conn), [])
+
+        self.insert(MARCH)
+        self.assertEqual(refresh_od_journeys(self.conn), ["201903"])
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM OD_Journeys").fetchone()[0], journeys + 1)
+        self.assertEqual(self.conn.execute(
+            "SELECT month, journeys FROM OD_Months ORDER BY month").fetchall(),
+            [("201902", journeys), ("201903", 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from Chat_bot.db_pool import ConnectionPool
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "Chat_bot.db")
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE Data (rid TEXT, tpl TEXT)")
+            conn.executemany("INSERT INTO Data VALUES (?, ?)",
+                             [("1", "NRCH"), ("1", "LIVST"), ("2", "NRCH")])
+        conn.close()
+        self.pool = ConnectionPool(self.path)
+
+    def tearDown(self):
+        self.pool.close()
+        self.directory.cleanup()
+
+    def test_parameterized_query(self):
+        rows = self.pool.query("SELECT rid FROM main.Data WHERE tpl = ? "
+                               "ORDER BY rid", ("NRCH",))
+        self.assertEqual(rows, [("1",), ("2",)])
+
+    def test_connection_per_thread(self):
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(self.pool.connection()))
+        thread.start()
+        thread.join()
+        self.assertIs(self.pool.connection(), self.pool.connection())
+        self.assertIsNot(self.pool.connection(), connections[0])
+
+    def test_connections_of_exited_threads_are_closed(self):
+        rows = []
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: rows.append(
+                self.pool.query("SELECT COUNT(*) FROM Data")))
+            thread.start()
+            thread.join()
+        self.assertEqual(rows, [[(3,)]] * 50)
+        self.assertEqual(len(self.pool), 0)
+
+        self.pool.query("SELECT COUNT(*) FROM Data")
+        self.assertEqual(len(self.pool), 1)
+
+    def test_read_only_and_wal(self):
+        self.assertEqual(self.pool.query("PRAGMA journal_mode"), [("wal",)])
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.query("DELETE FROM Data")
+
+    def test_missing_database_isnt_created(self):
+        path = os.path.join(self.directory.name, "missing.db")
+        pool = ConnectionPool(path)
+        with self.assertRaises(FileNotFoundError):
+            pool.query("SELECT * FROM Stations")
+        self.assertFalse(os.path.exists(path))
+
+    def test_hooks_time_queries(self):
+        calls = []
+        self.pool.add_hook(lambda *args: calls.append(args))
+        self.pool.query("SELECT * FROM Data WHERE tpl = ?", ("NRCH",))
+        query, params, seconds, rows = calls[0]
+        self.assertEqual(params, ("NRCH",))
+        self.assertGreaterEqual(seconds, 0)
+        self.assertEqual(rows, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
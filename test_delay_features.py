@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from Chat_bot import delay_features
+from DelayPrediction.newPrediction import Predictions
+
+journeys = [
+    (201902017628973, "NRCH", "22:00", "22:05", "LIVST", "23:58", "23:59"),
+    (201902027628975, "NRCH", "05:50", "05:52", "LIVST", "07:45", "07:44"),
+    (201902037628977, "NRCH", "09:00", "09:01", "LIVST", "10:55", "11:02"),
+    (201902047628979, "NRCH", "16:30", "", "LIVST", "18:25", "18:30"),
+    (201902097628981, "NRCH", "17:00", "17:00", "LIVST", "18:55", "19:10")
+]
+
+
+class TestDelayFeatures(unittest.TestCase):
+    def test_rush_hour_matches_scalar(self):
+        hours = np.repeat(np.arange(1, 24), 60)
+        minutes = np.tile(np.arange(60), 23)
+        expected = [Predictions.is_rush_hour(hour, minute)
+                    for hour, minute in zip(hours, minutes)]
+        self.assertEqual(
+            delay_features.is_rush_hour(hours, minutes).tolist(), expected
+        )
+
+    def test_rush_hour_after_midnight_is_zero(self):
+        self.assertEqual(Predictions.is_rush_hour(0, 30), [])
+        self.assertEqual(delay_features.is_rush_hour(0, 30), 0)
+
+    def test_day_segment_matches_scalar(self):
+        hours = np.arange(24)
+        expected = [Predictions.check_day_segment(hour) for hour in hours]
+        self.assertEqual(delay_features.check_day_segment(hours).tolist(),
+                         expected)
+
+    def test_weekend_matches_scalar(self):
+        days = np.arange(7)
+        expected = [Predictions.is_weekend(day) for day in days]
+        self.assertEqual(delay_features.is_weekend(days).tolist(), expected)
+
+    def test_features_match_scalar(self):
+        features = delay_features.build_features(
+            delay_features.rows_to_columns(journeys)
+        )
+        matrix = delay_features.feature_matrix(features)
+        expected = []
+        for rid, _, ptd, dep_at, _, pta, arr_at in journeys:
+            if not (ptd and dep_at and pta and arr_at):
+                continue
+            rid = str(rid)
+            day = datetime(int(rid[:4]), int(rid[4:6]), int(rid[6:8])).weekday()
+            hour, minute = int(dep_at[:2]), int(dep_at[3:])
+
+            def seconds(time):
+                return (datetime.strptime(time, '%H:%M') -
+                        datetime(1900, 1, 1)).total_seconds()
+            expected.append([float(rid), seconds(dep_at),
+                             seconds(dep_at) - seconds(ptd), day,
+                             Predictions.is_weekend(day),
+                             Predictions.check_day_segment(hour),
+                             Predictions.is_rush_hour(hour, minute),
+                             seconds(arr_at) - seconds(pta)])
+        self.assertEqual(matrix.tolist(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from Chat_bot.delay_models import ModelStore, train_models
+
+
+class StubModel:
+    """Predicts the same delay for every journey"""
+    def __init__(self, seconds=125.0):
+        self.seconds = seconds
+
+    def predict(self, rows):
+        return [self.seconds for _ in rows]
+
+    def __eq__(self, other):
+        return isinstance(other, StubModel) and other.seconds == self.seconds
+
+
+class StubPredictions:
+    """Has journeys for every pair except those arriving at DISS"""
+    def __init__(self):
+        self.stations = {"norwich": "NRCH", "diss": "DISS",
+                         "london liverpool street": "LIVST"}
+        self.departure_station = None
+        self.arrival_station = None
+
+    def prepare_datasets(self):
+        return [] if self.arrival_station == "DISS" else [(1, 2, 3)]
+
+    @staticmethod
+    def fit(data):
+        return StubModel(len(data))
+
+
+class TestModelStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ModelStore(self.directory.name, version=3)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_save_to_versioned_directory(self):
+        self.store.save("NRCH", "LIVST", StubModel())
+        self.assertEqual(os.listdir(os.path.join(self.directory.name, "v3")),
+                         ["NRCH_LIVST.pkl"])
+        self.assertEqual(ModelStore(self.directory.name, 3).load("NRCH",
+                                                                  "LIVST"),
+                         StubModel())
+        self.assertIsNone(ModelStore(self.directory.name, 4).load("NRCH",
+                                                                  "LIVST"))
+
+    def test_failed_save_keeps_the_previous_model(self):
+        self.store.save("NRCH", "LIVST", StubModel())
+        with self.assertRaises(Exception):
+            self.store.save("NRCH", "LIVST", lambda rows: rows)
+        self.assertEqual(os.listdir(self.store.directory), ["NRCH_LIVST.pkl"])
+        self.assertEqual(ModelStore(self.directory.name, 3).load("NRCH",
+                                                                  "LIVST"),
+                         StubModel())
+
+    def test_loaded_models_are_cached(self):
+        self.store.save("NRCH", "LIVST", StubModel())
+        store = ModelStore(self.directory.name, 3)
+        model = store.load("NRCH", "LIVST")
+        os.remove(store.path_for("NRCH", "LIVST"))
+        self.assertIs(store.load("NRCH", "LIVST"), model)
+        store.clear()
+        self.assertIsNone(store.load("NRCH", "LIVST"))
+
+    def test_train_models(self):
+        module = types.ModuleType("DelayPrediction.newPrediction")
+        module.Predictions = StubPredictions
+        package = types.ModuleType("DelayPrediction")
+        package.newPrediction = module
+        with mock.patch.dict(sys.modules, {
+                "DelayPrediction": package,
+                "DelayPrediction.newPrediction": module}):
+            trained = train_models(self.store)
+        self.assertEqual(trained, [("DISS", "LIVST"), ("DISS", "NRCH"),
+                                   ("LIVST", "NRCH"), ("NRCH", "LIVST")])
+        self.assertEqual(sorted(os.listdir(self.store.directory)),
+                         ["DISS_LIVST.pkl", "DISS_NRCH.pkl", "LIVST_NRCH.pkl",
+                          "NRCH_LIVST.pkl"])
+
+
+class TestPredictWithStore(unittest.TestCase):
+    def setUp(self):
+        from DelayPrediction import newPrediction
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ModelStore(self.directory.name)
+        patcher = mock.patch.object(newPrediction, "get_model_store",
+                                    return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.predictions = newPrediction.Predictions()
+        self.predictions.departure_station = "NRCH"
+        self.predictions.arrival_station = "LIVST"
+        self.predictions.exp_dep = "08:00"
+        self.predictions.delay = 5
+        self.predictions.segment_of_day = 1
+        self.predictions.rush_hour = 1
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_stored_model_is_used(self):
+        self.store.save("NRCH", "LIVST", StubModel(125.0))
+        with mock.patch.object(self.predictions, "fit") as fit:
+            self.assertEqual(self.predictions.predict(), [0, 2, 5])
+        fit.assert_not_called()
+
+    def test_model_fitted_on_the_spot_is_saved(self):
+        with mock.patch.object(self.predictions, "fit",
+                               return_value=StubModel(60.0)) as fit:
+            self.assertEqual(self.predictions.predict(data=[(1, 2, 3)]),
+                             [0, 1, 0])
+            self.assertEqual(self.predictions.predict(), [0, 1, 0])
+        fit.assert_called_once_with([(1, 2, 3)])
+        self.assertEqual(ModelStore(self.directory.name).load("NRCH",
+                                                              "LIVST"),
+                         StubModel(60.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+
+from Chat_bot.fare_cache import FareCache
+
+journey = {
+    "depart": "NRW",
+    "arrive": "LST",
+    "departure_date": datetime(2021, 2, 1, 8, 5),
+    "returning": False,
+    "no_adults": 1,
+    "no_children": 0
+}
+
+
+class TestFareCache(unittest.TestCase):
+    def test_same_bucket_is_a_hit(self):
+        cache = FareCache(bucket_minutes=15)
+        fetches = []
+        cache.get_or_fetch(journey, fetches.append)
+        later = dict(journey, departure_date=datetime(2021, 2, 1, 8, 14))
+        cache.get_or_fetch(later, fetches.append)
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(cache.get_stats()["hits"], 1)
+
+    def test_different_passengers_is_a_miss(self):
+        cache = FareCache()
+        fetches = []
+        cache.get_or_fetch(journey, fetches.append)
+        cache.get_or_fetch(dict(journey, no_children=1), fetches.append)
+        self.assertEqual(len(fetches), 2)
+
+    def test_expired_fare_is_fetched_again(self):
+        cache = FareCache(ttl=0.01)
+        fetches = []
+        cache.get_or_fetch(journey, fetches.append)
+        time.sleep(0.02)
+        cache.get_or_fetch(journey, fetches.append)
+        self.assertEqual(len(fetches), 2)
+
+    def test_least_recently_used_fare_is_evicted(self):
+        cache = FareCache(max_size=1)
+        cache.get_or_fetch(journey, lambda j: "first")
+        cache.get_or_fetch(dict(journey, arrive="ZLS"), lambda j: "second")
+        self.assertEqual(cache.get_or_fetch(journey, lambda j: "third"),
+                         "third")
+        self.assertEqual(cache.get_stats()["evictions"], 2)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        cache = FareCache()
+        started = threading.Event()
+        release = threading.Event()
+        fetches = []
+
+        def slow_fetch(journey_data):
+            fetches.append(journey_data)
+            started.set()
+            release.wait()
+            return "£12.50"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.get_or_fetch(journey, slow_fetch))) for _ in range(3)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        while cache.get_stats()["coalesced"] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(results, ["£12.50"] * 3)
+
+    def test_failed_fetch_is_not_cached(self):
+        cache = FareCache()
+
+        def failing_fetch(journey_data):
+            raise ValueError("no fares")
+
+        with self.assertRaises(ValueError):
+            cache.get_or_fetch(journey, failing_fetch)
+        self.assertEqual(cache.get_or_fetch(journey, lambda j: "£12.50"),
+                         "£12.50")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import datetime
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from Chat_bot.fare_fetcher import (create_session, extract_basket,
+                                   extract_cheapest_fare, scan_cheapest_fare)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as fixture:
+        return fixture.read()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves the National Rail fixture for every path"""
+    requests = []
+
+    def do_GET(self):
+        FixtureHandler.requests.append(self.path)
+        body = read_fixture("national_rail_fares.html").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestExtractors(unittest.TestCase):
+    def test_extract_cheapest_fare(self):
+        fare = extract_cheapest_fare(read_fixture("national_rail_fares.html"))
+        self.assertEqual(fare["totalPrice"], 12.5)
+        self.assertEqual(fare["jsonJourneyBreakdown"]["departureTime"],
+                         "08:00")
+
+    def test_extract_cheapest_fare_without_fares(self):
+        with self.assertRaises(ValueError):
+            extract_cheapest_fare(read_fixture("chiltern_search.html"))
+
+    def test_scan_stops_after_cheapest_fare(self):
+        page = read_fixture("national_rail_fares.html").encode("utf-8")
+        chunks = [page[i:i + 64] for i in range(0, len(page), 64)]
+        fare, read = scan_cheapest_fare(chunks)
+        self.assertEqual(fare["totalPrice"], 12.5)
+        self.assertLess(read, len(page))
+
+    def test_extract_basket(self):
+        ticket_data = extract_basket(read_fixture("chiltern_search.html"))
+        self.assertEqual(ticket_data[:3], ["£12.50", "Norwich",
+                                           "London Liverpool Street"])
+        self.assertEqual(ticket_data[3], "This service will depart Mon 1 Feb "
+                                         "at 08:00 (duration: 1h 50m, 0 "
+                                         "changes).")
+
+    def test_extract_rendered_basket(self):
+        # Angular adds classes and wraps parts of the text when rendering
+        page = read_fixture("chiltern_search.html").replace(
+            '<span class="basket-summary__total--value"> £12.50 </span>',
+            '<span class="basket-summary__total--value ng-star-inserted">'
+            ' <span class="currency">£</span>12.50 </span>'
+        ).replace(
+            '<span data-elid="basket-duration-time">1h 50m</span>',
+            '<span data-elid="basket-duration-time"><b>1h</b> 50m</span>')
+        ticket_data = extract_basket(page)
+        self.assertEqual(ticket_data[0], "£12.50")
+        self.assertIn("(duration: 1h 50m, 0 changes)", ticket_data[3])
+
+    def test_extract_basket_return_leg(self):
+        page = read_fixture("chiltern_search.html")
+        with self.assertRaisesRegex(ValueError, "basket-return-leg"):
+            extract_basket(page, returning=True)
+        outward = page[page.index("<ace-journey-leg"):
+                       page.index("</ace-journey-leg>")]
+        page = page.replace("</ace-journey-leg>", "</ace-journey-leg>" + (
+            outward.replace("basket-outward-leg", "basket-return-leg")
+                   .replace("Mon 1 Feb, 08:00", "Wed 3 Feb, 18:00")) +
+            "</ace-journey-leg>", 1)
+        self.assertTrue(extract_basket(page, returning=True)[3].endswith(
+            " and return Wed 3 Feb at 18:00 (duration: 1h 50m, 0 changes)."))
+
+
+class TestScrapeFixture(unittest.TestCase):
+    def setUp(self):
+        FixtureHandler.requests = []
+        self.server = HTTPServer(("127.0.0.1", 0), FixtureHandler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_scrape_over_pooled_session(self):
+        from Chat_bot import scraper
+
+        journey_data = {
+            "depart": "NRW",
+            "arrive": "LST",
+            "departure_date": datetime.datetime(2021, 2, 1, 8, 0),
+            "returning": False,
+            "no_adults": 1,
+            "no_children": 0
+        }
+        base_url = "http://127.0.0.1:{}".format(self.server.server_port)
+        session = create_session(pool_size=1)
+        for _ in range(2):
+            url, ticket_data = scraper.scrape(journey_data, base_url, session)
+            self.assertEqual(ticket_data[:3], ["£12.50", "Norwich",
+                                               "London Liverpool Street"])
+        self.assertEqual(url, base_url + "/NRW/LST/010221/0800/dep")
+        self.assertEqual(len(FixtureHandler.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from Chat_bot.jobs import RESULT_TTL, JobQueue, JobResults
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sessions.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_result_is_collected_by_another_worker(self):
+        release = threading.Event()
+        submitter = JobQueue(1, JobResults(self.path))
+        job_id = submitter.submit(lambda: release.wait(5) and ["£12.30"])
+
+        collector = JobQueue(1, JobResults(self.path))
+        future = collector.get(job_id)
+        self.assertFalse(future.done())
+        release.set()
+        self.assertEqual(future.result(5), ["£12.30"])
+
+        collector.discard(job_id)
+        self.assertIsNone(collector.get(job_id))
+
+    def test_failure_is_collected_by_another_worker(self):
+        def fail():
+            raise ValueError("No fares")
+
+        submitter = JobQueue(1, JobResults(self.path))
+        job_id = submitter.submit(fail)
+        submitter.get(job_id).exception(5)
+
+        future = JobQueue(1, JobResults(self.path)).get(job_id)
+        with self.assertRaisesRegex(ValueError, "No fares"):
+            future.result(5)
+
+    def test_uncollected_jobs_are_forgotten(self):
+        submitter = JobQueue(1, JobResults(self.path))
+        job_id = submitter.submit(lambda: ["£12.30"])
+        collector = JobQueue(1, JobResults(self.path))
+        local_id = collector.submit(lambda: ["£4.10"])
+        self.assertEqual(collector.get(job_id).result(5), ["£12.30"])
+        collector.get(local_id).result(5)
+
+        # The sessions moved on to another worker without collecting them
+        later = time.time() + RESULT_TTL + 1
+        with mock.patch("Chat_bot.jobs.time.time", return_value=later):
+            collector.submit(lambda: None)
+        self.assertNotIn(job_id, collector._remote)
+        self.assertNotIn(local_id, collector._jobs)
+        self.assertEqual(len(collector._submitted), 1)
+
+    def test_unknown_job(self):
+        self.assertIsNone(JobQueue(1, JobResults(self.path)).get("missing"))
+        self.assertIsNone(JobQueue(1).get("missing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
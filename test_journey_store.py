@@ -0,0 +1,117 @@
+import csv
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from Chat_bot.delay_features import rows_to_columns
+from Chat_bot.journey_store import JourneyStore
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "NRCH_LIVST_OD_a51_2019_2_2.csv")
+
+HARVEST_QUERY = """
+    SELECT rid_FROM, tpl_FROM, ptd, dep_at, tpl_TO, pta, arr_at FROM
+        (SELECT rid AS rid_FROM, tpl AS tpl_FROM, ptd, dep_at
+         FROM main.Data WHERE tpl = ?) AS x JOIN
+        (SELECT rid AS rid_TO, tpl AS tpl_TO, pta, arr_at FROM main.Data
+         WHERE tpl = ?) AS y on x.rid_FROM = y.rid_TO
+        ORDER BY rid_FROM """
+
+COLUMNS = ("rid", "tpl", "pta", "ptd", "arr_at", "dep_at")
+
+# A journey calling at NRCH twice, e.g. a circular service
+LOOP = [
+    {"rid": "201902287000001", "tpl": "NRCH", "ptd": "10:00",
+     "dep_at": "10:01"},
+    {"rid": "201902287000001", "tpl": "DISS", "pta": "10:20",
+     "arr_at": "10:22", "ptd": "10:21", "dep_at": "10:23"},
+    {"rid": "201902287000001", "tpl": "NRCH", "pta": "10:45",
+     "arr_at": "10:44", "ptd": "10:50", "dep_at": "10:52"},
+    {"rid": "201902287000001", "tpl": "LIVST", "pta": "12:40",
+     "arr_at": "12:41"},
+]
+
+
+class TestJourneyStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        loop_path = os.path.join(cls.directory.name, "loop.csv")
+        with open(CSV_PATH, newline="") as csv_file:
+            fields = csv.DictReader(csv_file).fieldnames
+        with open(loop_path, "w", newline="") as loop_file:
+            writer = csv.DictWriter(loop_file, fields, restval="")
+            writer.writeheader()
+            writer.writerows(LOOP)
+        cls.store = JourneyStore.from_csv([CSV_PATH, loop_path])
+
+        cls.conn = sqlite3.connect(":memory:")
+        cls.conn.execute("CREATE TABLE Data ({})".format(
+            ", ".join(column + " TEXT" for column in COLUMNS)))
+        for path in (CSV_PATH, loop_path):
+            with open(path, newline="") as csv_file:
+                cls.conn.executemany(
+                    "INSERT INTO Data VALUES (?, ?, ?, ?, ?, ?)",
+                    [tuple(row[column] for column in COLUMNS)
+                     for row in csv.DictReader(csv_file)])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.conn.close()
+        cls.directory.cleanup()
+
+    def harvest(self, departure_station, arrival_station):
+        return self.conn.execute(HARVEST_QUERY, (departure_station,
+                                                 arrival_station)).fetchall()
+
+    def test_pair_matches_harvest_data(self):
+        for departure_station, arrival_station in [("NRCH", "LIVST"),
+                                                   ("DISS", "IPSWICH"),
+                                                   ("LIVST", "NRCH"),
+                                                   ("NRCH", "NOWHERE")]:
+            with self.subTest(departure_station=departure_station,
+                              arrival_station=arrival_station):
+                expected = rows_to_columns(self.harvest(departure_station,
+                                                        arrival_station))
+                pair = self.store.get_pair(departure_station, arrival_station)
+                for column, values in expected.items():
+                    self.assertEqual(pair[column].tolist(), values.tolist())
+        self.assertGreater(len(self.store.get_pair("NRCH", "LIVST")["rid"]),
+                           700)
+
+    def test_repeated_calls_give_every_combination(self):
+        # Two calls at NRCH and one at DISS
+        for departure_station, arrival_station, count in [
+                ("NRCH", "DISS", 2), ("DISS", "NRCH", 2), ("NRCH", "NRCH", 4)]:
+            rows = [row for row in self.store.get_pair_rows(
+                departure_station, arrival_station)
+                if row[0] == int(LOOP[0]["rid"])]
+            expected = [(int(row[0]),) + row[1:] for row in self.harvest(
+                departure_station, arrival_station)
+                if row[0] == LOOP[0]["rid"]]
+            self.assertEqual(len(rows), count)
+            self.assertEqual(sorted(rows), sorted(expected))
+
+    def test_rid_rows(self):
+        rows = self.store.get_rid_rows(int(LOOP[0]["rid"]))
+        tpls = [self.store.tpl_names[code]
+                for code in self.store.columns["tpl"][rows]]
+        self.assertEqual(tpls, [row["tpl"] for row in LOOP])
+        self.assertEqual(self.store.get_rid_rows(1), slice(0, 0))
+
+    def test_save_and_load_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.store.save(directory)
+            loaded = JourneyStore.load(directory)
+            self.assertIsInstance(loaded.columns["rid"], np.memmap)
+            self.assertEqual(len(loaded), len(self.store))
+            self.assertEqual(loaded.get_pair_rows("NRCH", "LIVST"),
+                             self.store.get_pair_rows("NRCH", "LIVST"))
+            del loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import pickle
+import unittest
+from datetime import datetime
+
+from Chat_bot.knowledge import Knowledge
+
+
+class TestKnowledge(unittest.TestCase):
+    def test_behaves_like_a_dict(self):
+        knowledge = Knowledge({"action": "book"})
+        knowledge["departure_date"] = datetime(2021, 2, 1, 8, 0)
+        knowledge["extra"] = 1
+        self.assertEqual(knowledge, {"action": "book", "extra": 1,
+                                     "departure_date": datetime(2021, 2, 1,
+                                                                8, 0)})
+        self.assertNotIn("depart", knowledge)
+        self.assertIsNone(knowledge.get("depart"))
+        with self.assertRaises(KeyError):
+            knowledge["depart"]
+
+    def test_delete(self):
+        knowledge = Knowledge({"depart": "NRW", "extra": 1})
+        del knowledge["depart"]
+        del knowledge["extra"]
+        self.assertEqual(len(knowledge), 0)
+        with self.assertRaises(KeyError):
+            del knowledge["depart"]
+
+    def test_pickle(self):
+        knowledge = Knowledge({"depart": "NRW", "extra": 1})
+        self.assertEqual(pickle.loads(pickle.dumps(knowledge)), knowledge)
+
+    def test_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            Knowledge().unknown = 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("CHAT_BOT_BROWSER_PREWARM", "false")
+os.environ.setdefault("CHAT_BOT_WARM_UP", "false")
+
+from Chat_bot import main
+
+
+class QueuedChat:
+    """A chat with bot messages queued behind a fare lookup"""
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def pop_message(self, timeout=None):
+        return self.messages.pop(0)
+
+
+def read_events(response):
+    body = response.get_data(as_text=True)
+    return [event for event in body.split("\n\n") if event]
+
+
+class TestStream(unittest.TestCase):
+    def setUp(self):
+        self.client = main.app.test_client()
+        self.client.set_cookie("localhost", main.SESSION_COOKIE, "queued")
+
+    def test_stream_until_a_response_is_required(self):
+        chat = QueuedChat([
+            ["Searching for the best fare now.", [], False],
+            ["{WAIT}", [], False],
+            ["The best fare is £12.30", ["Book now"], True],
+            ["Never streamed", [], True]])
+        with mock.patch.object(main.sessions, "get", return_value=chat), \
+                mock.patch.object(main.sessions, "save") as save:
+            response = self.client.get("/chat/stream")
+            events = read_events(response)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(events[1], ": waiting")
+        messages = [json.loads(event[len("data: "):])
+                    for event in events if event.startswith("data: ")]
+        self.assertEqual([message["message"] for message in messages],
+                         ["Searching for the best fare now.",
+                          "The best fare is £12.30"])
+        self.assertEqual(messages[-1], {"message": "The best fare is £12.30",
+                                        "suggestions": ["Book now"],
+                                        "response_req": True})
+        self.assertEqual(save.call_count, 3)
+
+    def test_stream_of_expired_session(self):
+        with mock.patch.object(main.sessions, "get", return_value=None):
+            events = read_events(self.client.get("/chat/stream"))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(json.loads(events[0][len("data: "):]),
+                         {"message": main.EXPIRED_MESSAGE[0],
+                          "suggestions": main.EXPIRED_MESSAGE[1],
+                          "response_req": True})
+
+
+class TestNewChat(unittest.TestCase):
+    def test_reload_deletes_the_old_session(self):
+        client = main.app.test_client()
+        client.set_cookie("localhost", main.SESSION_COOKIE, "old")
+        greeting = ("new", None, ["Hi", [], True])
+        with mock.patch.object(main, "new_chat", return_value=greeting), \
+                mock.patch.object(main.sessions, "delete") as delete:
+            response = client.post("/chat", data={"user_input": "",
+                                                  "is_system": "false"})
+        delete.assert_called_once_with("old")
+        self.assertIn(main.SESSION_COOKIE + "=new",
+                      response.headers["Set-Cookie"])
+
+
+if __name__ == '__main__':
+    unittest.main()
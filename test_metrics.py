@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from Chat_bot.metrics import Registry
+
+WORKER = """
+from Chat_bot.metrics import Registry
+registry = Registry({directory!r})
+requests = registry.histogram("chat_request_seconds", "Request latency",
+                              buckets=(0.1, 1.0))
+errors = registry.counter("chat_errors_total", "Errors")
+registry.gauge("chat_sessions", "Sessions", lambda: 5)
+requests.observe(0.05, kind="message")
+requests.observe(2.0, kind="popmsg")
+errors.inc(stage="turn")
+registry.flush()
+"""
+
+
+def create_registry(directory=None):
+    registry = Registry(directory, flush_seconds=0)
+    requests = registry.histogram("chat_request_seconds", "Request latency",
+                                  buckets=(0.1, 1.0))
+    errors = registry.counter("chat_errors_total", "Errors")
+    return registry, requests, errors
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry, requests, errors = create_registry()
+        registry.gauge("chat_sessions", "Sessions", lambda: 3)
+        requests.observe(0.05, kind="message")
+        requests.observe(0.5, kind="message")
+        with requests.time(kind="new_chat"):
+            pass
+        errors.inc(stage="scrape")
+        errors.inc(2, stage="scrape")
+
+        lines = registry.render().splitlines()
+        for line in [
+                "# TYPE chat_request_seconds histogram",
+                'chat_request_seconds_bucket{kind="message",le="0.1"} 1',
+                'chat_request_seconds_bucket{kind="message",le="1.0"} 2',
+                'chat_request_seconds_bucket{kind="message",le="+Inf"} 2',
+                'chat_request_seconds_sum{kind="message"} 0.55',
+                'chat_request_seconds_count{kind="message"} 2',
+                'chat_request_seconds_count{kind="new_chat"} 1',
+                "# TYPE chat_errors_total counter",
+                'chat_errors_total{stage="scrape"} 3',
+                "# TYPE chat_sessions gauge",
+                "chat_sessions 3"]:
+            self.assertIn(line, lines)
+
+    def test_timed(self):
+        registry, requests, _ = create_registry()
+        timed = requests.timed(lambda value: value * 2, kind="message")
+        self.assertEqual(timed(21), 42)
+        self.assertIn('chat_request_seconds_count{kind="message"} 1',
+                      registry.render().splitlines())
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c",
+                                WORKER.format(directory=directory)],
+                               env=env, check=True)
+            registry, requests, errors = create_registry(directory)
+            registry.gauge("chat_sessions", "Sessions", lambda: 1)
+            requests.observe(0.5, kind="message")
+
+            lines = registry.render().splitlines()
+            self.assertEqual(len(os.listdir(directory)), 3)
+        for line in [
+                'chat_request_seconds_bucket{kind="message",le="0.1"} 2',
+                'chat_request_seconds_bucket{kind="message",le="1.0"} 3',
+                'chat_request_seconds_count{kind="message"} 3',
+                'chat_request_seconds_bucket{kind="popmsg",le="1.0"} 0',
+                'chat_request_seconds_count{kind="popmsg"} 2',
+                'chat_errors_total{stage="turn"} 2',
+                # The workers have exited, only live processes' gauges count
+                "chat_sessions 1"]:
+            self.assertIn(line, lines)
+
+    def test_changes_are_flushed_without_more_traffic(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory, flush_seconds=0.05)
+            errors = registry.counter("chat_errors_total", "Errors")
+            errors.inc(stage="turn")
+            errors.inc(stage="turn")
+            time.sleep(0.5)
+
+            # As read by the other workers
+            file_name, = os.listdir(directory)
+            with open(os.path.join(directory, file_name)) as metrics_file:
+                snapshot = json.load(metrics_file)
+            self.assertEqual(snapshot["metrics"]["chat_errors_total"],
+                             [[[["stage", "turn"]], 2]])
+
+    def test_changes_are_not_written_by_the_request(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory, flush_seconds=60)
+            errors = registry.counter("chat_errors_total", "Errors")
+            errors.inc(stage="turn")
+            self.assertEqual(os.listdir(directory), [])
+
+            registry.flush()
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_reused_pid_keeps_the_exited_process_counters(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Left by an exited process whose PID this process reuses
+            with open(os.path.join(directory, "{}-0.json".format(
+                    os.getpid())), "w") as metrics_file:
+                json.dump({"metrics": {"chat_errors_total": [
+                    [[["stage", "turn"]], 4]]},
+                           "gauges": {"chat_sessions": 7}}, metrics_file)
+            registry, _, errors = create_registry(directory)
+            registry.gauge("chat_sessions", "Sessions", lambda: 1)
+            errors.inc(stage="turn")
+
+            lines = registry.render().splitlines()
+            self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertIn('chat_errors_total{stage="turn"} 5', lines)
+        self.assertIn("chat_sessions 1", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
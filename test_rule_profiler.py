@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import unittest
+
+from experta import AS, Fact, KnowledgeEngine, Rule
+
+from Chat_bot.rule_profiler import RuleProfiler, profiled_run
+
+
+class Countdown(KnowledgeEngine):
+    """Fires rules of different salience, declaring and retracting facts"""
+    def __init__(self):
+        super().__init__()
+        self.fired = []
+
+    @Rule(AS.count << Fact(count=5), salience=10)
+    def start(self, count):
+        self.fired.append("start")
+        self.modify(count, count=4)
+
+    @Rule(AS.count << Fact(count=4))
+    def tick(self, count):
+        self.fired.append("tick")
+        self.declare(Fact(ticked=True))
+        self.modify(count, count=3)
+
+    @Rule(Fact(ticked=True), salience=5)
+    def ticked(self):
+        self.fired.append("ticked")
+
+    @Rule(Fact(count=3), salience=-1)
+    def stop(self):
+        self.fired.append("stop")
+        self.halt()
+
+    @Rule(Fact(count=3), salience=-2)
+    def after_halt(self):
+        self.fired.append("after_halt")
+
+
+def run_countdown(run):
+    engine = Countdown()
+    engine.reset()
+    engine.declare(Fact(count=5))
+    run(engine)
+    return engine.fired
+
+
+def profile_turn(profiler, fires):
+    profiler.begin_turn()
+    profiler.record_activations(len(fires))
+    for rule, wall_seconds in fires:
+        profiler.record_fire(rule, 99, wall_seconds, wall_seconds / 2,
+                             len(fires))
+    return profiler.end_turn()
+
+
+class TestRuleProfiler(unittest.TestCase):
+    def test_turn_record(self):
+        profiler = RuleProfiler()
+        turn = profile_turn(profiler, [("booking_not_complete", 0.002),
+                                       ("ask_for_departure", 0.001)])
+        self.assertIs(profiler.last_turn(), turn)
+        self.assertEqual(turn["turn"], 1)
+        self.assertEqual(turn["activations"], 2)
+        self.assertEqual([fire["rule"] for fire in turn["fires"]],
+                         ["booking_not_complete", "ask_for_departure"])
+        self.assertEqual([fire["order"] for fire in turn["fires"]], [1, 2])
+        self.assertAlmostEqual(turn["wall_ms"], 3.0)
+        self.assertAlmostEqual(turn["cpu_ms"], 1.5)
+
+    def test_rule_stats(self):
+        profiler = RuleProfiler()
+        profile_turn(profiler, [("direct_to_correct_action", 0.001),
+                                ("booking_not_complete", 0.002)])
+        profile_turn(profiler, [("booking_not_complete", 0.004),
+                                ("generate_ticket", 0.003)])
+        stats = profiler.rule_stats()
+        self.assertEqual(list(stats), ["booking_not_complete",
+                                       "generate_ticket",
+                                       "direct_to_correct_action"])
+        self.assertEqual(stats["booking_not_complete"]["fires"], 2)
+        self.assertAlmostEqual(stats["booking_not_complete"]["wall_ms"], 6.0)
+        self.assertEqual(json.loads(profiler.to_json())["rules"], stats)
+
+    def test_max_turns(self):
+        profiler = RuleProfiler(max_turns=2)
+        for _ in range(3):
+            profile_turn(profiler, [("predict_delay", 0.001)])
+        self.assertEqual([turn["turn"] for turn in profiler.turns], [2, 3])
+
+    def test_dump_per_turn(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rules.jsonl")
+            profiler = RuleProfiler(path)
+            turns = [profile_turn(profiler, [("delay_not_complete", 0.001)]),
+                     profile_turn(profiler, [("predict_delay", 0.002)])]
+            with open(path) as dump:
+                self.assertEqual([json.loads(line) for line in dump], turns)
+
+    def test_profiled_run_fires_like_run(self):
+        profiler = RuleProfiler()
+        fired = run_countdown(lambda engine: profiled_run(engine, profiler,
+                                                          session="abc"))
+        self.assertEqual(fired, run_countdown(KnowledgeEngine.run))
+        turn = profiler.last_turn()
+        self.assertEqual([fire["rule"] for fire in turn["fires"]], fired)
+        self.assertEqual(turn["session"], "abc")
+        self.assertIn("time", turn)
+
+    def test_profiled_run_steps(self):
+        fired = run_countdown(lambda engine: profiled_run(
+            engine, RuleProfiler(), steps=2))
+        self.assertEqual(fired, run_countdown(
+            lambda engine: engine.run(steps=2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from Chat_bot.sessions import (MemoryBackend, SessionStore, SQLiteBackend,
+                               deep_sizeof)
+
+
+class TestSessionStore(unittest.TestCase):
+    def test_sessions_are_kept_apart(self):
+        store = SessionStore()
+        store.save("a", {"depart": "NRW"})
+        store.save("b", {"depart": "ZLS"})
+        self.assertEqual(store.get("a"), {"depart": "NRW"})
+        self.assertEqual(store.get("b"), {"depart": "ZLS"})
+
+    def test_least_recently_used_session_is_evicted(self):
+        store = SessionStore(MemoryBackend(), max_sessions=2)
+        store.save("a", 1)
+        store.save("b", 2)
+        store.get("a")
+        store.save("c", 3)
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.get("a"), 1)
+        self.assertEqual(len(store), 2)
+
+    def test_idle_session_expires(self):
+        store = SessionStore(ttl=60)
+        store.backend.set("a", 1, time.time() - 120)
+        self.assertIsNone(store.get("a"))
+
+    def test_sqlite_backend_shares_sessions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.db")
+            SessionStore(SQLiteBackend(path)).save("a", {"action": "book"})
+            store = SessionStore(SQLiteBackend(path))
+            self.assertEqual(store.get("a"), {"action": "book"})
+
+
+class LockProbe:
+    """Records whether the store lock is held when it's unpickled"""
+    store = None
+    locked = []
+
+    def __init__(self):
+        self.chat_log = ["hello"]
+
+    def __setstate__(self, state):
+        LockProbe.locked.append(LockProbe.store._lock.locked())
+
+
+class TestSizeof(unittest.TestCase):
+    def test_sqlite_sessions_are_loaded_outside_the_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SessionStore(SQLiteBackend(
+                os.path.join(directory, "sessions.db")))
+            store.save("a", LockProbe())
+            store.save("b", LockProbe())
+            LockProbe.store, LockProbe.locked = store, []
+            with mock.patch("Chat_bot.sessions.sizeof_report",
+                            return_value={"total_bytes": 10,
+                                          "pickled_bytes": 5}):
+                report = store.sizeof_report()
+        self.assertEqual(LockProbe.locked, [False, False])
+        self.assertEqual(report["sessions"], 2)
+        self.assertEqual(report["max_total_bytes"], 10)
+
+    def test_shared_objects_are_not_counted(self):
+        shared = list(range(1000))
+        session = {"log": ["hello"], "pipeline": shared}
+        self.assertLess(deep_sizeof(session, [shared]),
+                        deep_sizeof(session) - deep_sizeof(shared) / 2)
+
+    def test_objects_are_counted_once(self):
+        log = ["hello"] * 10
+        self.assertEqual(deep_sizeof([log, log]),
+                         sys.getsizeof([log, log]) + deep_sizeof(log))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import csv
+import os
+import unittest
+
+from Chat_bot import StationNoMatchError
+from Chat_bot.stations import StationIndex, get_similarity
+
+FIXTURES = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                        "fixtures")
+
+
+def read_stations():
+    with open(os.path.join(FIXTURES, "stations.csv"), newline="") as stations:
+        return [(row["code"], row["name"]) for row in csv.DictReader(stations)]
+
+
+def full_table_ranking(stations, search_station):
+    """The ranking of the previous lookup: every station scored"""
+    return sorted(stations, key=lambda station: -get_similarity(
+        station, search_station))[0:3]
+
+
+def alternatives(index, search_station):
+    try:
+        index.find(search_station)
+    except StationNoMatchError as e:
+        return e.alternatives
+    raise AssertionError("{} matched a station".format(search_station))
+
+
+class TestStationIndex(unittest.TestCase):
+    def test_exact_matches(self):
+        index = StationIndex(read_stations())
+        self.assertEqual(index.find("nrw"), ("NRW", "Norwich"))
+        self.assertEqual(index.find("London Bridge"), ("LBG", "London Bridge"))
+
+    def test_short_input_contained_mid_word(self):
+        stations = [("ACT", "Acton"), ("AON", "Alton"), ("AFK", "Ashford"),
+                    ("SCT", "Scrabster"), ("BTH", "Bath")]
+        self.assertEqual(alternatives(StationIndex(stations), "ab"),
+                         full_table_ranking(stations, "ab"))
+
+    def test_ranking_matches_full_table(self):
+        stations = read_stations()
+        index = StationIndex(stations)
+        for search_station in ["a", "ch", "st", "nor", "norwhich", "london",
+                               "londn liverpool", "Liverpool St", "ipswitch",
+                               "kings x", "bridge", "colchster", "Stratf",
+                               "manning", "euston station", "xyz"]:
+            with self.subTest(search_station=search_station):
+                self.assertEqual(alternatives(index, search_station),
+                                 full_table_ranking(stations, search_station))
+
+
+if __name__ == '__main__':
+    unittest.main()